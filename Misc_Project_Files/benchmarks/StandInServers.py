@@ -0,0 +1,199 @@
+"""
+StandInServers.py
+
+Local stand-in web servers for benchmarking the checker without touching a real network.
+The servers run in a child process, so the CPU and memory they use are not counted against the checker.
+"""
+import multiprocessing
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class StandInBehaviour(NamedTuple):
+    """
+    How the stand-in servers answer.
+
+    Fields:
+    - latency: Seconds each request waits before it is answered.
+    - error_rate: Fraction (0 to 1) of requests answered with a 500 error.
+    - hang_rate: Fraction (0 to 1) of requests that are never answered, the connection is held for hang_seconds.
+    - hang_seconds: Seconds a hung request holds its connection before it is closed.
+    - body_size: Size in bytes of the page served, which always starts with an html title.
+    - seed: Seed for picking which requests fail or hang, for repeatable runs.
+    """
+    latency: float = 0.005
+    error_rate: float = 0.0
+    hang_rate: float = 0.0
+    hang_seconds: float = 10.0
+    body_size: int = 1024
+    seed: int = 0
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answers every GET after the server's latency, with a 500 error or no answer at all at the configured rates.
+    """
+    protocol_version = 'HTTP/1.1'
+    # the headers and body are written separately, with Nagle on the body would wait for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        outcome = server.pick_outcome()
+        if server.behaviour.latency:
+            sleep(server.behaviour.latency)
+        if outcome == 'hang':
+            sleep(server.behaviour.hang_seconds)
+            self.close_connection = True
+            return
+        self.send_response(500 if outcome == 'error' else 200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(server.page)))
+        self.end_headers()
+        self.wfile.write(server.page)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Class StandInServer:
+    One stand-in web server, counting the connections accepted and the requests answered by outcome.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str, behaviour: StandInBehaviour, seed: int):
+        super().__init__((host, 0), _StandInHandler)
+        self.behaviour = behaviour
+        padding = max(behaviour.body_size - 64, 0)
+        self.page = (f'<html><head><title>Stand-in {self.server_address[1]}</title></head><body>'.encode()
+                     + b'x' * padding + b'</body></html>')
+        self._random = Random(seed)
+        self._lock = Lock()
+        self.stats = dict.fromkeys(('connections', 'requests', 'errors', 'hangs'), 0)
+
+    def pick_outcome(self) -> str:
+        with self._lock:
+            self.stats['requests'] += 1
+            roll = self._random.random()
+            if roll < self.behaviour.hang_rate:
+                self.stats['hangs'] += 1
+                return 'hang'
+            if roll < self.behaviour.hang_rate + self.behaviour.error_rate:
+                self.stats['errors'] += 1
+                return 'error'
+            return 'ok'
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.stats['connections'] += 1
+        super().process_request(request, client_address)
+
+    def handle_error(self, request, client_address):
+        # clients hang up on hung requests once they time out, that is expected here.
+        pass
+
+    def take_stats(self) -> Dict[str, int]:
+        """
+        Returns the counters and resets them.
+        """
+        with self._lock:
+            stats, self.stats = self.stats, dict.fromkeys(self.stats, 0)
+        return stats
+
+
+def loopback_hosts(count: int) -> List[str]:
+    """
+    Returns count loopback addresses to bind servers to. Linux routes all of 127.0.0.0/8 to the loopback
+    interface, so every server gets its own address and looks like a separate host to the checker;
+    other platforms only have 127.0.0.1, so the servers share it and only differ by port.
+    """
+    if sys.platform.startswith('linux'):
+        return [f'127.0.{index // 250}.{index % 250 + 1}' for index in range(count)]
+    return ['127.0.0.1'] * count
+
+
+def _serve(connection, count: int, behaviour: StandInBehaviour) -> None:
+    """
+    Child process: starts count servers, sends their (host, port) addresses back over connection, then answers
+    'stats' requests with the summed counters until it is sent 'stop'.
+    """
+    servers = [StandInServer(host, behaviour, behaviour.seed + index)
+               for index, host in enumerate(loopback_hosts(count))]
+    for server in servers:
+        Thread(target=server.serve_forever, daemon=True).start()
+    connection.send([server.server_address[:2] for server in servers])
+    while True:
+        command = connection.recv()
+        if command == 'stats':
+            totals = {}
+            for server in servers:
+                for name, value in server.take_stats().items():
+                    totals[name] = totals.get(name, 0) + value
+            connection.send(totals)
+        elif command == 'stop':
+            # each serve_forever takes up to its poll interval to notice, so they are all stopped at once.
+            stoppers = [Thread(target=server.shutdown) for server in servers]
+            for stopper in stoppers:
+                stopper.start()
+            for stopper in stoppers:
+                stopper.join()
+            for server in servers:
+                server.server_close()
+            connection.send('stopped')
+            return
+
+
+class StandInServerPool:
+    """
+    Class StandInServerPool:
+    Runs count StandInServers in a child process, as a context manager.
+
+    Parameters:
+    - count (int): Number of servers.
+    - behaviour (StandInBehaviour): How the servers answer.
+
+    Properties:
+    - addresses: The (host, port) of every server, once started.
+
+    Methods:
+    - start / stop: Start or stop the child process.
+    - take_stats: The connections accepted and requests answered (by outcome) since the last call.
+    """
+    def __init__(self, count: int, behaviour: StandInBehaviour = None):
+        self.count = count
+        self.behaviour = behaviour or StandInBehaviour()
+        self.addresses: List[Tuple[str, int]] = []
+        self._connection = None
+        self._process = None
+
+    def start(self) -> 'StandInServerPool':
+        self._connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child_connection, self.count, self.behaviour),
+                                                name='stand-in-servers', daemon=True)
+        self._process.start()
+        self.addresses = [tuple(address) for address in self._connection.recv()]
+        return self
+
+    def take_stats(self) -> Dict[str, int]:
+        self._connection.send('stats')
+        return self._connection.recv()
+
+    def stop(self) -> None:
+        if self._process is None:
+            return
+        self._connection.send('stop')
+        self._connection.recv()
+        self._process.join(5)
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
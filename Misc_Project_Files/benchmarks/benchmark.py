@@ -0,0 +1,240 @@
+"""
+benchmark.py
+
+Benchmarks the checker against local stand-in web servers (see StandInServers.py) and saves the results as JSON,
+so regressions in the probe paths show up as a change in the numbers.
+
+Two paths are measured for each number of targets:
+- 'fleet': FleetMonitor.run_cycle, every target and port checked concurrently in one cycle.
+- 'sequential': WebServerStatusCheck.take_snapshot for one target after the other, as MainLoop does.
+
+For every cycle the wall time, probes per second, CPU time and RSS of this process,
+and the sockets opened to the stand-in servers are recorded.
+
+Usage (from the repository root):
+    python Misc_Project_Files/benchmarks/benchmark.py --targets 1 100 1000 --cycles 3
+    python Misc_Project_Files/benchmarks/benchmark.py --latency 0.05 --error-rate 0.1 --hang-rate 0.01
+    python Misc_Project_Files/benchmarks/benchmark.py --baseline previous.json --tolerance 0.25
+
+With --baseline the mean cycle wall time of every run is compared with the same run in a previous results file,
+and the exit code is 1 if any of them got slower by more than the tolerance.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+from collections import Counter
+from pathlib import Path
+from time import perf_counter, process_time
+from typing import Dict, List
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from WebServerStatusCheckerAJM import FleetMonitor, WebServerStatusCheck, _version
+from WebServerStatusCheckerAJM.HTTPSessionPool import HTTPSessionPool
+from StandInServers import StandInBehaviour, StandInServerPool
+
+DEFAULT_OUTPUT_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def current_rss_kb() -> float or None:
+    """
+    Resident set size of this process in KiB, None where it can not be read.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_kb() -> float or None:
+    """
+    Peak resident set size of this process in KiB, None where it can not be read.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere.
+    return peak / 1024 if sys.platform == 'darwin' else peak
+
+
+def checker_kwargs(args) -> dict:
+    """
+    The keyword arguments every checker is built with.
+    """
+    return {'use_colorizer': False, 'use_msg_box_on_error': False, 'cycle_deadline': args.cycle_deadline,
+            'http_connect_timeout': args.http_timeout, 'http_read_timeout': args.http_timeout}
+
+
+def build_targets(pool: StandInServerPool, count: int) -> List[dict]:
+    """
+    count fleet targets, spread round robin over the stand-in servers.
+    """
+    targets = []
+    for index in range(count):
+        host, port = pool.addresses[index % len(pool.addresses)]
+        targets.append({'name': f'target{index}', 'server_web_address': f'http://{host}', 'server_ports': [port]})
+    return targets
+
+
+def measure_cycle(pool: StandInServerPool, run) -> dict:
+    """
+    Runs one cycle with run(), which returns the snapshots it took, and returns its measurements.
+    """
+    cpu_start, wall_start = process_time(), perf_counter()
+    snapshots = run()
+    wall, cpu = perf_counter() - wall_start, process_time() - cpu_start
+    server_stats = pool.take_stats()
+    return {'wall_seconds': wall, 'cpu_seconds': cpu, 'probes': len(snapshots),
+            'probes_per_second': len(snapshots) / wall if wall else None,
+            'rss_kb': current_rss_kb(), 'sockets_opened': server_stats['connections'],
+            'requests_served': server_stats['requests'],
+            'server_states': dict(Counter(snapshot.server_status.value for snapshot in snapshots))}
+
+
+def run_fleet(pool: StandInServerPool, count: int, args) -> List[dict]:
+    fleet = FleetMonitor(build_targets(pool, count), silent_run=True, local_machine_ping_host='127.0.0.1',
+                         max_concurrency=args.max_concurrency, **checker_kwargs(args))
+    try:
+        return [measure_cycle(pool, lambda: [snapshot for snapshots in fleet.check_once().values()
+                                             for snapshot in snapshots.values()])
+                for _ in range(args.cycles)]
+    finally:
+        fleet.shutdown_executor()
+        fleet.alert_dispatcher.close()
+
+
+def run_sequential(pool: StandInServerPool, count: int, args) -> List[dict]:
+    checkers = []
+    for target in build_targets(pool, count):
+        checker = WebServerStatusCheck(target['server_web_address'], silent_run=True, init_msg=False,
+                                       server_ports=target['server_ports'], target_name=target['name'],
+                                       **checker_kwargs(args))
+        checker.local_machine_ping_host = '127.0.0.1'
+        checkers.append(checker)
+    try:
+        return [measure_cycle(pool, lambda: [checker.take_snapshot() for checker in checkers])
+                for _ in range(args.cycles)]
+    finally:
+        for checker in checkers:
+            checker.alert_dispatcher.close()
+
+
+RUNNERS = {'fleet': run_fleet, 'sequential': run_sequential}
+
+
+def summarize(cycles: List[dict]) -> dict:
+    """
+    Summary of a run's cycles. The first cycle opens every connection, so the steady state figures leave it out
+    when there is more than one cycle.
+    """
+    steady = cycles[1:] or cycles
+    walls = [cycle['wall_seconds'] for cycle in steady]
+    rates = [cycle['probes_per_second'] for cycle in steady if cycle['probes_per_second']]
+    return {'first_cycle_wall_seconds': cycles[0]['wall_seconds'],
+            'mean_wall_seconds': sum(walls) / len(walls), 'min_wall_seconds': min(walls),
+            'max_wall_seconds': max(walls), 'mean_probes_per_second': sum(rates) / len(rates) if rates else None,
+            'cpu_seconds': sum(cycle['cpu_seconds'] for cycle in cycles),
+            'sockets_opened': sum(cycle['sockets_opened'] for cycle in cycles),
+            'steady_sockets_opened_per_cycle': sum(cycle['sockets_opened'] for cycle in steady) / len(steady)}
+
+
+def run_benchmarks(args) -> dict:
+    """
+    Runs every mode for every number of targets and returns the results document.
+    """
+    behaviour = StandInBehaviour(latency=args.latency, error_rate=args.error_rate, hang_rate=args.hang_rate,
+                                 hang_seconds=args.hang_seconds, body_size=args.body_size, seed=args.seed)
+    results = {'started': datetime.datetime.now().isoformat(timespec='seconds'),
+               'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                               'package_version': _version.__version__, 'cpu_count': os.cpu_count()},
+               'config': vars(args), 'runs': []}
+    with StandInServerPool(min(args.servers, max(args.targets)), behaviour) as pool:
+        for mode in args.modes:
+            for count in args.targets:
+                if mode == 'sequential' and count > args.max_sequential_targets:
+                    continue
+                print(f"benchmarking {mode} with {count} target(s)...", flush=True)
+                # every run starts without open connections, so its first cycle shows the cost of opening them.
+                HTTPSessionPool.close_all()
+                pool.take_stats()
+                cycles = RUNNERS[mode](pool, count, args)
+                run = {'mode': mode, 'targets': count, 'cycles': cycles, 'summary': summarize(cycles)}
+                results['runs'].append(run)
+                print(f"    mean cycle {run['summary']['mean_wall_seconds']:.3f}s, "
+                      f"{run['summary']['mean_probes_per_second'] or 0:.0f} probes/s", flush=True)
+    results['peak_rss_kb'] = peak_rss_kb()
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Returns a description of every run whose mean cycle wall time is more than tolerance slower than
+    the same (mode, targets) run in baseline.
+    """
+    baseline_runs = {(run['mode'], run['targets']): run['summary'] for run in baseline.get('runs', [])}
+    regressions = []
+    for run in results['runs']:
+        previous = baseline_runs.get((run['mode'], run['targets']))
+        if previous is None:
+            continue
+        before, after = previous['mean_wall_seconds'], run['summary']['mean_wall_seconds']
+        if after > before * (1 + tolerance):
+            regressions.append(f"{run['mode']} with {run['targets']} target(s): mean cycle {after:.3f}s,"
+                               f" was {before:.3f}s (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the checker against local stand-in web servers.")
+    parser.add_argument('--targets', type=int, nargs='+', default=[1, 100, 1000],
+                        help="numbers of targets to benchmark with")
+    parser.add_argument('--modes', nargs='+', choices=sorted(RUNNERS), default=['fleet', 'sequential'])
+    parser.add_argument('--cycles', type=int, default=3, help="cycles run per benchmark")
+    parser.add_argument('--servers', type=int, default=50, help="number of stand-in servers, targets share them")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds each request waits before an answer")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument('--hang-rate', type=float, default=0.0, help="fraction of requests that are never answered")
+    parser.add_argument('--hang-seconds', type=float, default=10.0)
+    parser.add_argument('--body-size', type=int, default=1024, help="size in bytes of the served page")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-concurrency', type=int, default=None, help="FleetMonitor max_concurrency")
+    parser.add_argument('--cycle-deadline', type=float, default=30.0)
+    parser.add_argument('--http-timeout', type=float, default=2.0, help="http connect and read timeout")
+    parser.add_argument('--max-sequential-targets', type=int, default=1000,
+                        help="larger target counts are only benchmarked in fleet mode")
+    parser.add_argument('--output', type=Path, default=None,
+                        help="results file, defaults to results/benchmark-<timestamp>.json next to this script")
+    parser.add_argument('--baseline', type=Path, default=None, help="previous results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="fraction a mean cycle may slow down by before it counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+    output = args.output or DEFAULT_OUTPUT_DIR / f"benchmark-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, default=str))
+    print(f"results saved to {output}")
+
+    if args.baseline is not None:
+        regressions = compare_to_baseline(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,45 @@
+import datetime
 from datetime import timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread, current_thread
+import asyncio
+import json
+import logging
+import socket
+import subprocess
+import sys
 import unittest
-from time import sleep
+from time import sleep, perf_counter, time
+
+import requests
 
 from WebServerStatusCheckerAJM.WebServerStatusCheckerAJM import WebServerStatusCheck, __version__
+from WebServerStatusCheckerAJM.HTTPSessionPool import HTTPSessionPool
+from WebServerStatusCheckerAJM.AsyncWebServerStatusCheck import AsyncWebServerStatusCheck
+from WebServerStatusCheckerAJM.FleetMonitor import FleetMonitor
+from WebServerStatusCheckerAJM.LocalUplinkCache import LocalUplinkCache
+from WebServerStatusCheckerAJM.ProbeState import ProbeState
+from WebServerStatusCheckerAJM.ValidatorCache import ValidatorCache
+from WebServerStatusCheckerAJM.AlertDispatcher import AlertDispatcher
+from WebServerStatusCheckerAJM.AlertSinks import Alert, AlertSink
+from WebServerStatusCheckerAJM.CheckScheduler import CheckScheduler
+from WebServerStatusCheckerAJM.ProbeCycle import ProbeSnapshot
+from WebServerStatusCheckerAJM.StatusHistory import StatusHistory
+from WebServerStatusCheckerAJM.SQLiteHistoryStore import SQLiteHistoryStore
+from WebServerStatusCheckerAJM.UptimeAnalytics import OutageIntervals, UptimeAnalytics
+from WebServerStatusCheckerAJM.ProbeMetrics import ProbeMetrics
+from WebServerStatusCheckerAJM.MetricsServer import MetricsServer
+from WebServerStatusCheckerAJM.QuantileSketch import QuantileSketch
+from WebServerStatusCheckerAJM.StatusLogQueue import StatusLogQueue
+from WebServerStatusCheckerAJM.DNSCache import DNSCache
+from WebServerStatusCheckerAJM.ConsistentHashRing import ConsistentHashRing
+from WebServerStatusCheckerAJM.ShardedFleetMonitor import ShardedFleetMonitor
+from WebServerStatusCheckerAJM.PortStateMachine import PortState, PortStateMachine
+from WebServerStatusCheckerAJM.ProbeDependencyGraph import ProbeDependencyGraph
+from WebServerStatusCheckerAJM.Reachability import (ReachabilityProbe, build_echo_request, icmp_checksum,
+                                                    parse_echo_reply)
 
 
 class WSSCTests(unittest.TestCase):
@@ -131,5 +168,1286 @@ class WSSCTests(unittest.TestCase):
         return window_list
 
 
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """ does not print tracebacks for clients that hang up early (e.g. after a timeout). """
+    def handle_error(self, request, client_address):
+        pass
+
+
+class _LocalPageHandler(BaseHTTPRequestHandler):
+    """ serves a small page with a title and counts the requests and connections made to it. """
+    protocol_version = 'HTTP/1.1'
+    request_count = 0
+    client_addresses = set()
+    page = b'<html><head><title>Local Test Page</title></head><body>ok</body></html>'
+
+    def do_GET(self):
+        type(self).request_count += 1
+        type(self).client_addresses.add(self.client_address)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SlowPageHandler(_LocalPageHandler):
+    """ waits before answering, to simulate a slow server. """
+    delay = 0.5
+
+    def do_GET(self):
+        sleep(self.delay)
+        super().do_GET()
+
+
+class _BigPageHandler(_LocalPageHandler):
+    """ serves a large page with its title near the start, and counts requests by method. """
+    page = (b'<html><head><title>Big Page</title></head><body>' + b'x' * (2 * 1024 * 1024)
+            + b'</body></html>')
+    head_count = 0
+
+    def do_HEAD(self):
+        type(self).head_count += 1
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+
+
+class _ETagPageHandler(_LocalPageHandler):
+    """ answers If-None-Match requests for the current etag with an empty 304, and counts them. """
+    etag = '"v1"'
+    not_modified_count = 0
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            type(self).not_modified_count += 1
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        type(self).request_count += 1
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+        self.wfile.write(self.page)
+
+
+class _CountingWSSC(WebServerStatusCheck):
+    """ WebServerStatusCheck that counts pings instead of sending them. """
+    ping_count = 0
+
+    def ping_rtt(self, **kwargs):
+        self.ping_count += 1
+        return 0.001
+
+    @property
+    def local_machine_rtt(self):
+        return 0.001
+
+
+class LocalServerTestCase(unittest.TestCase):
+    """ starts a local http server on a free loopback port for the duration of the test class. """
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = _QuietHTTPServer(('127.0.0.1', 0), _LocalPageHandler)
+        cls.port = cls.server.server_address[1]
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        _LocalPageHandler.request_count = 0
+        _LocalPageHandler.client_addresses = set()
+
+
+class ProbeSnapshotTests(LocalServerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[self.port],
+                                  use_msg_box_on_error=False, silent_run=True, use_colorizer=False)
+
+    def test_snapshot_runs_each_probe_once(self):
+        snapshot = self.WSSC.take_snapshot()
+        self.assertEqual(self.WSSC.ping_count, 1)
+        self.assertEqual(_LocalPageHandler.request_count, 1)
+        self.assertTrue(snapshot.server_status)
+        self.assertTrue(snapshot.page_status)
+        self.assertEqual(snapshot.page_name, 'Local Test Page')
+        self.assertFalse(snapshot.is_down)
+
+    def test_render_log_and_downtime_read_snapshot(self):
+        self.WSSC.take_snapshot()
+        self.assertIn('local machine is: up', self.WSSC.full_status_string.lower())
+        self.WSSC.log_status()
+        self.assertFalse(self.WSSC.is_down)
+        self.assertIsNone(self.WSSC.down_timestamp)
+        self.assertEqual(self.WSSC.length_of_time_down, timedelta(seconds=0))
+        self.assertEqual(self.WSSC.ping_count, 1)
+        self.assertEqual(_LocalPageHandler.request_count, 1)
+
+    def test_snapshot_is_immutable(self):
+        snapshot = self.WSSC.snapshot
+        with self.assertRaises(AttributeError):
+            # noinspection PyPropertyAccess
+            snapshot.server_status = False
+
+
+class HTTPSessionPoolTests(LocalServerTestCase):
+    def test_same_host_shares_session(self):
+        first = _CountingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True)
+        second = _CountingWSSC('http://127.0.0.1/other_page', server_ports=[self.port, 80], silent_run=True)
+        self.assertIs(first.http_session, second.http_session)
+
+    def test_different_host_or_pool_size_gets_own_session(self):
+        self.assertIsNot(HTTPSessionPool.get_session('http://127.0.0.1/'),
+                         HTTPSessionPool.get_session('http://localhost/'))
+        self.assertIsNot(HTTPSessionPool.get_session('http://127.0.0.1/', pool_size=2),
+                         HTTPSessionPool.get_session('http://127.0.0.1/', pool_size=3))
+
+    def test_connection_is_reused_between_checks(self):
+        WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                             use_msg_box_on_error=False)
+        WSSC.take_snapshot()
+        WSSC.take_snapshot()
+        self.assertEqual(_LocalPageHandler.request_count, 2)
+        self.assertEqual(len(_LocalPageHandler.client_addresses), 1)
+
+
+class AsyncWebServerStatusCheckTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.servers = [_QuietHTTPServer(('127.0.0.1', 0), _SlowPageHandler) for _ in range(3)]
+        for server in self.servers:
+            Thread(target=server.serve_forever, daemon=True).start()
+        self.ports = [server.server_address[1] for server in self.servers]
+
+    def tearDown(self) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_cycle_checks_ports_concurrently(self):
+        class _AsyncCounting(AsyncWebServerStatusCheck, _CountingWSSC):
+            pass
+        WSSC = _AsyncCounting('http://127.0.0.1/', server_ports=self.ports, silent_run=True,
+                              use_msg_box_on_error=False)
+        start = perf_counter()
+        snapshots = asyncio.run(WSSC.run_cycle())
+        elapsed = perf_counter() - start
+        self.assertEqual(sorted(snapshots), sorted(self.ports))
+        self.assertTrue(all(snapshot.page_status for snapshot in snapshots.values()))
+        self.assertLess(elapsed, _SlowPageHandler.delay * len(self.ports))
+        self.assertEqual(WSSC.ping_count, 1)
+        self.assertIs(WSSC.snapshots[self.ports[0]], snapshots[self.ports[0]])
+
+
+class _CountingFleet(FleetMonitor):
+    """ FleetMonitor that records pinged hosts instead of sending pings. """
+    def __init__(self, *args, **kwargs):
+        self.pinged = []
+        super().__init__(*args, **kwargs)
+
+    def ping_many(self, hosts):
+        self.pinged.extend(hosts)
+        return {host: 0.001 for host in hosts}
+
+    @property
+    def local_machine_rtt(self):
+        return 0.001
+
+
+class FleetMonitorTests(LocalServerTestCase):
+    def test_shared_pings_and_per_target_results(self):
+        fleet = _CountingFleet([{'name': 'first', 'server_web_address': 'http://127.0.0.1/',
+                                 'server_ports': [self.port]},
+                                {'name': 'second', 'server_web_address': 'http://127.0.0.1/',
+                                 'server_ports': [self.port], 'server_titles': {self.port: 'Second'}},
+                                {'name': 'third', 'server_web_address': 'http://localhost/',
+                                 'server_ports': [self.port]}],
+                               silent_run=True)
+        results = fleet.check_once()
+        self.assertEqual(sorted(fleet.pinged), ['127.0.0.1', 'localhost'])
+        self.assertEqual(_LocalPageHandler.request_count, 3)
+        self.assertEqual(set(results), {'first', 'second', 'third'})
+        self.assertTrue(results['second'][self.port].page_status)
+        self.assertEqual(fleet.down_targets, {})
+        self.assertEqual(fleet.results['third'][self.port], results['third'][self.port])
+
+    def test_bad_target_raises(self):
+        with self.assertRaises(ValueError):
+            FleetMonitor([{'server_ports': [80]}], silent_run=True)
+        with self.assertRaises(TypeError):
+            FleetMonitor([80], silent_run=True)
+
+
+class ReachabilityTests(LocalServerTestCase):
+    def test_echo_request_round_trips(self):
+        packet = build_echo_request(1234, 7)
+        self.assertEqual(icmp_checksum(packet), 0)
+        reply = bytes([0]) + packet[1:]
+        self.assertEqual(parse_echo_reply(reply), (1234, 7))
+        self.assertIsNone(parse_echo_reply(packet))
+
+    def test_tcp_rtt_open_and_refused_ports(self):
+        probe = ReachabilityProbe(timeout=1, method='tcp', tcp_ports=[self.port])
+        self.assertIsNotNone(probe.rtt('127.0.0.1'))
+        closed_probe = ReachabilityProbe(timeout=1, method='tcp', tcp_ports=[1])
+        self.assertTrue(closed_probe.is_reachable('127.0.0.1'))
+        strict_probe = ReachabilityProbe(timeout=1, method='tcp', tcp_ports=[1, self.port], refused_is_up=False)
+        self.assertIsNotNone(strict_probe.tcp_rtt('127.0.0.1'))
+        strict_probe.tcp_ports = (1,)
+        self.assertFalse(strict_probe.is_reachable('127.0.0.1'))
+
+    def test_tcp_sweep_of_many_hosts(self):
+        probe = ReachabilityProbe(timeout=1, method='tcp', tcp_ports=[self.port])
+        start = perf_counter()
+        results = probe.rtt_many(['127.0.0.1', 'localhost', '127.0.0.2', 'unresolvable.invalid'])
+        self.assertLess(perf_counter() - start, probe.timeout)
+        self.assertIsNotNone(results['127.0.0.1'])
+        self.assertIsNotNone(results['localhost'])
+        # nothing listens on 127.0.0.2 but the refused connection still proves the host is up
+        self.assertIsNotNone(results['127.0.0.2'])
+        self.assertIsNone(results['unresolvable.invalid'])
+
+    def test_invalid_method_raises(self):
+        with self.assertRaises(ValueError):
+            ReachabilityProbe(method='subprocess')
+
+    def test_machine_status_without_subprocess(self):
+        WSSC = WebServerStatusCheck('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                                    use_msg_box_on_error=False, ping_method='tcp')
+        WSSC.local_machine_ping_host = '127.0.0.2'
+        snapshot = WSSC.take_snapshot()
+        self.assertTrue(snapshot.machine_status)
+        self.assertIsNotNone(snapshot.machine_rtt)
+
+
+class _FakeReachability:
+    """ answers rtt_many from a fixed dictionary and counts the sweeps. """
+    def __init__(self, answers, delay=0.0):
+        self.answers = answers
+        self.delay = delay
+        self.sweeps = 0
+
+    def rtt_many(self, hosts):
+        self.sweeps += 1
+        sleep(self.delay)
+        return {host: self.answers.get(host) for host in hosts}
+
+
+class LocalUplinkCacheTests(unittest.TestCase):
+    def tearDown(self) -> None:
+        LocalUplinkCache.clear_shared()
+
+    def test_shared_between_checkers(self):
+        first = WebServerStatusCheck('http://127.0.0.1/', silent_run=True, local_uplink_ttl=60)
+        second = WebServerStatusCheck('http://localhost/', silent_run=True, local_uplink_ttl=60)
+        self.assertIs(first.local_uplink, second.local_uplink)
+        second.local_machine_ping_host = '1.1.1.1'
+        self.assertIsNot(first.local_uplink, second.local_uplink)
+
+    def test_quorum(self):
+        fake = _FakeReachability({'a': 0.01, 'b': None, 'c': 0.02})
+        self.assertTrue(LocalUplinkCache(['a', 'b', 'c'], quorum=2, reachability=fake).is_up)
+        self.assertFalse(LocalUplinkCache(['a', 'b', 'c'], quorum=3, reachability=fake).is_up)
+        self.assertEqual(LocalUplinkCache(['a', 'c'], reachability=fake).rtt, 0.01)
+        with self.assertRaises(ValueError):
+            LocalUplinkCache(['a'], quorum=2)
+
+    def test_reads_within_ttl_do_not_probe(self):
+        fake = _FakeReachability({'a': 0.01})
+        cache = LocalUplinkCache(['a'], ttl=60, reachability=fake)
+        for _ in range(10):
+            self.assertTrue(cache.is_up)
+        self.assertEqual(fake.sweeps, 1)
+
+    def test_stale_read_refreshes_in_background(self):
+        fake = _FakeReachability({'a': 0.01}, delay=0.1)
+        cache = LocalUplinkCache(['a'], ttl=0.05, reachability=fake)
+        self.assertTrue(cache.is_up)
+        sleep(0.1)
+        fake.answers['a'] = None
+        # the stale value is returned straight away, while the refresh happens in the background
+        start = perf_counter()
+        self.assertTrue(cache.is_up)
+        self.assertLess(perf_counter() - start, fake.delay)
+        sleep(0.3)
+        self.assertFalse(cache.is_up)
+
+    def test_refresher_runs_until_last_user_stops(self):
+        cache = LocalUplinkCache(['a'], ttl=60, reachability=_FakeReachability({'a': 0.01}))
+        cache.start()
+        first_thread = cache._thread
+        cache.start()
+        cache.stop()
+        self.assertTrue(first_thread.is_alive())
+        cache.stop()
+        cache.start()
+        try:
+            # the first thread was stopped, not revived next to the new one.
+            first_thread.join(1)
+            self.assertFalse(first_thread.is_alive())
+            self.assertTrue(cache._thread.is_alive())
+        finally:
+            cache.stop()
+
+
+class TimeoutTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = _QuietHTTPServer(('127.0.0.1', 0), _SlowPageHandler)
+        self.port = self.server.server_address[1]
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_read_timeout_is_reported_as_timeout(self):
+        WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                             use_msg_box_on_error=False, use_colorizer=False, http_read_timeout=0.1)
+        snapshot = WSSC.take_snapshot()
+        self.assertIs(snapshot.server_status, ProbeState.TIMEOUT)
+        # the page depends on the server, so it is not reported as timed out itself.
+        self.assertIs(snapshot.page_status, ProbeState.UNREACHABLE)
+        self.assertTrue(snapshot.timed_out)
+        self.assertTrue(snapshot.is_down)
+        self.assertIn('is TIMEOUT', WSSC.full_status_string)
+
+    def test_cycle_deadline_abandons_running_probes(self):
+        class _AsyncCounting(AsyncWebServerStatusCheck, _CountingWSSC):
+            pass
+        WSSC = _AsyncCounting('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                              use_msg_box_on_error=False, cycle_deadline=0.1)
+        start = perf_counter()
+        snapshot = asyncio.run(WSSC.run_cycle())[self.port]
+        self.assertLess(perf_counter() - start, _SlowPageHandler.delay)
+        self.assertIs(snapshot.machine_status, ProbeState.UP)
+        self.assertIs(snapshot.server_status, ProbeState.TIMEOUT)
+        # the request is not stopped, it holds its executor thread until the page answers.
+        self.assertEqual(WSSC.abandoned_probes, 1)
+        start = perf_counter()
+        while WSSC.abandoned_probes and perf_counter() - start < 5:
+            sleep(0.05)
+        self.assertEqual(WSSC.abandoned_probes, 0)
+        WSSC.shutdown_executor()
+
+    def test_up_and_down_states(self):
+        self.assertIs(ProbeState.from_rtt(0.01), ProbeState.UP)
+        self.assertIs(ProbeState.from_rtt(None), ProbeState.DOWN)
+        self.assertTrue(ProbeState.UP)
+        self.assertFalse(ProbeState.TIMEOUT)
+
+
+class PageCheckModeTests(unittest.TestCase):
+    def setUp(self) -> None:
+        _BigPageHandler.request_count = 0
+        _BigPageHandler.head_count = 0
+        self.server = _QuietHTTPServer(('127.0.0.1', 0), _BigPageHandler)
+        self.port = self.server.server_address[1]
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _checker(self, mode):
+        return _CountingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                             use_msg_box_on_error=False, page_check_mode=mode)
+
+    def test_stream_mode_reads_title_without_whole_body(self):
+        WSSC = self._checker('stream')
+        http_result = WSSC.timed_server_response(WSSC.server_full_address)
+        self.assertEqual(http_result.title, 'Big Page')
+        self.assertFalse(http_result.response._content_consumed)
+        self.assertLess(http_result.response.raw.tell(), len(_BigPageHandler.page))
+
+    def test_page_name_reads_only_the_title(self):
+        released = []
+
+        class _ReleaseRecordingWSSC(_CountingWSSC):
+            def release_response(self, response):
+                released.append((response._content_consumed, response.raw.tell()))
+                super().release_response(response)
+
+        WSSC = _ReleaseRecordingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                                     use_msg_box_on_error=False)
+        self.assertEqual(WSSC.page_name, 'Big Page')
+        self.assertEqual(WSSC.html_title, 'Big Page')
+        [(consumed, read)] = released
+        self.assertFalse(consumed)
+        self.assertLess(read, len(_BigPageHandler.page))
+
+    def test_head_mode_only_sends_head(self):
+        snapshot = self._checker('head').take_snapshot()
+        self.assertTrue(snapshot.page_status)
+        self.assertEqual(snapshot.page_name, 'Homepage')
+        self.assertEqual(_BigPageHandler.head_count, 1)
+        self.assertEqual(_BigPageHandler.request_count, 0)
+
+    def test_invalid_mode_raises(self):
+        with self.assertRaises(ValueError):
+            self._checker('download')
+
+    def test_title_scan_stops_at_byte_cap(self):
+        chunks = [b'<html><head>', b'<script>' + b'x' * 100, b'<title>Late</title>']
+        self.assertIsNone(WebServerStatusCheck.find_title_in_chunks(iter(chunks), max_bytes=50))
+        self.assertEqual(WebServerStatusCheck.find_title_in_chunks(iter(chunks), max_bytes=1000), 'Late')
+        self.assertEqual(WebServerStatusCheck.find_title_in_chunks(iter([b'<TITLE lang="en">A', b'b</TITLE>']),
+                                                                   max_bytes=1000), 'Ab')
+
+
+class ConditionalRequestTests(unittest.TestCase):
+    def setUp(self) -> None:
+        ValidatorCache.shared().clear()
+        _ETagPageHandler.request_count = 0
+        _ETagPageHandler.not_modified_count = 0
+        _ETagPageHandler.etag = '"v1"'
+        self.server = _QuietHTTPServer(('127.0.0.1', 0), _ETagPageHandler)
+        self.port = self.server.server_address[1]
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _checker(self, **kwargs):
+        return _CountingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                             use_msg_box_on_error=False, **kwargs)
+
+    def test_not_modified_reuses_cached_title_and_digest(self):
+        WSSC = self._checker()
+        first = WSSC.take_snapshot()
+        second = WSSC.take_snapshot()
+        self.assertEqual(_ETagPageHandler.request_count, 1)
+        self.assertEqual(_ETagPageHandler.not_modified_count, 1)
+        self.assertEqual(second.page_name, 'Local Test Page')
+        self.assertTrue(second.page_status)
+        self.assertIsNotNone(first.body_digest)
+        self.assertEqual(first.body_digest, second.body_digest)
+
+    def test_changed_etag_refetches_page(self):
+        WSSC = self._checker()
+        WSSC.take_snapshot()
+        _ETagPageHandler.etag = '"v2"'
+        self.assertFalse(WSSC.timed_server_response(WSSC.server_full_address).not_modified)
+        self.assertEqual(ValidatorCache.shared().get(WSSC.server_full_address).etag, '"v2"')
+
+    def test_page_name_uses_cached_validators(self):
+        WSSC = self._checker()
+        self.assertEqual(WSSC.page_name, 'Local Test Page')
+        self.assertEqual(WSSC.page_name, 'Local Test Page')
+        self.assertEqual((_ETagPageHandler.request_count, _ETagPageHandler.not_modified_count), (1, 1))
+
+    def test_conditional_requests_can_be_turned_off(self):
+        WSSC = self._checker(conditional_requests=False)
+        WSSC.take_snapshot()
+        WSSC.take_snapshot()
+        self.assertEqual(_ETagPageHandler.request_count, 2)
+        self.assertEqual(_ETagPageHandler.not_modified_count, 0)
+
+
+class ImportTests(unittest.TestCase):
+    def test_import_has_no_platform_modules_or_side_effects(self):
+        code = ("import logging, sys, WebServerStatusCheckerAJM; "
+                "print(sorted(m for m in ('ctypes', 'winsound', 'ColorizerAJM') if m in sys.modules)); "
+                "print(len(logging.getLogger('logger').handlers))")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60,
+                                cwd=str(Path(__file__).resolve().parents[2]))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ['[]', '0'])
+
+    def test_fleet_and_asyncio_checkers_are_imported_on_first_use(self):
+        code = ("import sys, WebServerStatusCheckerAJM as package; "
+                "print(sorted(m for m in ('asyncio', 'multiprocessing', 'WebServerStatusCheckerAJM.FleetMonitor') "
+                "if m in sys.modules)); "
+                "from WebServerStatusCheckerAJM import ShardedFleetMonitor; "
+                "print(package.AsyncWebServerStatusCheck.__name__, package.FleetMonitor.__name__)")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, timeout=60,
+                                cwd=str(Path(__file__).resolve().parents[2]))
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ['[]', 'AsyncWebServerStatusCheck', 'FleetMonitor'])
+
+    def test_message_box_plugin_is_optional(self):
+        WSSC = WebServerStatusCheck('http://127.0.0.1/', silent_run=True, use_colorizer=False)
+        if sys.platform != 'win32':
+            self.assertIsNone(WSSC.message_box)
+            self.assertFalse(WSSC.use_msg_box_on_error)
+            with self.assertRaises(OSError):
+                WSSC.show_message_box('title', 'text', WSSC.WINAPI_MSG_BOX_STYLES['OK'])
+
+
+class _RecordingSink(AlertSink):
+    """ records the alerts it is sent, optionally blocking until released (like a message box). """
+    def __init__(self, block: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.alerts = []
+        self.release = Event()
+        if not block:
+            self.release.set()
+
+    def send(self, alert):
+        self.release.wait(5)
+        self.alerts.append(alert)
+
+
+class AlertDispatcherTests(unittest.TestCase):
+    @staticmethod
+    def _alert(key='srv:80', state='DOWN'):
+        return Alert(key, state, logging.CRITICAL, 'title', 'text', 0.0)
+
+    def test_sinks_must_implement_send(self):
+        with self.assertRaises(TypeError):
+            AlertSink()
+        self.assertTrue(_RecordingSink().accepts(self._alert()))
+
+    def test_dispatch_does_not_wait_on_blocking_sink(self):
+        blocking, fast = _RecordingSink(block=True), _RecordingSink()
+        dispatcher = AlertDispatcher([blocking, fast])
+        start = perf_counter()
+        self.assertTrue(dispatcher.dispatch(self._alert()))
+        self.assertLess(perf_counter() - start, 0.5)
+        dispatcher.flush(timeout=0.5)
+        self.assertEqual(len(fast.alerts), 1)
+        self.assertEqual(blocking.alerts, [])
+        blocking.release.set()
+        self.assertTrue(dispatcher.flush(timeout=5))
+        self.assertEqual(len(blocking.alerts), 1)
+        dispatcher.close()
+
+    def test_dedup_and_rate_limit(self):
+        sink = _RecordingSink()
+        dispatcher = AlertDispatcher([sink], rate_limit=2)
+        self.assertTrue(dispatcher.dispatch(self._alert()))
+        self.assertFalse(dispatcher.dispatch(self._alert()))
+        self.assertTrue(dispatcher.dispatch(self._alert(state='UP')))
+        self.assertFalse(dispatcher.dispatch(self._alert(key='other:80')))
+        dispatcher.flush(timeout=5)
+        self.assertEqual([a.state for a in sink.alerts], ['DOWN', 'UP'])
+        self.assertEqual(dispatcher.stats['deduplicated'], 1)
+        self.assertEqual(dispatcher.stats['rate_limited'], 1)
+        dispatcher.close()
+
+    def test_checker_alerts_on_down_and_recovery(self):
+        sink = _RecordingSink(min_level=logging.INFO)
+        WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[1], silent_run=True, use_colorizer=False,
+                             use_msg_box_on_error=False, alert_sinks=[sink], http_connect_timeout=0.5)
+        WSSC.take_snapshot()
+        WSSC.take_snapshot()
+        WSSC.store_snapshot(WSSC.snapshot._replace(server_status=ProbeState.UP, page_status=ProbeState.UP))
+        WSSC.alert_dispatcher.flush(timeout=5)
+        self.assertEqual([(a.level, a.state) for a in sink.alerts],
+                         [(logging.CRITICAL, 'DOWN'), (logging.INFO, 'UP')])
+        WSSC.alert_dispatcher.close()
+
+
+class _FakeClock:
+    """ manually advanced clock for the scheduler. """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CheckSchedulerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = _FakeClock()
+        self.scheduler = CheckScheduler(interval=60, jitter=0, min_interval=1, dead_after=600, clock=self.clock)
+        self.scheduler.on_missed_deadline = lambda *args: None
+
+    def _run_due(self, is_down=False, took=0.0, flapping=False):
+        self.clock.now += self.scheduler.time_until_next()
+        keys = self.scheduler.due()
+        self.clock.now += took
+        for key in keys:
+            self.scheduler.record_result(key, is_down, flapping=flapping)
+        return keys
+
+    def test_fixed_cadence_does_not_drift(self):
+        self.scheduler.add('a')
+        start = self.clock.now
+        for _ in range(5):
+            self.assertEqual(self._run_due(took=10), ['a'])
+        self.assertEqual(self.scheduler.time_until_next() + self.clock.now, start + 5 * 60)
+
+    def test_down_checks_faster_then_backs_off(self):
+        self.scheduler.add('a')
+        self._run_due(is_down=True)
+        self.assertEqual(self.scheduler.effective_interval('a'), 15)
+        for _ in range(45):
+            self._run_due(is_down=True)
+        self.assertGreater(self.scheduler.effective_interval('a'), 60)
+        self._run_due(is_down=False)
+        self.assertEqual(self.scheduler.effective_interval('a'), 60)
+
+    def test_missed_deadlines_are_counted_and_skipped(self):
+        self.scheduler.add('a')
+        self.clock.now += 200
+        self.assertEqual(self.scheduler.due(), ['a'])
+        self.scheduler.record_result('a', False)
+        self.assertEqual(self.scheduler.missed_deadlines, {'a': 3})
+        self.assertLessEqual(self.scheduler.time_until_next(), 60)
+
+    def test_flapping_target_checked_faster(self):
+        self.scheduler.add('a')
+        self._run_due(flapping=True)
+        self.assertTrue(self.scheduler.is_flapping('a'))
+        self.assertEqual(self.scheduler.effective_interval('a'), 15)
+        self._run_due()
+        self.assertEqual(self.scheduler.effective_interval('a'), 60)
+
+    def test_checker_reports_confirmed_state(self):
+        WSSC = WebServerStatusCheck('http://127.0.0.1/', server_ports=[1], silent_run=True, use_colorizer=False,
+                                    use_msg_box_on_error=False, scheduler=self.scheduler, fail_threshold=2)
+        self.scheduler.add(1)
+        intervals = []
+        for _ in range(2):
+            self.clock.now += self.scheduler.time_until_next()
+            self.assertEqual(self.scheduler.due(), [1])
+            WSSC.store_snapshot(HysteresisTests._snapshot(self.clock.now, down=True, port=1))
+            WSSC.record_scheduled_result(1)
+            intervals.append(self.scheduler.effective_interval(1))
+        # a single failure does not confirm the port down, so only the second one speeds the cadence up.
+        self.assertEqual(intervals, [60, 15])
+
+    def test_empty_schedule_waits_instead_of_spinning(self):
+        self.scheduler.IDLE_INTERVAL = 0.05
+        start = perf_counter()
+        asyncio.run(self.scheduler.wait_until_next())
+        self.assertGreaterEqual(perf_counter() - start, 0.04)
+        self.assertEqual(self.scheduler.due(), [])
+
+    def test_checker_keeps_an_empty_scheduler_passed_in(self):
+        WSSC = WebServerStatusCheck('http://127.0.0.1/', server_ports=[1], silent_run=True, use_colorizer=False,
+                                    use_msg_box_on_error=False, scheduler=self.scheduler)
+        self.assertIs(WSSC.scheduler, self.scheduler)
+
+
+class StatusHistoryTests(unittest.TestCase):
+    @staticmethod
+    def _snapshot(timestamp, port=80, server_status=ProbeState.UP, latency=0.25):
+        return ProbeSnapshot(port, timestamp, ProbeState.UP, ProbeState.UP, server_status,
+                             server_status, 'Homepage', latency=latency)
+
+    def test_ring_buffer_keeps_latest_records(self):
+        history = StatusHistory(capacity=5)
+        for timestamp in range(12):
+            history.append(self._snapshot(float(timestamp), port=80 + timestamp % 2))
+        self.assertEqual(len(history), 5)
+        self.assertEqual([r.timestamp for r in history], [7.0, 8.0, 9.0, 10.0, 11.0])
+        self.assertEqual([r.timestamp for r in history.last(2)], [10.0, 11.0])
+        self.assertEqual([r.timestamp for r in history.last(2, port=80)], [8.0, 10.0])
+
+    def test_records_round_trip_states_and_latency(self):
+        history = StatusHistory(capacity=3)
+        history.append(self._snapshot(1.0, server_status=ProbeState.TIMEOUT, latency=None))
+        history.append(self._snapshot(2.0))
+        timed_out, up = history.last(2)
+        self.assertIs(timed_out.server_status, ProbeState.TIMEOUT)
+        self.assertIsNone(timed_out.latency)
+        self.assertTrue(timed_out.is_down)
+        self.assertAlmostEqual(up.latency, 0.25)
+        self.assertFalse(up.is_down)
+
+    def test_window_query_after_wrap_around(self):
+        history = StatusHistory(capacity=4)
+        for timestamp in range(10):
+            history.append(self._snapshot(float(timestamp)))
+        self.assertEqual([r.timestamp for r in history.window(7.0, 8.5)], [7.0, 8.0])
+        self.assertEqual([r.timestamp for r in history.window(start=8.0)], [8.0, 9.0])
+        self.assertEqual(history.window(0.0, 5.0), [])
+
+
+class SQLiteHistoryStoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()
+        self.store = SQLiteHistoryStore(str(Path(self.directory.name, 'history.db')), flush_interval=0.05)
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_checks_and_transitions_are_written_in_background(self):
+        base = time()
+        states = [ProbeState.UP, ProbeState.UP, ProbeState.DOWN, ProbeState.UP]
+        for offset, state in enumerate(states):
+            self.store.record('srv', StatusHistoryTests._snapshot(base + offset, server_status=state))
+        self.assertTrue(self.store.flush(timeout=5))
+        records = self.store.checks('srv', port=80)
+        self.assertEqual([r.server_status for r in records], states)
+        self.assertEqual([r.timestamp - base for r in self.store.checks('srv', start=base + 1, end=base + 2)],
+                         [1.0, 2.0])
+        self.assertEqual([t[2:] for t in self.store.transitions('srv')],
+                         [(None, 'UP'), ('UP', 'DOWN'), ('DOWN', 'UP')])
+        with self.store.connect() as connection:
+            self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_retention_downsamples_old_checks(self):
+        base = (time() // 3600 - 2) * 3600
+        for offset, state in ((0.0, ProbeState.UP), (60.0, ProbeState.DOWN), (4000.0, ProbeState.UP)):
+            self.store.record('srv', StatusHistoryTests._snapshot(base + offset, server_status=state))
+        self.store.flush(timeout=5)
+        self.store.apply_retention(now=base + 3600 + self.store.retention_days * 86400)
+        self.assertEqual([r.timestamp - base for r in self.store.checks('srv')], [4000.0])
+        (port, hour, checks, down, latency), = self.store.hourly('srv')
+        self.assertEqual((port, hour, checks, down), (80, base, 2, 1))
+        self.assertAlmostEqual(latency, 0.25)
+
+    def test_checker_writes_to_history_db(self):
+        WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[1], silent_run=True, use_colorizer=False,
+                             use_msg_box_on_error=False, history_store=self.store, target_name='local',
+                             http_connect_timeout=0.5)
+        WSSC.take_snapshot()
+        self.store.flush(timeout=5)
+        self.assertEqual(len(self.store.checks('local', port=1)), 1)
+
+
+class UptimeAnalyticsTests(unittest.TestCase):
+    def test_window_downtime_clips_outages(self):
+        intervals = OutageIntervals()
+        for start, end in ((10, 20), (30, 40), (50, 60)):
+            intervals.add(start, end)
+        self.assertEqual(intervals.downtime(0, 100), (30.0, 3))
+        self.assertEqual(intervals.downtime(15, 35), (10.0, 2))
+        self.assertEqual(intervals.downtime(41, 49), (0.0, 0))
+        intervals.add(35, 55)
+        self.assertEqual(intervals.downtime(0, 100), (40.0, 2))
+
+    def test_report_from_snapshots(self):
+        analytics = UptimeAnalytics()
+        for timestamp, state in ((0, ProbeState.UP), (100, ProbeState.DOWN), (130, ProbeState.DOWN),
+                                 (160, ProbeState.UP), (900, ProbeState.DOWN)):
+            analytics.record('srv', StatusHistoryTests._snapshot(float(timestamp), server_status=state))
+        report = analytics.report('srv', 80, 0, 1000)
+        self.assertEqual(report.outages, 2)
+        self.assertEqual(report.downtime, 160)
+        self.assertAlmostEqual(report.availability, 84.0)
+        self.assertEqual(report.mttr, 80)
+        self.assertEqual(report.mtbf, 420)
+        self.assertEqual(analytics.report('srv', 81, 0, 1000).availability, 100.0)
+
+    def test_monthly_fleet_reports_over_a_year(self):
+        analytics = UptimeAnalytics()
+        boundaries = UptimeAnalytics.month_boundaries(datetime.date(2024, 1, 1))
+        for target in range(50):
+            for start in range(int(boundaries[0]), int(boundaries[-1]), 6 * 3600):
+                analytics.add_outage(f'srv{target}', 80, start, start + 216)
+        start = perf_counter()
+        reports = analytics.periodic_reports(boundaries)
+        self.assertLess(perf_counter() - start, 1.0)
+        self.assertEqual(len(reports), 50)
+        self.assertAlmostEqual(reports[('srv0', 80)][0].availability, 99.0)
+
+
+class ProbeMetricsTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metrics = ProbeMetrics()
+        for timestamp, state, latency in ((0.0, ProbeState.UP, 0.02), (60.0, ProbeState.TIMEOUT, None),
+                                          (120.0, ProbeState.UP, 3.0)):
+            self.metrics.record('srv "a"', StatusHistoryTests._snapshot(timestamp, server_status=state,
+                                                                        latency=latency))
+
+    def test_render_counters_gauges_and_histograms(self):
+        text = self.metrics.render()
+        labels = 'target="srv \\"a\\"",port="80"'
+        self.assertIn(f'wssc_up{{{labels}}} 1\n', text)
+        self.assertIn(f'wssc_probes_total{{{labels}}} 3\n', text)
+        self.assertIn(f'wssc_downtime_seconds_total{{{labels}}} 60.0\n', text)
+        self.assertIn(f'wssc_probe_timeouts_total{{{labels},component="server"}} 1\n', text)
+        self.assertIn(f'wssc_probe_timeouts_total{{{labels},component="local"}} 0\n', text)
+        self.assertIn(f'wssc_probe_latency_seconds_bucket{{{labels},component="server",le="0.025"}} 1\n', text)
+        self.assertIn(f'wssc_probe_latency_seconds_bucket{{{labels},component="server",le="+Inf"}} 2\n', text)
+        self.assertIn(f'wssc_probe_latency_seconds_count{{{labels},component="server"}} 2\n', text)
+        self.assertIn('# TYPE wssc_probe_latency_seconds histogram\n', text)
+
+    def test_server_serves_metrics_without_probing(self):
+        server = MetricsServer(self.metrics, port=0).start()
+        try:
+            response = requests.get(server.url, timeout=5)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+            self.assertIn('wssc_probes_total', response.text)
+            self.assertEqual(requests.get(server.url.replace('/metrics', '/other'), timeout=5).status_code, 404)
+        finally:
+            server.stop()
+
+
+class LatencyTests(LocalServerTestCase):
+    def test_http_phases_are_timed(self):
+        # a pool size no other test uses, so the first check opens a new connection.
+        WSSC = _CountingWSSC('http://localhost/', server_ports=[self.port], silent_run=True, use_colorizer=False,
+                             use_msg_box_on_error=False, http_pool_size=7)
+        first = WSSC.take_snapshot().timings
+        self.assertGreater(first.connect, 0)
+        self.assertIsNone(first.tls)
+        self.assertGreaterEqual(first.total, first.ttfb)
+        second = WSSC.take_snapshot().timings
+        self.assertEqual((second.dns, second.connect), (0.0, 0.0))
+        self.assertEqual(set(WSSC.latency_percentiles()),
+                         {'local', 'machine', 'server', 'page', 'dns', 'connect', 'ttfb'})
+
+    def test_slow_component_is_degraded_not_down(self):
+        WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True, use_colorizer=False,
+                             use_msg_box_on_error=False, degraded_thresholds={'server': 0.0})
+        snapshot = WSSC.take_snapshot()
+        self.assertIs(snapshot.server_status, ProbeState.DEGRADED)
+        self.assertIs(snapshot.page_status, ProbeState.UP)
+        self.assertTrue(snapshot.is_degraded)
+        self.assertFalse(snapshot.is_down)
+        self.assertIn('Port: %d is DEGRADED' % self.port, WSSC.render_status_string(snapshot))
+        with self.assertRaises(ValueError):
+            _CountingWSSC('http://127.0.0.1/', silent_run=True, degraded_thresholds={'disk': 1.0})
+
+    def test_quantile_sketch_accuracy_in_bounded_memory(self):
+        sketch = QuantileSketch(accuracy=0.01, max_buckets=200)
+        for value in range(1, 100001):
+            sketch.add(value / 1000)
+        self.assertLessEqual(len(sketch._buckets), 200)
+        for q, expected in ((0.5, 50.0), (0.95, 95.0), (0.99, 99.0)):
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.01)
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+
+class _SlowListHandler(logging.Handler):
+    """ formats status records slowly, like a handler writing to a slow disk, and keeps them with their threads. """
+    def __init__(self):
+        super().__init__()
+        self.written = []
+
+    def emit(self, record):
+        if not hasattr(record, 'snapshot'):
+            return
+        sleep(0.2)
+        self.written.append((self.format(record), record.snapshot, current_thread()))
+
+
+class StatusLoggingTests(LocalServerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.logger = logging.getLogger('wssc-status-test')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = _SlowListHandler()
+        self.logger.handlers = [self.handler]
+        self.WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[self.port], silent_run=True,
+                                  use_colorizer=False, use_msg_box_on_error=False)
+        self.WSSC.LOGGER = self.logger
+        self.renders = 0
+        render = self.WSSC.render_status_string
+
+        def counting_render(*args, **kwargs):
+            self.renders += 1
+            return render(*args, **kwargs)
+        self.WSSC.render_status_string = counting_render
+
+    def test_filtered_levels_are_never_rendered(self):
+        snapshot = self.WSSC.take_snapshot()
+        self.logger.setLevel(logging.WARNING)
+        self.WSSC.log_status(snapshot)
+        self.handler.setLevel(logging.WARNING)
+        self.logger.setLevel(logging.INFO)
+        self.WSSC.log_status(snapshot)
+        self.assertEqual(self.renders, 0)
+        self.assertEqual(self.handler.written, [])
+
+    def test_queued_records_are_written_in_the_background(self):
+        log_queue = StatusLogQueue()
+        log_queue.start(self.logger)
+        log_queue.start(self.logger)
+        snapshot = self.WSSC.take_snapshot()
+        start = perf_counter()
+        for _ in range(3):
+            self.WSSC.log_status(snapshot)
+        self.assertLess(perf_counter() - start, 0.2)
+        log_queue.stop()
+        self.assertTrue(log_queue.is_running)
+        log_queue.stop()
+        self.assertFalse(log_queue.is_running)
+        self.assertEqual(self.logger.handlers, [self.handler])
+        self.assertEqual(len(self.handler.written), 3)
+        message, logged_snapshot, thread = self.handler.written[0]
+        self.assertIn('Port: %d is UP' % self.port, message)
+        self.assertIs(logged_snapshot, snapshot)
+        self.assertIsNot(thread, current_thread())
+        self.assertEqual(self.renders, 3)
+
+    def test_full_queue_drops_records_instead_of_blocking(self):
+        log_queue = StatusLogQueue(max_size=1)
+        log_queue.start(self.logger)
+        snapshot = self.WSSC.take_snapshot()
+        for _ in range(5):
+            self.WSSC.log_status(snapshot)
+        log_queue.stop()
+        self.assertGreater(log_queue.dropped, 0)
+        self.assertEqual(len(self.handler.written) + log_queue.dropped, 5)
+
+
+class _UplinkUpWSSC(WebServerStatusCheck):
+    """ WebServerStatusCheck whose local machine is always up, but that really pings the server. """
+    @property
+    def local_machine_rtt(self):
+        return 0.001
+
+
+class DNSCacheTests(LocalServerTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.lookups = []
+        self.answers = {'probe-target.test': ('127.0.0.1',)}
+
+    def resolver(self, host):
+        self.lookups.append(host)
+        if host not in self.answers:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return self.answers[host], None
+
+    def test_answers_and_failures_are_cached(self):
+        cache = DNSCache(negative_ttl=30, resolver=self.resolver)
+        self.assertEqual(cache.resolve('probe-target.test'), ('127.0.0.1',))
+        self.assertEqual(cache.resolve('Probe-Target.test'), ('127.0.0.1',))
+        for _ in range(2):
+            with self.assertRaises(socket.gaierror):
+                cache.resolve('missing.test')
+        self.assertEqual(cache.resolve('10.0.0.1'), ('10.0.0.1',))
+        self.assertEqual(self.lookups, ['probe-target.test', 'missing.test'])
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_entries_are_refreshed_ahead_of_expiry(self):
+        cache = DNSCache(ttl=0.3, refresh_ahead=0.5, resolver=self.resolver)
+        cache.resolve('probe-target.test')
+        sleep(0.2)
+        self.answers['probe-target.test'] = ('127.0.0.2',)
+        # past refresh_at the cached answer is still returned, while a refresh runs in the background.
+        self.assertEqual(cache.resolve('probe-target.test'), ('127.0.0.1',))
+        deadline = perf_counter() + 2
+        while cache.get('probe-target.test').addresses != ('127.0.0.2',) and perf_counter() < deadline:
+            sleep(0.01)
+        self.assertEqual(cache.resolve('probe-target.test'), ('127.0.0.2',))
+        self.assertEqual(len(self.lookups), 2)
+
+    def test_failed_refresh_keeps_the_answer_until_it_expires(self):
+        cache = DNSCache(ttl=0.3, refresh_ahead=0.5, resolver=self.resolver)
+        cache.resolve('probe-target.test')
+        sleep(0.2)
+        del self.answers['probe-target.test']
+        self.assertEqual(cache.resolve('probe-target.test'), ('127.0.0.1',))
+        sleep(0.05)
+        self.assertEqual(cache.resolve('probe-target.test'), ('127.0.0.1',))
+        sleep(0.1)
+        with self.assertRaises(socket.gaierror):
+            cache.resolve('probe-target.test')
+
+    def test_dns_failure_is_its_own_state(self):
+        shared, DNSCache._shared = DNSCache._shared, DNSCache(resolver=self.resolver)
+        try:
+            resolved = _UplinkUpWSSC('http://probe-target.test/', server_ports=[self.port], silent_run=True,
+                                     use_colorizer=False, use_msg_box_on_error=False, ping_method='tcp')
+            snapshot = resolved.take_snapshot()
+            self.assertIs(snapshot.server_status, ProbeState.UP)
+            self.assertFalse(snapshot.dns_failed)
+
+            missing = _UplinkUpWSSC('http://missing.test/', server_ports=[self.port], silent_run=True,
+                                    use_colorizer=False, use_msg_box_on_error=False, ping_method='tcp')
+            snapshot = missing.take_snapshot()
+            self.assertIs(snapshot.machine_status, ProbeState.DNS_FAILURE)
+            self.assertIs(snapshot.server_status, ProbeState.DNS_FAILURE)
+            self.assertTrue(snapshot.is_down)
+            self.assertTrue(snapshot.dns_failed)
+            self.assertEqual(missing.build_alert(snapshot).state, 'DNS_FAILURE')
+            self.assertEqual(SQLiteHistoryStore.overall_state(snapshot), 'DNS_FAILURE')
+            self.assertIs(missing.history.last(1)[0].machine_status, ProbeState.DNS_FAILURE)
+            # the http request and the ping shared one lookup per host.
+            self.assertEqual(self.lookups.count('missing.test'), 1)
+            self.assertEqual(self.lookups.count('probe-target.test'), 1)
+        finally:
+            DNSCache._shared = shared
+
+
+class ShardingTests(LocalServerTestCase):
+    def test_ring_is_stable_balanced_and_moves_few_keys(self):
+        keys = [f'http://server{index}.example/' for index in range(2000)]
+        before = ConsistentHashRing(range(4)).assign(keys)
+        self.assertEqual(before, ConsistentHashRing(range(4)).assign(keys))
+        for shard_keys in before.values():
+            self.assertTrue(300 < len(shard_keys) < 700, len(shard_keys))
+        grown = ConsistentHashRing(range(5))
+        moved = [key for node, shard_keys in before.items() for key in shard_keys if grown.node_for(key) != node]
+        # only keys taken over by the new node move.
+        self.assertTrue(all(grown.node_for(key) == 4 for key in moved))
+        self.assertLess(len(moved), len(keys) / 3)
+        with self.assertRaises(LookupError):
+            ConsistentHashRing().node_for('key')
+
+    def test_workers_check_their_shards_and_coordinator_stores_results(self):
+        targets = [{'name': f'target{index}', 'server_web_address': 'http://127.0.0.1',
+                    'server_ports': [self.port]} for index in range(6)]
+        targets.append({'name': 'down', 'server_web_address': 'http://127.0.0.1', 'server_ports': [1]})
+        sharded = ShardedFleetMonitor(targets, workers=2, silent_run=True, start_method='fork',
+                                      use_colorizer=False, local_machine_ping_host='127.0.0.1', ping_method='tcp')
+        try:
+            self.assertEqual(sorted(name for names in sharded.shards.values() for name in names),
+                             sorted(sharded.targets))
+            results = sharded.check_once(timeout=60)
+        finally:
+            sharded.alert_dispatcher.close()
+        self.assertEqual(set(results), set(sharded.targets))
+        for index in range(6):
+            self.assertIs(results[f'target{index}'][self.port].server_status, ProbeState.UP)
+            self.assertEqual(len(sharded.history[f'target{index}']), 1)
+        self.assertEqual(sharded.down_targets, {'down': [1]})
+        self.assertEqual(_LocalPageHandler.request_count, 6)
+
+
+class PortStateMachineTests(LocalServerTestCase):
+    @staticmethod
+    def _snapshot(timestamp, server_status=ProbeState.UP, port=80):
+        return ProbeSnapshot(port, timestamp, ProbeState.UP, ProbeState.UP, server_status,
+                             server_status, 'Homepage')
+
+    def test_transitions_durations_and_down_since(self):
+        machine = PortStateMachine()
+        transitions = []
+        machine.subscribe(transitions.append)
+        self.assertIs(machine.state('web'), PortState.UNKNOWN)
+        states = [ProbeState.UP, ProbeState.UP, ProbeState.DOWN, ProbeState.TIMEOUT,
+                  ProbeState.DEGRADED, ProbeState.UP]
+        for timestamp, state in enumerate(states, start=10):
+            machine.feed('web', self._snapshot(float(timestamp), state))
+            if state is ProbeState.TIMEOUT:
+                # a down port that changes reason stays down since the first failure.
+                self.assertEqual(machine.down_since('web'), 12.0)
+        self.assertEqual([(t.from_state, t.to_state, t.duration) for t in transitions],
+                         [(PortState.UNKNOWN, PortState.UP, None),
+                          (PortState.UP, PortState.DOWN, 2.0),
+                          (PortState.DOWN, PortState.TIMEOUT, 1.0),
+                          (PortState.TIMEOUT, PortState.DEGRADED, 1.0),
+                          (PortState.DEGRADED, PortState.UP, 1.0)])
+        self.assertIs(machine.state('web'), PortState.UP)
+        self.assertIsNone(machine.down_since('web'))
+        self.assertEqual((machine.since('web'), machine.last_checked('web')), (15.0, 15.0))
+
+    def test_failing_subscriber_does_not_stop_others(self):
+        machine = PortStateMachine()
+        received = []
+
+        @machine.subscribe
+        def _failing(transition):
+            raise RuntimeError(transition)
+
+        machine.subscribe(received.append)
+        machine.feed('web', self._snapshot(1.0, ProbeState.DNS_FAILURE))
+        self.assertEqual([t.to_state for t in received], [PortState.DNS_FAILURE])
+        machine.unsubscribe(received.append)
+        machine.feed('web', self._snapshot(2.0))
+        self.assertEqual(len(received), 1)
+
+    def test_checker_reads_state_without_probing(self):
+        WSSC = _CountingWSSC('http://127.0.0.1/', server_ports=[1, self.port], use_msg_box_on_error=False,
+                             silent_run=True, use_colorizer=False)
+        self.assertIs(WSSC.port_state, PortState.UNKNOWN)
+        self.assertFalse(WSSC.is_down)
+        self.assertIsNone(WSSC.down_timestamp)
+        self.assertEqual((WSSC.ping_count, _LocalPageHandler.request_count), (0, 0))
+        snapshot = WSSC.take_snapshot(1)
+        WSSC.active_server_port = 1
+        self.assertIs(WSSC.port_state, PortState.DOWN)
+        self.assertTrue(WSSC.is_down)
+        self.assertEqual(WSSC.down_timestamp, snapshot.timestamp)
+        self.assertGreaterEqual(WSSC.length_of_time_down, timedelta(seconds=0))
+        WSSC.active_server_port = self.port
+        self.assertIs(WSSC.port_state, PortState.UNKNOWN)
+        self.assertEqual(WSSC.ping_count, 1)
+
+
+class _OfflineWSSC(_CountingWSSC):
+    """ _CountingWSSC whose local machine is offline. """
+    @property
+    def local_machine_rtt(self):
+        return None
+
+
+class _OfflineFleet(_CountingFleet):
+    @property
+    def local_machine_rtt(self):
+        return None
+
+
+class _SlowPingWSSC(_CountingWSSC):
+    def ping_rtt(self, **kwargs):
+        sleep(0.4)
+        return super().ping_rtt(**kwargs)
+
+
+class ProbeDependencyTests(LocalServerTestCase):
+    def test_graph_waves_and_validation(self):
+        self.assertEqual(ProbeDependencyGraph().waves, (('local',), ('machine', 'server'), ('page',)))
+        chained = ProbeDependencyGraph({'server': ('machine',)})
+        self.assertEqual(chained.waves, (('local',), ('machine',), ('server',), ('page',)))
+        self.assertEqual(chained.resolve_states({'local': ProbeState.UP, 'machine': ProbeState.DOWN,
+                                                 'server': ProbeState.UP, 'page': ProbeState.UP}),
+                         {'local': ProbeState.UP, 'machine': ProbeState.DOWN,
+                          'server': ProbeState.UNREACHABLE, 'page': ProbeState.UNREACHABLE})
+        with self.assertRaises(ValueError):
+            ProbeDependencyGraph({'local': ('page',)})
+        with self.assertRaises(ValueError):
+            ProbeDependencyGraph({'server': ('dns',)})
+
+    def test_offline_local_machine_skips_every_probe(self):
+        WSSC = _OfflineWSSC('http://127.0.0.1/', server_ports=[self.port], use_msg_box_on_error=False,
+                            silent_run=True, use_colorizer=False)
+        snapshot = WSSC.take_snapshot()
+        self.assertEqual((WSSC.ping_count, _LocalPageHandler.request_count), (0, 0))
+        self.assertIs(snapshot.local_machine_status, ProbeState.DOWN)
+        self.assertEqual({snapshot.machine_status, snapshot.server_status, snapshot.page_status},
+                         {ProbeState.UNREACHABLE})
+        self.assertTrue(snapshot.is_down)
+        self.assertIs(WSSC.port_state, PortState.DOWN)
+
+    def test_offline_fleet_sends_no_probes(self):
+        fleet = _OfflineFleet([{'name': f'target{index}', 'server_web_address': 'http://127.0.0.1/',
+                                'server_ports': [self.port]} for index in range(5)], silent_run=True)
+        results = fleet.check_once()
+        self.assertEqual((fleet.pinged, _LocalPageHandler.request_count), ([], 0))
+        self.assertTrue(all(results[name][self.port].server_status is ProbeState.UNREACHABLE for name in results))
+        self.assertEqual(len(fleet.down_targets), 5)
+
+    def test_independent_probes_run_in_parallel(self):
+        WSSC = _SlowPingWSSC('http://127.0.0.1/', server_ports=[self.port], use_msg_box_on_error=False,
+                             silent_run=True, use_colorizer=False)
+        _SlowPageHandler.delay = 0.4
+        server = _QuietHTTPServer(('127.0.0.1', 0), _SlowPageHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            start = perf_counter()
+            snapshot = WSSC.take_snapshot(server.server_address[1])
+            took = perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+            _SlowPageHandler.delay = 0.5
+        self.assertFalse(snapshot.is_down)
+        # the 0.4 second ping and the 0.4 second request overlap.
+        self.assertLess(took, 0.75)
+
+    def test_server_can_depend_on_machine(self):
+        class _DownMachineWSSC(_CountingWSSC):
+            def ping_rtt(self, **kwargs):
+                super().ping_rtt(**kwargs)
+                return None
+
+        WSSC = _DownMachineWSSC('http://127.0.0.1/', server_ports=[self.port], use_msg_box_on_error=False,
+                                silent_run=True, use_colorizer=False, probe_dependencies={'server': ('machine',)})
+        snapshot = WSSC.take_snapshot()
+        self.assertEqual((WSSC.ping_count, _LocalPageHandler.request_count), (1, 0))
+        self.assertIs(snapshot.machine_status, ProbeState.DOWN)
+        self.assertIs(snapshot.server_status, ProbeState.UNREACHABLE)
+
+
+class _ListDispatcher:
+    """ stands in for an AlertDispatcher, keeping every alert it is given. """
+    def __init__(self):
+        self.alerts = []
+
+    def dispatch(self, alert):
+        self.alerts.append(alert)
+        return True
+
+    def close(self):
+        pass
+
+
+class HysteresisTests(unittest.TestCase):
+    @staticmethod
+    def _snapshot(timestamp, down=False, port=80):
+        state = ProbeState.DOWN if down else ProbeState.UP
+        return ProbeSnapshot(port, timestamp, ProbeState.UP, ProbeState.UP, state, state, 'Homepage')
+
+    def _feed(self, machine, pattern, start=0):
+        """ feeds one snapshot per character of pattern ('x' down, '.' up) and returns the states after each. """
+        states = []
+        for offset, result in enumerate(pattern):
+            machine.feed('web', self._snapshot(float(start + offset), down=result == 'x'))
+            states.append(machine.state('web').value)
+        return states
+
+    def test_thresholds_delay_going_down_and_recovering(self):
+        machine = PortStateMachine(fail_threshold=3, recover_threshold=2)
+        self.assertEqual(self._feed(machine, '.x.xxx.x..'),
+                         ['UP', 'UP', 'UP', 'UP', 'UP', 'DOWN', 'DOWN', 'DOWN', 'DOWN', 'UP'])
+        # down since the check that completed the fail_threshold.
+        machine = PortStateMachine(fail_threshold=2)
+        self._feed(machine, '.xx')
+        self.assertEqual(machine.down_since('web'), 2.0)
+
+    def test_flapping_port_is_marked_and_settles(self):
+        machine = PortStateMachine(flap_history=10, flap_threshold=4)
+        states = self._feed(machine, '.x.x.x')
+        self.assertEqual(states[:4], ['UP', 'DOWN', 'UP', 'DOWN'])
+        self.assertEqual(states[4:], ['FLAPPING', 'FLAPPING'])
+        self.assertFalse(machine.state('web').is_down)
+        self.assertIsNone(machine.down_since('web'))
+        self.assertEqual(machine.flap_changes('web'), 5)
+        # it stays flapping until fewer than 2 changes are left in the latest 10 results.
+        states = self._feed(machine, '.' * 9, start=6)
+        self.assertEqual(states[-2:], ['FLAPPING', 'UP'])
+        with self.assertRaises(ValueError):
+            PortStateMachine(flap_history=4, flap_threshold=4)
+
+    def test_alerts_follow_state_not_single_snapshots(self):
+        dispatcher = _ListDispatcher()
+        WSSC = WebServerStatusCheck('http://127.0.0.1/', silent_run=True, use_msg_box_on_error=False,
+                                    use_colorizer=False, alert_dispatcher=dispatcher, fail_threshold=2,
+                                    recover_threshold=2, flap_history=8, flap_threshold=5)
+        for timestamp, down in enumerate([False, True, False, True, True, False, False]):
+            WSSC.store_snapshot(self._snapshot(float(timestamp), down=down, port=WSSC.active_server_port))
+        # the single failure raised nothing, the outage one alert and its end one back up alert.
+        self.assertEqual([alert.state for alert in dispatcher.alerts], ['DOWN', 'UP'])
+        for timestamp, down in enumerate([True, False, True, False, True], start=7):
+            WSSC.store_snapshot(self._snapshot(float(timestamp), down=down, port=WSSC.active_server_port))
+        self.assertIs(WSSC.port_state, PortState.FLAPPING)
+        self.assertEqual(len(dispatcher.alerts), 2)
+
+    def test_outages_and_downtime_follow_state(self):
+        with TemporaryDirectory() as temp_dir:
+            store = SQLiteHistoryStore(str(Path(temp_dir, 'history.db')), flush_interval=0.05)
+            try:
+                WSSC = WebServerStatusCheck('http://127.0.0.1/', silent_run=True, use_msg_box_on_error=False,
+                                            use_colorizer=False, alert_dispatcher=_ListDispatcher(),
+                                            history_store=store, target_name='web', fail_threshold=3)
+                port, base = WSSC.active_server_port, time() // 1
+                for offset, result in enumerate('.x..xxx.'):
+                    WSSC.store_snapshot(self._snapshot(base + offset, down=result == 'x', port=port))
+                store.flush(timeout=5)
+                # every check is kept, but the single failure opened no outage and added no downtime.
+                self.assertEqual(len(store.checks('web', port=port)), 8)
+                self.assertEqual([t[2:] for t in store.transitions('web')],
+                                 [(None, 'UP'), ('UP', 'DOWN'), ('DOWN', 'UP')])
+            finally:
+                store.close()
+        report = WSSC.uptime_analytics.report('web', port, base, base + 8)
+        self.assertEqual((report.outages, report.downtime), (1, 1.0))
+        self.assertIn(f'wssc_downtime_seconds_total{{target="web",port="{port}"}} 1.0\n', WSSC.metrics.render())
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_benchmark_writes_results(self):
+        script = Path(__file__).resolve().parents[1] / 'benchmarks' / 'benchmark.py'
+        with TemporaryDirectory() as temp_dir:
+            output = Path(temp_dir) / 'results.json'
+            subprocess.run([sys.executable, str(script), '--targets', '2', '--cycles', '2', '--servers', '2',
+                            '--output', str(output)], check=True, capture_output=True, timeout=120)
+            results = json.loads(output.read_text())
+        self.assertEqual([(run['mode'], run['targets']) for run in results['runs']],
+                         [('fleet', 2), ('sequential', 2)])
+        for run in results['runs']:
+            self.assertEqual(run['cycles'][-1]['server_states'], {'UP': 2})
+            self.assertEqual(run['summary']['sockets_opened'], 2)
+
+
 if __name__ == '__main__':
     unittest.main()
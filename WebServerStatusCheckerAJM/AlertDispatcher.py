@@ -0,0 +1,199 @@
+"""
+AlertDispatcher.py
+
+Delivers alerts to their sinks in the background, so the probe loop never waits on a notification.
+"""
+from collections import deque
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    from WebServerStatusCheckerAJM.AlertSinks import Alert, AlertSink, WebhookAlertSink
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+except (ModuleNotFoundError, ImportError):
+    from AlertSinks import Alert, AlertSink, WebhookAlertSink
+    from LazyLogger import LazyLogger
+
+
+class AlertDispatcher:
+    """
+    Class AlertDispatcher:
+    Fans alerts out to a set of AlertSinks. dispatch() only filters the alert and puts it on the bounded queue
+    of each sink, and every sink has its own daemon worker thread that delivers from that queue,
+    so it never blocks the caller and a blocking sink only delays its own alerts.
+
+    Alerts are deduplicated: an alert with the same key and state as the last alert sent for that key,
+    within dedup_window seconds, is suppressed. Alerts are also rate limited: at most rate_limit alerts are sent
+    per rate_period seconds, further alerts are suppressed. Alerts that do not fit in a sink's queue are dropped.
+
+    Parameters:
+    - sinks (Iterable[AlertSink]): The sinks to deliver to.
+    - dedup_window (float): Seconds a repeated alert is suppressed for. Defaults to DEFAULT_DEDUP_WINDOW.
+    - rate_limit (int): Maximum alerts per rate_period. Defaults to DEFAULT_RATE_LIMIT.
+    - rate_period (float): Seconds the rate limit applies over. Defaults to DEFAULT_RATE_PERIOD.
+
+    Class Methods:
+    - from_kwargs: Builds a dispatcher from the alert_* keyword arguments of WebServerStatusCheck and FleetMonitor.
+
+    Properties:
+    - sinks: The sinks alerts are delivered to.
+    - stats: Counters of alerts queued, deduplicated, rate limited, dropped, sent and failed.
+
+    Methods:
+    - add_sink: Adds a sink.
+    - dispatch: Queues an alert for delivery, returning True if at least one sink will receive it.
+    - flush: Waits until every queued alert has been delivered (or a timeout passes).
+    - close: Stops the worker threads once their queues are empty.
+    """
+    LOGGER = LazyLogger()
+    DEFAULT_DEDUP_WINDOW = 300.0
+    DEFAULT_RATE_LIMIT = 20
+    DEFAULT_RATE_PERIOD = 60.0
+    _STOP = object()
+
+    def __init__(self, sinks: Iterable[AlertSink] = None, dedup_window: float = None,
+                 rate_limit: int = None, rate_period: float = None):
+        self.dedup_window = self.DEFAULT_DEDUP_WINDOW if dedup_window is None else dedup_window
+        self.rate_limit = rate_limit or self.DEFAULT_RATE_LIMIT
+        self.rate_period = rate_period or self.DEFAULT_RATE_PERIOD
+        self._sinks: List[Tuple[AlertSink, Queue]] = []
+        self._workers: List[Thread] = []
+        self._last_sent: Dict[str, Tuple[str, float]] = {}
+        self._sent_times = deque()
+        self._lock = Lock()
+        self._stats = dict.fromkeys(('queued', 'deduplicated', 'rate_limited', 'dropped', 'sent', 'failed'), 0)
+
+        for sink in sinks or []:
+            self.add_sink(sink)
+
+    @classmethod
+    def from_kwargs(cls, sinks: Iterable[AlertSink] = None, **kwargs) -> 'AlertDispatcher':
+        """
+        Builds a dispatcher for sinks plus the alert_sinks list and an alert_webhook_url (if given),
+         configured with alert_dedup_window, alert_rate_limit and alert_rate_period. Other keyword arguments are ignored.
+        """
+        sinks = [*(kwargs.get('alert_sinks', None) or []), *(sinks or [])]
+        if kwargs.get('alert_webhook_url', None):
+            sinks.append(WebhookAlertSink(kwargs['alert_webhook_url']))
+        return cls(sinks, dedup_window=kwargs.get('alert_dedup_window', None),
+                   rate_limit=kwargs.get('alert_rate_limit', None),
+                   rate_period=kwargs.get('alert_rate_period', None))
+
+    @property
+    def sinks(self) -> List[AlertSink]:
+        """
+        The sinks alerts are delivered to.
+        """
+        return [sink for sink, _ in self._sinks]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        A copy of the dispatch counters.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def add_sink(self, sink: AlertSink) -> None:
+        """
+        Adds sink, with its own bounded queue and worker thread.
+        """
+        alert_queue = Queue(maxsize=sink.queue_size)
+        worker = Thread(target=self._deliver, args=(sink, alert_queue), name=f'alert-{sink.name}', daemon=True)
+        self._sinks.append((sink, alert_queue))
+        self._workers.append(worker)
+        worker.start()
+
+    def _deliver(self, sink: AlertSink, alert_queue: Queue) -> None:
+        while True:
+            alert = alert_queue.get()
+            try:
+                if alert is self._STOP:
+                    return
+                sink.send(alert)
+                self._count('sent')
+            except Exception as e:
+                self._count('failed')
+                self.LOGGER.warning("could not send alert to %s due to - %s", sink.name, e)
+            finally:
+                alert_queue.task_done()
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _allow(self, alert: Alert) -> Optional[str]:
+        """
+        Applies deduplication and rate limiting, returning the name of the stat to count if alert is suppressed.
+        """
+        now = monotonic()
+        with self._lock:
+            last = self._last_sent.get(alert.key)
+            if last is not None and last[0] == alert.state and now - last[1] < self.dedup_window:
+                return 'deduplicated'
+            while self._sent_times and now - self._sent_times[0] >= self.rate_period:
+                self._sent_times.popleft()
+            if len(self._sent_times) >= self.rate_limit:
+                return 'rate_limited'
+            self._sent_times.append(now)
+            self._last_sent[alert.key] = (alert.state, now)
+            return None
+
+    def dispatch(self, alert: Alert) -> bool:
+        """
+        Queues alert for every sink that accepts it, without waiting for any of them.
+        Returns True if at least one sink will receive it, False if it was suppressed, dropped or no sink wants it.
+        """
+        targets = [(sink, alert_queue) for sink, alert_queue in self._sinks if sink.accepts(alert)]
+        if not targets:
+            # still remember the state, so e.g. an unsent recovery does not make the next outage look like a repeat.
+            with self._lock:
+                self._last_sent[alert.key] = (alert.state, monotonic())
+            return False
+        suppressed = self._allow(alert)
+        if suppressed:
+            self._count(suppressed)
+            return False
+        queued = False
+        for sink, alert_queue in targets:
+            try:
+                alert_queue.put_nowait(alert)
+                self._count('queued')
+                queued = True
+            except Full:
+                self._count('dropped')
+                self.LOGGER.warning("alert queue for %s is full, dropping alert %s", sink.name, alert.key)
+        return queued
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits up to timeout seconds (forever if None) for every queued alert to be delivered.
+        Returns True if all queues were emptied.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        for _, alert_queue in self._sinks:
+            with alert_queue.all_tasks_done:
+                while alert_queue.unfinished_tasks:
+                    remaining = None if deadline is None else deadline - monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    alert_queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Asks every worker to stop once its queue is empty and waits up to timeout seconds for them.
+        Workers still blocked in a sink (e.g. an open message box) are left to finish on their own.
+        """
+        deadline = monotonic() + timeout
+        for _, alert_queue in self._sinks:
+            try:
+                alert_queue.put(self._STOP, timeout=max(deadline - monotonic(), 0))
+            except Full:
+                continue
+        for worker in self._workers:
+            worker.join(max(deadline - monotonic(), 0))
+        self._sinks.clear()
+        self._workers.clear()
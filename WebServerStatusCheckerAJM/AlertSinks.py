@@ -0,0 +1,166 @@
+"""
+AlertSinks.py
+
+Destinations that alerts raised by the AlertDispatcher can be delivered to.
+Every sink is fed from its own bounded queue and worker thread, so a slow or blocking sink
+(a webhook that times out, a message box waiting for a click) never holds up the probes or the other sinks.
+"""
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+import requests
+
+try:
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+except (ModuleNotFoundError, ImportError):
+    from LazyLogger import LazyLogger
+
+
+class Alert(NamedTuple):
+    """
+    A single notification about a change in the status of a server port.
+
+    Fields:
+    - key: Identifies what the alert is about (e.g. 'server:port'), used for deduplication.
+    - state: Short state of the subject (e.g. 'DOWN', 'TIMEOUT', 'UP'), an alert with the same key and state
+      as the last one sent is a duplicate.
+    - level: logging level of the alert (e.g. logging.CRITICAL).
+    - title: One line summary.
+    - text: Full alert text.
+    - timestamp: POSIX timestamp of what the alert is about.
+    """
+    key: str
+    state: str
+    level: int
+    title: str
+    text: str
+    timestamp: float
+
+    def as_dict(self) -> dict:
+        """
+        Returns the alert as a JSON serializable dictionary.
+        """
+        return {'key': self.key, 'state': self.state, 'level': logging.getLevelName(self.level),
+                'title': self.title, 'text': self.text,
+                'timestamp': datetime.fromtimestamp(self.timestamp).isoformat()}
+
+
+class AlertSink(ABC):
+    """
+    Class AlertSink:
+    Base class of every alert destination.
+
+    Parameters:
+    - min_level (int): Alerts below this logging level are not sent to the sink. Defaults to logging.INFO.
+    - queue_size (int): Maximum number of alerts waiting for this sink, further alerts are dropped.
+      Defaults to DEFAULT_QUEUE_SIZE.
+
+    Methods:
+    - accepts: Returns True if an alert should be sent to this sink.
+    - send: Delivers one alert, called from the sink's worker thread. Abstract, so only subclasses
+        that implement it can be instantiated.
+    """
+    DEFAULT_QUEUE_SIZE = 100
+
+    def __init__(self, min_level: int = logging.INFO, queue_size: int = None):
+        self.min_level = min_level
+        self.queue_size = queue_size or self.DEFAULT_QUEUE_SIZE
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the sink, used for its worker thread and in log messages.
+        """
+        return type(self).__name__
+
+    def accepts(self, alert: Alert) -> bool:
+        """
+        Returns True if alert is at or above min_level.
+        """
+        return alert.level >= self.min_level
+
+    @abstractmethod
+    def send(self, alert: Alert) -> None:
+        """
+        Delivers alert. Called from the sink's worker thread, so it may block.
+        """
+
+
+class ConsoleAlertSink(AlertSink):
+    """
+    Class ConsoleAlertSink:
+    Prints alerts to the console.
+    """
+    def send(self, alert: Alert) -> None:
+        """
+        Prints the level and title of alert, followed by its text.
+        """
+        print(f"[{logging.getLevelName(alert.level)}] {alert.title}\n{alert.text}")
+
+
+class LogAlertSink(AlertSink):
+    """
+    Class LogAlertSink:
+    Writes alerts to a logger at their own level. Defaults to the package logger.
+    """
+    LOGGER = LazyLogger()
+
+    def __init__(self, logger: logging.Logger = None, min_level: int = logging.INFO, queue_size: int = None):
+        super().__init__(min_level=min_level, queue_size=queue_size)
+        self.logger = logger
+
+    def send(self, alert: Alert) -> None:
+        """
+        Logs the title and text of alert at its level, to logger if one was given.
+        """
+        (self.logger or self.LOGGER).log(alert.level, "%s - %s", alert.title, alert.text)
+
+
+class WebhookAlertSink(AlertSink):
+    """
+    Class WebhookAlertSink:
+    POSTs every alert as JSON (see Alert.as_dict) to a webhook url, e.g. a local chat or paging relay.
+
+    Parameters:
+    - url (str): The webhook url.
+    - timeout (float): Seconds to wait for the webhook. Defaults to DEFAULT_TIMEOUT.
+    """
+    DEFAULT_TIMEOUT = 5.0
+
+    def __init__(self, url: str, timeout: float = None, min_level: int = logging.INFO, queue_size: int = None):
+        super().__init__(min_level=min_level, queue_size=queue_size)
+        self.url = url
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self._session = None
+
+    def send(self, alert: Alert) -> None:
+        """
+        POSTs alert as JSON to url, re-using one session for every alert.
+        Raises a requests.HTTPError if the webhook answers with an error status, which the dispatcher logs.
+        """
+        if self._session is None:
+            self._session = requests.Session()
+        self._session.post(self.url, json=alert.as_dict(), timeout=self.timeout).raise_for_status()
+
+
+class DesktopPopupAlertSink(AlertSink):
+    """
+    Class DesktopPopupAlertSink:
+    Shows alerts in a desktop message box through a callable taking (title, text),
+    e.g. a partial of WebServerStatusCheck.show_message_box. Message boxes block until they are dismissed,
+    so only a few alerts are queued for it by default and only at WARNING or above.
+    """
+    DEFAULT_QUEUE_SIZE = 5
+
+    def __init__(self, show: Callable[[str, str], object], min_level: int = logging.WARNING,
+                 queue_size: int = None):
+        super().__init__(min_level=min_level, queue_size=queue_size)
+        self.show = show
+
+    def send(self, alert: Alert) -> None:
+        """
+        Shows alert's title and text through show, blocking until the message box is dismissed.
+        """
+        self.show(alert.title, alert.text)
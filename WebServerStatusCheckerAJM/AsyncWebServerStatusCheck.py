@@ -0,0 +1,274 @@
+"""
+AsyncWebServerStatusCheck.py
+
+asyncio based alternative to WebServerStatusCheck.MainLoop.
+The probes of a cycle (local ping, server ping and one http request per port) run concurrently,
+as far as their dependencies allow, so a cycle takes about as long as its slowest chain of probes
+instead of the sum of all of them.
+"""
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from sys import exit as sys_exit
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Hashable, List, Mapping
+
+try:
+    from WebServerStatusCheckerAJM.WebServerStatusCheckerAJM import WebServerStatusCheck
+    from WebServerStatusCheckerAJM.ProbeCycle import ProbeCycle, ProbeSnapshot
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+    from WebServerStatusCheckerAJM.ProbeDependencyGraph import ProbeDependencyGraph
+except (ModuleNotFoundError, ImportError):
+    from WebServerStatusCheckerAJM import WebServerStatusCheck
+    from ProbeCycle import ProbeCycle, ProbeSnapshot
+    from ProbeState import ProbeState
+    from ProbeDependencyGraph import ProbeDependencyGraph
+
+
+class AsyncProbeRunner:
+    """
+    Runs blocking probes (ping and the pooled http requests) in a thread pool from asyncio code,
+    with the number of probes in flight at any one time bounded by max_concurrency.
+
+    A probe that is still running at a deadline is abandoned rather than stopped: its result is no longer
+    awaited, but a thread cannot be interrupted, so it keeps its executor thread until its own timeout ends it.
+    Probes submitted meanwhile wait for a free thread; abandoned_probes tells how many threads are held that way.
+
+    Properties:
+    - executor: The thread pool the probes are run in, created on first use.
+    - abandoned_probes: Number of probes no longer awaited that are still running in the executor.
+
+    Methods:
+    - run_blocking: Coroutine that runs a blocking callable in the executor once a limiter allows it.
+    - gather_until: Coroutine that awaits several probes, giving up on the ones still running at a deadline.
+    - run_dependency_waves: Coroutine that probes many checks wave by wave of a ProbeDependencyGraph,
+        skipping the components whose upstream is down.
+    - shutdown_executor: Shuts the thread pool down, it will be re-created if it is needed again.
+    """
+    DEFAULT_MAX_CONCURRENCY = 20
+
+    def __init__(self, max_concurrency: int = None):
+        self.max_concurrency = max_concurrency or self.DEFAULT_MAX_CONCURRENCY
+        self._executor = None
+        self._abandoned_probes = 0
+        self._abandoned_lock = Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Thread pool the blocking probes are run in, created on first use with max_concurrency workers.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix='probe')
+        return self._executor
+
+    @property
+    def abandoned_probes(self) -> int:
+        """
+        Number of probes that were still running when they stopped being awaited (see gather_until)
+        and still hold an executor thread.
+        """
+        with self._abandoned_lock:
+            return self._abandoned_probes
+
+    def _probe_finished(self, _future) -> None:
+        with self._abandoned_lock:
+            self._abandoned_probes -= 1
+
+    async def run_blocking(self, limiter: asyncio.Semaphore, func, *args, **kwargs):
+        """
+        Runs the blocking callable func in the executor once limiter allows it and returns its result.
+        If this coroutine is cancelled while func runs, func still runs to its end on its thread
+         and is counted in abandoned_probes until then; the limiter is released straight away.
+        """
+        async with limiter:
+            future = self.executor.submit(partial(func, *args, **kwargs))
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                if not future.cancel():
+                    with self._abandoned_lock:
+                        self._abandoned_probes += 1
+                    future.add_done_callback(self._probe_finished)
+                raise
+
+    @staticmethod
+    async def gather_until(deadline: float, *aws) -> List:
+        """
+        Awaits every awaitable in aws concurrently until the perf_counter() time deadline and returns their
+        results in order. The result of probes still running at the deadline is ProbeState.TIMEOUT.
+         Their asyncio tasks are cancelled, but a probe that already runs in the executor is not stopped:
+          it keeps its thread until its own timeout (see run_blocking and abandoned_probes).
+        Exceptions raised by finished probes are re-raised, as asyncio.gather would.
+        """
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=max(deadline - perf_counter(), 0))
+        for task in pending:
+            task.cancel()
+        return [task.result() if task in done else ProbeState.TIMEOUT for task in tasks]
+
+    async def run_dependency_waves(self, graph: ProbeDependencyGraph, limiter: asyncio.Semaphore, deadline: float,
+                                   checks: List[Hashable], batched: Mapping[str, Callable] = None,
+                                   per_check: Mapping[str, Callable] = None,
+                                   state_of: Callable = None) -> Dict[Hashable, Dict[str, object]]:
+        """
+        Probes every check wave by wave of graph and returns a dictionary of check to a dictionary of component
+        to result.
+        batched maps a component to a blocking function probing many checks at once (given the list of checks,
+         returning a dictionary of check to result), per_check maps a component to a blocking function probing
+          a single check. Every probe of a wave runs concurrently, until the perf_counter() time deadline
+           (see gather_until).
+        state_of(component, result) gives the ProbeState of a result (defaults to ProbeCycle.probe_state).
+         A check whose component depends on a component that is not up is not probed for it,
+          its result is ProbeState.UNREACHABLE.
+        """
+        batched, per_check = dict(batched or {}), dict(per_check or {})
+        if state_of is None:
+            state_of = ProbeCycle.probe_state
+        results = {check: {} for check in checks}
+        states = {check: {} for check in checks}
+        for wave in graph.waves:
+            jobs = []
+            for component in wave:
+                ready = []
+                for check in checks:
+                    if graph.is_blocked(component, states[check]):
+                        results[check][component] = states[check][component] = ProbeState.UNREACHABLE
+                    elif component in batched or component in per_check:
+                        ready.append(check)
+                if not ready:
+                    continue
+                if component in batched:
+                    jobs.append((component, ready, self.run_blocking(limiter, batched[component], ready)))
+                else:
+                    jobs.extend((component, [check], self.run_blocking(limiter, per_check[component], check))
+                                for check in ready)
+            outcomes = await self.gather_until(deadline, *[job for _, _, job in jobs])
+            for (component, job_checks, _), outcome in zip(jobs, outcomes):
+                for check in job_checks:
+                    if component in batched and outcome is not ProbeState.TIMEOUT:
+                        result = outcome[check]
+                    else:
+                        result = outcome
+                    results[check][component] = result
+                    states[check][component] = state_of(component, result)
+        return results
+
+    def shutdown_executor(self) -> None:
+        """
+        Shuts down the thread pool without waiting for running probes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class AsyncWebServerStatusCheck(AsyncProbeRunner, WebServerStatusCheck):
+    """
+    WebServerStatusCheck that checks all of its ports concurrently using asyncio.
+
+    The blocking probes (ping and the pooled http requests) are run in a thread pool,
+    and the number of probes in flight at any one time is bounded by max_concurrency.
+
+    Methods:
+    - run_cycle: Coroutine that checks every (or the given) server port once, concurrently, and returns the snapshots.
+    - run: Coroutine that runs run_cycle for the ports the scheduler says are due, forever,
+        printing and logging the results after each cycle.
+    - AsyncMainLoop: Blocking entry point equivalent to MainLoop, that runs `run` in a new event loop.
+    """
+    def __init__(self, server_web_address: str, silent_run: bool = False,
+                 use_msg_box_on_error: bool = True, max_concurrency: int = None, **kwargs):
+        WebServerStatusCheck.__init__(self, server_web_address, silent_run=silent_run,
+                                      use_msg_box_on_error=use_msg_box_on_error, **kwargs)
+        AsyncProbeRunner.__init__(self, max_concurrency=max_concurrency)
+
+    async def run_cycle(self, limiter: asyncio.Semaphore = None,
+                        ports: List[int] = None) -> Dict[int, ProbeSnapshot]:
+        """
+        Checks every server port (or only the given ports) once and returns a dictionary of the new snapshots
+        keyed by port.
+        The local machine status is read from the shared local uplink cache and the server machine is pinged once
+         for the whole cycle, while the http request for each port is made concurrently with the ping.
+          Probes only run once the components they depend on (see probe_dependencies) are up, so while the local
+           machine is offline neither the ping nor any http request is made.
+          Probes still running when cycle_deadline runs out are reported as TIMEOUT, their threads are left to
+           finish on their own timeout (see gather_until).
+          The snapshots are stored as they would be by take_snapshot.
+        A limiter can be passed in to share one concurrency limit between several checkers.
+        """
+        if limiter is None:
+            limiter = asyncio.Semaphore(self.max_concurrency)
+        timestamp = datetime.datetime.now().timestamp()
+        deadline = perf_counter() + self.cycle_deadline
+        http_timeout = tuple(min(t, self.cycle_deadline) for t in self.http_timeout)
+        ports = list(self.server_ports if ports is None else ports)
+
+        results = await self.run_dependency_waves(
+            self.probe_dependencies, limiter, deadline, ports,
+            batched={'local': lambda checks: dict.fromkeys(checks, self.local_machine_rtt),
+                     'machine': lambda checks: dict.fromkeys(checks, self.ping_rtt())},
+            per_check={'server': lambda port: self.timed_server_response(self.full_address_for_port(port),
+                                                                         timeout=http_timeout)},
+            state_of=self.probe_state)
+
+        snapshots = {}
+        for port in ports:
+            snapshots[port] = self.store_snapshot(self.build_snapshot(port, timestamp, results[port]['local'],
+                                                                      results[port]['machine'],
+                                                                      results[port]['server']))
+        return snapshots
+
+    async def run(self, sleep_time: int = 120):
+        """
+        Schedules every server port on the scheduler, every check_interval (defaults to sleep_time) seconds,
+         then runs run_cycle forever for the ports that are due, printing (unless silent) and logging each snapshot
+          and reporting it back to the scheduler. Waiting for the next due port does not block the event loop.
+        """
+        if not self.silent_run:
+            print("Checking for initial server availability.\n")
+        self.just_started = False
+        for port in self.server_ports:
+            self.scheduler.add(port, self.check_interval or sleep_time)
+        while True:
+            await self.scheduler.wait_until_next()
+            snapshots = await self.run_cycle(ports=self.scheduler.due())
+            for port, snapshot in snapshots.items():
+                if not self.silent_run and self.print_status:
+                    print(self.render_status_string(snapshot))
+                self.log_status(snapshot)
+                self.record_scheduled_result(port)
+
+    def AsyncMainLoop(self, sleep_time: int = 120):
+        """
+        Blocking equivalent of MainLoop that runs the concurrent `run` coroutine in a new event loop.
+        If a KeyboardInterrupt is caught, it prints a termination message and exits.
+         Any other exceptions are logged as errors and re-raised.
+        """
+        try:
+            self.local_uplink.start()
+            if self.metrics_server is not None:
+                self.metrics_server.start()
+            if self.log_queue is not None:
+                self.log_queue.start(self.LOGGER)
+            asyncio.run(self.run(sleep_time))
+        except KeyboardInterrupt:
+            print("CTRL-C detected, quitting...")
+            sys_exit(-1)
+        except Exception as e:
+            self.LOGGER.error(e, exc_info=True)
+            raise e
+        finally:
+            self.local_uplink.stop()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+            if self.log_queue is not None:
+                self.log_queue.stop()
+            self.shutdown_executor()
+            self.alert_dispatcher.close()
+            if self.history_store is not None:
+                self.history_store.close()
@@ -0,0 +1,280 @@
+"""
+CheckScheduler.py
+
+Decides when each check runs. Every check keeps its own fixed cadence (the time a check takes does not
+push the next one back), start times are jittered so that many targets do not all fire at once,
+and the cadence adapts to the target's health: faster while it is down or flapping,
+slower once it has been down for a long time.
+"""
+import heapq
+from itertools import count
+from math import floor
+from random import Random
+from time import monotonic, sleep
+from typing import Callable, Dict, Hashable, List, Optional
+
+try:
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+except (ModuleNotFoundError, ImportError):
+    from LazyLogger import LazyLogger
+
+
+class ScheduledCheck:
+    """
+    Class ScheduledCheck:
+    Scheduling state of a single check.
+
+    Attributes:
+    - key: What is checked, e.g. a port or a (target name, port) tuple.
+    - interval: The base seconds between checks.
+    - anchor: The un-jittered time the check is (or was last) due, the cadence is kept relative to it.
+    - due: The jittered time the check is due.
+    - down_since: Time the check first failed in the current outage, None while it is up.
+    - backoff: Multiplier applied to interval once the target is considered dead.
+    - flapping: Whether the latest result reported the target as flapping.
+    - missed: Number of deadlines missed so far.
+    - sequence: Identifies the check's current heap entry, older entries for the same key are skipped.
+    """
+    __slots__ = ('key', 'interval', 'anchor', 'due', 'down_since', 'backoff', 'flapping', 'missed', 'sequence')
+
+    def __init__(self, key: Hashable, interval: float, anchor: float):
+        self.key = key
+        self.interval = interval
+        self.anchor = anchor
+        self.due = anchor
+        self.down_since: Optional[float] = None
+        self.backoff = 1.0
+        self.flapping = False
+        self.missed = 0
+        self.sequence = 0
+
+
+class CheckScheduler:
+    """
+    Class CheckScheduler:
+    Heap based scheduler keeping a fixed, jittered cadence per check.
+
+    Each check is added with its own interval, and the first runs are spread randomly over the jitter window.
+    After every run, record_result() schedules the next one at the previous due time plus the effective interval,
+    so the time the check took does not make the period drift. The effective interval is:
+    - interval * down_factor while the target is down (for less than dead_after seconds) or flapping,
+    - interval * backoff once the target has been down for dead_after seconds, with backoff doubling after every
+      further failure up to max_backoff,
+    - interval otherwise.
+    Every due time gets up to +/- jitter * effective interval of random jitter.
+    Whether a target is down or flapping is what record_result is told, the scheduler does not work it out itself:
+    checkers pass the confirmed state of the port from their PortStateMachine, so the cadence follows the same
+    hysteresis and flap detection as the alerts, and a single failed check does not speed it up.
+
+    A check that starts a whole effective interval or more after it was due has missed its deadline;
+    the missed slots are skipped rather than run back to back, counted in missed_deadlines and passed to
+    on_missed_deadline (which logs a warning).
+
+    Parameters:
+    - interval (float): Default seconds between checks. Defaults to DEFAULT_INTERVAL.
+    - jitter (float): Fraction of the interval used as random jitter. Defaults to DEFAULT_JITTER.
+    - down_factor (float): Interval multiplier while down or flapping. Defaults to DEFAULT_DOWN_FACTOR.
+    - min_interval (float): Shortest interval the down_factor can bring a check down to. Defaults to DEFAULT_MIN_INTERVAL.
+    - dead_after (float): Seconds down after which a target is backed off. Defaults to DEFAULT_DEAD_AFTER.
+    - max_backoff (float): Largest interval multiplier for dead targets. Defaults to DEFAULT_MAX_BACKOFF.
+    - clock (Callable[[], float]): Monotonic clock in seconds. Defaults to time.monotonic.
+    - seed: Seed for the jitter, for reproducible schedules.
+
+    Properties:
+    - missed_deadlines: Dictionary of key to the number of deadlines that check has missed.
+
+    Methods:
+    - add / remove: Add a check (optionally with its own interval) or remove it.
+    - effective_interval: The interval a check is currently scheduled at.
+    - is_flapping: Whether a check's target was reported as flapping.
+    - time_until_next: Seconds until the next check is due.
+    - due: Takes every check that is due off the schedule and returns their keys.
+    - record_result: Records whether a check found its target down (or flapping), and schedules its next run.
+    - sleep_until_next / wait_until_next: Blocking and asyncio waits for the next due check,
+        or for IDLE_INTERVAL seconds while nothing is scheduled.
+    - run: Runs a blocking check function for every due check, forever.
+    """
+    LOGGER = LazyLogger()
+    DEFAULT_INTERVAL = 120.0
+    DEFAULT_JITTER = 0.1
+    DEFAULT_DOWN_FACTOR = 0.25
+    DEFAULT_MIN_INTERVAL = 5.0
+    DEFAULT_DEAD_AFTER = 3600.0
+    DEFAULT_MAX_BACKOFF = 8.0
+    # seconds waited while nothing is scheduled, so loops around the waits never spin.
+    IDLE_INTERVAL = 1.0
+
+    def __init__(self, interval: float = None, jitter: float = None, down_factor: float = None,
+                 min_interval: float = None, dead_after: float = None, max_backoff: float = None,
+                 clock: Callable[[], float] = monotonic, seed=None):
+        self.interval = interval or self.DEFAULT_INTERVAL
+        self.jitter = self.DEFAULT_JITTER if jitter is None else jitter
+        self.down_factor = down_factor or self.DEFAULT_DOWN_FACTOR
+        self.min_interval = self.DEFAULT_MIN_INTERVAL if min_interval is None else min_interval
+        self.dead_after = dead_after or self.DEFAULT_DEAD_AFTER
+        self.max_backoff = max_backoff or self.DEFAULT_MAX_BACKOFF
+        self.clock = clock
+        self._random = Random(seed)
+        self._checks: Dict[Hashable, ScheduledCheck] = {}
+        self._heap = []
+        self._sequence = count()
+
+    @property
+    def missed_deadlines(self) -> Dict[Hashable, int]:
+        """
+        Dictionary of key to the number of deadlines that check has missed, for checks that missed any.
+        """
+        return {key: check.missed for key, check in self._checks.items() if check.missed}
+
+    def __len__(self):
+        return len(self._checks)
+
+    def __contains__(self, key):
+        return key in self._checks
+
+    def _push(self, check: ScheduledCheck) -> None:
+        check.sequence = next(self._sequence)
+        heapq.heappush(self._heap, (check.due, check.sequence, check.key))
+
+    def _jittered(self, anchor: float, interval: float) -> float:
+        return anchor + self._random.uniform(-self.jitter, self.jitter) * interval
+
+    def add(self, key: Hashable, interval: float = None) -> ScheduledCheck:
+        """
+        Adds a check for key, run every interval seconds (defaults to the scheduler's interval).
+        Its first run is placed at a random point within the first jitter * interval seconds, to spread checks out.
+        Adding a key that is already scheduled replaces it.
+        """
+        interval = interval or self.interval
+        check = ScheduledCheck(key, interval, self.clock() + self._random.uniform(0, self.jitter * interval))
+        self._checks[key] = check
+        self._push(check)
+        return check
+
+    def remove(self, key: Hashable) -> None:
+        """
+        Removes the check for key, if there is one.
+        """
+        self._checks.pop(key, None)
+
+    def is_flapping(self, key: Hashable) -> bool:
+        """
+        True if the latest result recorded for the check reported its target as flapping.
+        """
+        return self._checks[key].flapping
+
+    def effective_interval(self, key: Hashable) -> float:
+        """
+        The number of seconds between runs of the check at the moment, after adapting to the target's health.
+        """
+        check = self._checks[key]
+        if check.backoff > 1:
+            return check.interval * check.backoff
+        if check.down_since is not None or self.is_flapping(key):
+            return max(check.interval * self.down_factor, min(self.min_interval, check.interval))
+        return check.interval
+
+    def time_until_next(self) -> Optional[float]:
+        """
+        Seconds until the next check is due (0 if one is already due), None if nothing is scheduled.
+        """
+        while self._heap:
+            due, sequence, key = self._heap[0]
+            check = self._checks.get(key)
+            if check is None or check.sequence != sequence:
+                heapq.heappop(self._heap)
+                continue
+            return max(due - self.clock(), 0.0)
+        return None
+
+    def due(self) -> List[Hashable]:
+        """
+        Takes every check that is due off the schedule and returns their keys, most overdue first.
+        Each of them must be passed to record_result once it has run, to be scheduled again.
+        Checks that start a whole effective interval or more late are reported through on_missed_deadline.
+        """
+        now = self.clock()
+        keys = []
+        while self._heap and self._heap[0][0] <= now:
+            due, sequence, key = heapq.heappop(self._heap)
+            check = self._checks.get(key)
+            if check is None or check.sequence != sequence:
+                continue
+            lateness = now - due
+            interval = self.effective_interval(key)
+            if lateness >= interval:
+                missed = int(floor(lateness / interval))
+                check.missed += missed
+                self.on_missed_deadline(key, lateness, missed)
+            keys.append(key)
+        return keys
+
+    def record_result(self, key: Hashable, is_down: bool, flapping: bool = False) -> Optional[ScheduledCheck]:
+        """
+        Records whether the check for key found its target down, and whether it is flapping, adapts the check's
+        interval and schedules its next run on its fixed cadence, skipping any slots that have already passed.
+        Checkers pass the confirmed state of the port (see PortState.is_down and PortState.FLAPPING),
+         not the result of the single check.
+        Returns the check, or None if it was removed while it ran.
+        """
+        check = self._checks.get(key)
+        if check is None:
+            return None
+        now = self.clock()
+        check.flapping = flapping
+        if not is_down:
+            check.down_since = None
+            check.backoff = 1.0
+        elif check.down_since is None:
+            check.down_since = now
+        elif now - check.down_since >= self.dead_after:
+            check.backoff = min(max(check.backoff * 2, 2.0), self.max_backoff)
+
+        interval = self.effective_interval(key)
+        anchor = check.anchor + interval
+        if anchor <= now:
+            anchor += (floor((now - anchor) / interval) + 1) * interval
+        check.anchor = anchor
+        check.due = self._jittered(anchor, interval)
+        self._push(check)
+        return check
+
+    def on_missed_deadline(self, key: Hashable, lateness: float, missed: int) -> None:
+        """
+        Called when a check starts lateness seconds after it was due, having missed missed runs.
+        Logs a warning, override to report it elsewhere.
+        """
+        self.LOGGER.warning("check %s started %.1f seconds late, missing %d scheduled run(s)", key, lateness, missed)
+
+    def sleep_until_next(self) -> None:
+        """
+        Blocks until the next check is due, or for IDLE_INTERVAL seconds if nothing is scheduled.
+        """
+        wait = self.time_until_next()
+        if wait is None:
+            wait = self.IDLE_INTERVAL
+        if wait:
+            sleep(wait)
+
+    async def wait_until_next(self) -> None:
+        """
+        Waits, without blocking the event loop, until the next check is due,
+        or for IDLE_INTERVAL seconds if nothing is scheduled.
+        """
+        # asyncio is only imported by the asyncio checkers, so a plain import of the package does not load it.
+        import asyncio
+        wait = self.time_until_next()
+        if wait is None:
+            wait = self.IDLE_INTERVAL
+        if wait:
+            await asyncio.sleep(wait)
+
+    def run(self, check_func: Callable[[Hashable], bool]) -> None:
+        """
+        Runs forever, calling check_func(key) for every check as it comes due and recording the result.
+        check_func must return True if the target was found down.
+        """
+        while self._checks:
+            self.sleep_until_next()
+            for key in self.due():
+                self.record_result(key, check_func(key))
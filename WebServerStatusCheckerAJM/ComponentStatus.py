@@ -2,6 +2,21 @@ from re import fullmatch
 from abc import abstractmethod
 import requests
 
+try:
+    from WebServerStatusCheckerAJM.DNSCache import DNSCache, is_resolution_error
+    from WebServerStatusCheckerAJM.HTTPSessionPool import HTTPSessionPool
+    from WebServerStatusCheckerAJM.LocalUplinkCache import LocalUplinkCache
+    from WebServerStatusCheckerAJM.Reachability import ReachabilityProbe
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+    from WebServerStatusCheckerAJM.ValidatorCache import ValidatorCache
+except (ModuleNotFoundError, ImportError):
+    from DNSCache import DNSCache, is_resolution_error
+    from HTTPSessionPool import HTTPSessionPool
+    from LocalUplinkCache import LocalUplinkCache
+    from Reachability import ReachabilityProbe
+    from ProbeState import ProbeState
+    from ValidatorCache import ValidatorCache
+
 
 class ComponentStatus:
     """
@@ -15,12 +30,36 @@ class ComponentStatus:
     - _machine_status: Status of the machine.
     - _local_machine_ping_host: Default IP address for pinging.
     - _local_machine_status: Status of the local machine.
+    - http_pool_size: Maximum number of connections kept open to the server host.
+    - http_keep_alive: Whether connections to the server host are kept open between checks.
+    - http_connect_timeout: Seconds to wait for a connection to the server. Defaults to DEFAULT_HTTP_CONNECT_TIMEOUT.
+    - http_read_timeout: Seconds to wait for the server to send data. Defaults to DEFAULT_HTTP_READ_TIMEOUT.
+    - page_check_mode: How the page is requested, one of PAGE_CHECK_MODES:
+        'get' downloads the whole page, 'stream' (the default) only reads the headers up front and lets the caller
+         read as much of the body as it needs, 'head' only asks for the headers.
+    - conditional_requests: Whether probe cycles send If-None-Match / If-Modified-Since headers
+        from the validator_cache, so an unchanged page is answered with a header-only 304 Not Modified.
+    - reachability: ReachabilityProbe used to ping hosts. Its TCP fallback counts a refused connection as an
+        answer unless ping_refused_is_up is False (see ReachabilityProbe).
+    - local_uplink_hosts: Extra upstream hosts checked together with the local_machine_ping_host.
+        With the TCP fallback a local firewall that REJECTs outgoing traffic makes every one of them answer,
+         so set ping_refused_is_up to False there.
+    - local_uplink_ttl: Seconds the local machine status is cached for.
+    - local_uplink_quorum: Number of upstream hosts that must answer for the local machine to be up.
 
     Methods:
     - ping: Abstract method for checking network connectivity.
     - server_full_address: Abstract method for getting the server address.
+    - request_server: Makes a GET request to an address, returning the response (or None) and a ProbeState.
+    - get_server_response: Makes a GET request to an address, returning None if the server can not be reached.
+    - release_response: Returns a streamed response's connection to the pool, or closes it.
 
     Properties:
+    - http_session: The pooled keep-alive session shared by every check against the server host.
+    - validator_cache: The process-wide ValidatorCache of page validators and titles.
+    - dns_cache: The process-wide DNSCache the http and ping probes resolve host names through.
+    - local_uplink: The process-wide LocalUplinkCache shared by every checker with the same upstream hosts.
+    - local_machine_rtt: Cached round trip time to the upstream hosts, None if the local machine is offline.
     - server_status: Property to get the server status based on connection to the server.
     - page_status: Property to get the web page status based on server status and web page availability.
     - machine_status: Property to get the machine status based on local machine status and network connectivity.
@@ -28,8 +67,34 @@ class ComponentStatus:
     - local_machine_status: Property to get the local machine status based on the network connectivity to a specified host.
     """
     LOGGER = None
+    DEFAULT_HTTP_CONNECT_TIMEOUT = 5.0
+    DEFAULT_HTTP_READ_TIMEOUT = 10.0
+    PAGE_CHECK_MODES = ('stream', 'head', 'get')
+    # streamed bodies with at most this many unread bytes left are drained so the connection can be re-used.
+    RELEASE_DRAIN_LIMIT = 64 * 1024
 
-    def __init__(self):
+    def __init__(self, http_pool_size: int = None, http_keep_alive: bool = None,
+                 http_connect_timeout: float = None, http_read_timeout: float = None,
+                 page_check_mode: str = 'stream', conditional_requests: bool = True,
+                 ping_timeout: float = None, ping_method: str = 'auto', local_uplink_hosts: list = None,
+                 local_uplink_ttl: float = None, local_uplink_quorum: int = 1, ping_refused_is_up: bool = True):
+        self.http_pool_size = http_pool_size
+        self.http_keep_alive = http_keep_alive
+        self.http_connect_timeout = http_connect_timeout or self.DEFAULT_HTTP_CONNECT_TIMEOUT
+        self.http_read_timeout = http_read_timeout or self.DEFAULT_HTTP_READ_TIMEOUT
+        if page_check_mode not in self.PAGE_CHECK_MODES:
+            try:
+                raise ValueError(f"page_check_mode must be one of {self.PAGE_CHECK_MODES}")
+            except ValueError as e:
+                self.LOGGER.error(e, exc_info=True)
+                raise e
+        self.page_check_mode = page_check_mode
+        self._conditional_requests = conditional_requests
+        self.reachability = ReachabilityProbe(timeout=ping_timeout, method=ping_method,
+                                              refused_is_up=ping_refused_is_up)
+        self.local_uplink_hosts = local_uplink_hosts or []
+        self.local_uplink_ttl = local_uplink_ttl
+        self.local_uplink_quorum = local_uplink_quorum
         self._server_status = None
         self._page_status = None
         self._machine_status = None
@@ -53,6 +118,117 @@ class ComponentStatus:
         Subclasses must implement this property.
         """
 
+    @property
+    @abstractmethod
+    def server_web_address(self):
+        """
+        This method is an abstract property that represents the web address of the server.
+        Subclasses must implement this property.
+        """
+
+    @property
+    def http_session(self) -> requests.Session:
+        """
+        The pooled keep-alive session for the server host.
+        It is shared with every other checker that targets the same host with the same pool settings,
+        so open connections are re-used between checks instead of being opened for every request.
+        """
+        return HTTPSessionPool.get_session(self.server_web_address, pool_size=self.http_pool_size,
+                                           keep_alive=self.http_keep_alive)
+
+    @property
+    def http_timeout(self) -> tuple:
+        """
+        The (connect, read) timeout used for every http request to the server.
+        """
+        return self.http_connect_timeout, self.http_read_timeout
+
+    @property
+    def conditional_requests(self) -> bool:
+        """
+        Whether probe cycles send the validators from validator_cache with their requests.
+        """
+        return self._conditional_requests
+
+    @conditional_requests.setter
+    def conditional_requests(self, value: bool):
+        """
+        Turns conditional requests on or off for the following probe cycles.
+        """
+        self._conditional_requests = value
+
+    @property
+    def validator_cache(self) -> ValidatorCache:
+        """
+        The process-wide ValidatorCache holding the ETag, Last-Modified and title of every checked page.
+        """
+        return ValidatorCache.shared()
+
+    @property
+    def dns_cache(self) -> DNSCache:
+        """
+        The process-wide DNSCache that both the http requests and the pings resolve host names through.
+        """
+        return DNSCache.shared()
+
+    def request_server(self, address: str, timeout: tuple = None, conditional: bool = False) -> tuple:
+        """
+        Requests the given address using the pooled http_session, according to page_check_mode.
+        In 'stream' mode only the status line and headers have been read when this returns,
+         in 'head' mode a HEAD request is made (falling back to 'stream' if the server does not allow HEAD).
+        If conditional is True, the validators cached for address are sent with the GET request,
+         so the caller must be ready to handle a 304 Not Modified response.
+        Returns a tuple of the response (None if there was none) and a ProbeState:
+         UP if the server answered, TIMEOUT if the connection or the read timed out,
+          DNS_FAILURE if the server host name could not be resolved, DOWN otherwise.
+        timeout defaults to http_timeout.
+        """
+        timeout = timeout or self.http_timeout
+        try:
+            if self.page_check_mode == 'head':
+                response = self.http_session.head(address, timeout=timeout, allow_redirects=True)
+                if response.status_code not in (405, 501):
+                    return response, ProbeState.UP
+            headers = self.validator_cache.conditional_headers(address) if conditional else None
+            return (self.http_session.get(address, timeout=timeout, headers=headers,
+                                          stream=self.page_check_mode != 'get'),
+                    ProbeState.UP)
+        except requests.exceptions.Timeout:
+            return None, ProbeState.TIMEOUT
+        except requests.exceptions.ConnectionError as e:
+            if is_resolution_error(e):
+                return None, ProbeState.DNS_FAILURE
+            return None, ProbeState.DOWN
+
+    def release_response(self, response) -> None:
+        """
+        Finishes with a response. If a streamed body has at most RELEASE_DRAIN_LIMIT bytes left it is read
+         to the end so the kept-alive connection goes back to the pool, otherwise the connection is closed
+          rather than downloading the rest of a large page.
+        The response is always closed, which is harmless for a body that was already read.
+        """
+        if response is None:
+            return
+        content_length = response.headers.get('Content-Length', '')
+        remaining = None
+        if response.raw is not None and content_length.isdigit():
+            remaining = int(content_length) - response.raw.tell()
+        try:
+            if remaining is not None and remaining <= self.RELEASE_DRAIN_LIMIT:
+                for _ in response.iter_content(8192):
+                    pass
+        except requests.exceptions.RequestException:
+            pass
+        finally:
+            response.close()
+
+    def get_server_response(self, address: str):
+        """
+        Makes a GET request to the given address using the pooled http_session and returns the response.
+        Returns None if a connection to the server could not be made or timed out.
+        """
+        return self.request_server(address)[0]
+
     @property
     def server_status(self):
         """
@@ -71,12 +247,9 @@ class ComponentStatus:
          it is set to False in case of a ConnectionError.
          The status of the server is returned.
         """
-        try:
-            requests.get(self.server_full_address)
-            self._server_status = True
-        except requests.exceptions.ConnectionError:
-            self._server_status = False
-
+        r = self.get_server_response(self.server_full_address)
+        self.release_response(r)
+        self._server_status = r is not None
         return self._server_status
 
     @property
@@ -91,19 +264,16 @@ class ComponentStatus:
     def page_status(self):
         """
         Getter method for retrieving the current status of a web page.
-        It checks the server status and attempts to make a GET request to the server's full address.
+        It makes a single GET request to the server's full address.
         If the request is successful (status code 200), the page status is set to True.
          If there is a connection error during the request, the page status is set to False.
           Finally, it returns the page status.
         """
         self._page_status = False
-        if self.server_status:
-            try:
-                r = requests.get(self.server_full_address)
-                if r.ok:
-                    self._page_status = True
-            except requests.exceptions.ConnectionError:
-                self._page_status = False
+        r = self.get_server_response(self.server_full_address)
+        if r is not None and r.ok:
+            self._page_status = True
+        self.release_response(r)
         return self._page_status
 
     @property
@@ -177,14 +347,31 @@ class ComponentStatus:
         """
         return self._local_machine_status
 
+    @property
+    def local_uplink(self) -> LocalUplinkCache:
+        """
+        The process-wide LocalUplinkCache for the local_machine_ping_host and any local_uplink_hosts.
+        Every checker configured with the same upstream hosts, ttl and quorum shares the same cache,
+         so the local machine's connectivity is only measured once per ttl for the whole process.
+        """
+        return LocalUplinkCache.shared((self.local_machine_ping_host, *self.local_uplink_hosts),
+                                       ttl=self.local_uplink_ttl, quorum=self.local_uplink_quorum,
+                                       reachability=self.reachability)
+
+    @property
+    def local_machine_rtt(self):
+        """
+        The cached round trip time in seconds to the fastest upstream host, None if the local machine is offline.
+        """
+        return self.local_uplink.rtt
+
     @local_machine_status.getter
     def local_machine_status(self):
         """
-        Getter method to retrieve the status of the local machine by pinging a specified host.
-        Returns True if the ping is successful, False otherwise.
+        Getter method to retrieve the status of the local machine from the shared local_uplink cache.
+        Returns True if enough of the upstream hosts answered, False otherwise.
+        Only the very first read blocks on the network, later reads return the cached value
+         while it is refreshed in the background.
         """
-        if self.ping(host=self.local_machine_ping_host):
-            self._local_machine_status = True
-        else:
-            self._local_machine_status = False
+        self._local_machine_status = self.local_uplink.is_up
         return self._local_machine_status
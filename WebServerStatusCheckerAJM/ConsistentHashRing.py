@@ -0,0 +1,96 @@
+"""
+ConsistentHashRing.py
+
+Consistent hashing of keys (target names) onto nodes (worker processes), so every key stays on the same node
+and adding or removing a node only moves the keys of that node.
+"""
+import hashlib
+from bisect import bisect, insort
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+
+class ConsistentHashRing:
+    """
+    Class ConsistentHashRing:
+    Hash ring with `replicas` virtual points per node, which spreads the keys evenly over the nodes.
+    Hashes are taken with blake2b, so a key maps to the same node in every process and on every run
+    (unlike the built-in hash(), which is salted per process).
+
+    Parameters:
+    - nodes (Iterable[Hashable]): Initial nodes, each must have a unique str().
+    - replicas (int): Virtual points per node. Defaults to DEFAULT_REPLICAS.
+
+    Properties:
+    - nodes: The nodes on the ring, in the order they were added.
+
+    Methods:
+    - add / remove: Add a node to, or remove a node from, the ring.
+    - node_for: The node a key belongs to.
+    - assign: Dictionary of node to the keys that belong to it, for many keys at once.
+    """
+    DEFAULT_REPLICAS = 160
+
+    def __init__(self, nodes: Iterable[Hashable] = (), replicas: int = None):
+        self.replicas = replicas or self.DEFAULT_REPLICAS
+        self._nodes: List[Hashable] = []
+        self._points: List[Tuple[int, str]] = []
+        self._node_by_name: Dict[str, Hashable] = {}
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @staticmethod
+    def hash_key(key: str) -> int:
+        """
+        Returns the position of key on the ring, a stable 64 bit hash (unlike hash(), which is salted per process).
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+    @property
+    def nodes(self) -> List[Hashable]:
+        """
+        The nodes on the ring, in the order they were added.
+        """
+        return list(self._nodes)
+
+    def add(self, node: Hashable) -> None:
+        """
+        Adds node to the ring. Raises a ValueError if a node with the same str() is already on it.
+        """
+        name = str(node)
+        if name in self._node_by_name:
+            raise ValueError(f"{node!r} is already on the ring")
+        self._node_by_name[name] = node
+        self._nodes.append(node)
+        for replica in range(self.replicas):
+            insort(self._points, (self.hash_key(f'{name}#{replica}'), name))
+
+    def remove(self, node: Hashable) -> None:
+        """
+        Removes node from the ring, its keys move to the nodes that follow its points.
+        """
+        name = str(node)
+        del self._node_by_name[name]
+        self._nodes.remove(node)
+        self._points = [point for point in self._points if point[1] != name]
+
+    def node_for(self, key: str) -> Hashable:
+        """
+        Returns the node key belongs to: the owner of the first point at or after the hash of key.
+        Raises a LookupError if the ring has no nodes.
+        """
+        if not self._points:
+            raise LookupError("the ring has no nodes")
+        index = bisect(self._points, (self.hash_key(key), '')) % len(self._points)
+        return self._node_by_name[self._points[index][1]]
+
+    def assign(self, keys: Iterable[str]) -> Dict[Hashable, List[str]]:
+        """
+        Returns a dictionary of every node to the keys (in their given order) that belong to it.
+        """
+        assignment = {node: [] for node in self._nodes}
+        for key in keys:
+            assignment[self.node_for(key)].append(key)
+        return assignment
@@ -0,0 +1,253 @@
+"""
+DNSCache.py
+
+Caches host name resolution for the http and ping probes, so a hostname is not resolved again through
+the system resolver for every check, and a resolver hiccup is reported as a DNS failure rather than
+looking like the server machine is down.
+"""
+import ipaddress
+import socket
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+
+def is_resolution_error(error: BaseException) -> bool:
+    """
+    True if error was caused by a host name that could not be resolved (a socket.gaierror anywhere in its causes),
+    for example a requests ConnectionError wrapping a urllib3 NameResolutionError.
+    """
+    seen = set()
+    pending = [error]
+    while pending:
+        error = pending.pop()
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+        if isinstance(error, socket.gaierror):
+            return True
+        pending.extend([error.__cause__, error.__context__, getattr(error, 'reason', None)])
+        pending.extend(arg for arg in getattr(error, 'args', ()) if isinstance(arg, BaseException))
+    return False
+
+
+class DNSEntry(NamedTuple):
+    """
+    One cached resolution.
+
+    Fields:
+    - addresses: The resolved addresses, in the order the resolver returned them, empty for a failure.
+    - error: (errno, message) of the resolution error for a failure, None otherwise.
+    - refresh_at: monotonic() time after which a read starts refreshing the entry in the background.
+    - expires_at: monotonic() time after which the entry is no longer used.
+    """
+    addresses: Tuple[str, ...]
+    error: Optional[Tuple[int, str]]
+    refresh_at: float
+    expires_at: float
+
+
+class DNSCache:
+    """
+    Class DNSCache:
+    Thread safe, size bounded (least recently used entries are dropped first) cache of host name resolutions.
+
+    Successful resolutions are kept for their TTL, failures for negative_ttl, so a name that does not resolve
+    is not looked up again on every check either. Once refresh_ahead of an entry's TTL has passed, the next read
+    still gets the cached addresses but starts a refresh in the background, so hosts checked regularly never wait
+    on the resolver; a refresh that fails keeps the old addresses until they expire.
+    Concurrent lookups of the same host share one resolution. IP address literals are never cached.
+
+    The system resolver (getaddrinfo) does not report record TTLs, so its results are kept for ttl seconds.
+    A resolver that does report them (returning (addresses, ttl)) can be passed in, its TTLs are honoured,
+    bounded by MIN_TTL and MAX_TTL.
+
+    Parameters:
+    - ttl (float): Seconds a resolution is kept when the resolver gives no TTL. Defaults to DEFAULT_TTL.
+    - negative_ttl (float): Seconds a failed resolution is kept. Defaults to DEFAULT_NEGATIVE_TTL.
+    - refresh_ahead (float): Fraction (0 to 1) of the TTL after which reads refresh an entry in the background.
+        Defaults to DEFAULT_REFRESH_AHEAD.
+    - max_entries (int): Maximum number of hosts cached. Defaults to DEFAULT_MAX_ENTRIES.
+    - resolver (Callable): Function of a host name returning (addresses, ttl or None), raising an OSError
+        if the name can not be resolved. Defaults to system_resolver.
+
+    Class Methods:
+    - shared: The process-wide cache, shared by the http and ping probes of every checker.
+
+    Static Methods:
+    - system_resolver: Resolves a host name with getaddrinfo.
+    - is_ip_address: True if a host is an IP address literal.
+
+    Methods:
+    - resolve: The addresses of a host, raising socket.gaierror if it does not resolve.
+    - resolve_ipv4: The first IPv4 address of a host.
+    - get: The cached DNSEntry of a host, or None.
+    - clear: Forgets every entry.
+    """
+    DEFAULT_TTL = 60.0
+    DEFAULT_NEGATIVE_TTL = 10.0
+    DEFAULT_REFRESH_AHEAD = 0.8
+    DEFAULT_MAX_ENTRIES = 4096
+    MIN_TTL = 1.0
+    MAX_TTL = 3600.0
+
+    _shared = None
+    _shared_lock = Lock()
+
+    def __init__(self, ttl: float = None, negative_ttl: float = None, refresh_ahead: float = None,
+                 max_entries: int = None, resolver: Callable = None):
+        self.ttl = ttl or self.DEFAULT_TTL
+        self.negative_ttl = self.DEFAULT_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.refresh_ahead = refresh_ahead or self.DEFAULT_REFRESH_AHEAD
+        if not 0 < self.refresh_ahead <= 1:
+            raise ValueError("refresh_ahead must be between 0 and 1")
+        self.max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+        self.resolver = resolver or self.system_resolver
+        self._entries: 'OrderedDict[str, DNSEntry]' = OrderedDict()
+        self._in_flight: Dict[str, Event] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def shared(cls) -> 'DNSCache':
+        """
+        Returns the process-wide DNSCache, creating it on first use.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+        return cls._shared
+
+    @staticmethod
+    def system_resolver(host: str) -> Tuple[Tuple[str, ...], None]:
+        """
+        Resolves host with the system resolver. Returns its distinct addresses and None, as no TTL is available.
+        """
+        infos = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        return tuple(dict.fromkeys(info[4][0] for info in infos)), None
+
+    @staticmethod
+    def is_ip_address(host: str) -> bool:
+        """
+        True if host is an IPv4 or IPv6 address, which is used as it is instead of being resolved.
+        """
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return True
+
+    def get(self, host: str) -> Optional[DNSEntry]:
+        """
+        Returns the cached DNSEntry of host, even if it expired, or None if there is none.
+        """
+        with self._lock:
+            return self._entries.get(host.lower())
+
+    def clear(self) -> None:
+        """
+        Forgets every cached entry, so every host is resolved again on its next lookup.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def resolve(self, host: str) -> Tuple[str, ...]:
+        """
+        Returns the addresses of host, from the cache while its entry has not expired.
+        Raises a socket.gaierror if host does not resolve, or did not resolve within the last negative_ttl seconds.
+        """
+        if self.is_ip_address(host):
+            return (host,)
+        host = host.lower()
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(host)
+            if entry is not None and now < entry.expires_at:
+                self._entries.move_to_end(host)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+        if entry is None:
+            entry = self._resolve_once(host)
+        elif entry.error is None and now >= entry.refresh_at:
+            self._refresh_in_background(host)
+        return self._answer(entry)
+
+    def resolve_ipv4(self, host: str) -> str:
+        """
+        Returns the first IPv4 address of host. Raises a socket.gaierror if host has none.
+        """
+        for address in self.resolve(host):
+            if ':' not in address:
+                return address
+        raise socket.gaierror(socket.EAI_NONAME, f"{host} has no IPv4 address")
+
+    @staticmethod
+    def _answer(entry: DNSEntry) -> Tuple[str, ...]:
+        if entry.error is not None:
+            raise socket.gaierror(*entry.error)
+        return entry.addresses
+
+    def _resolve_once(self, host: str) -> DNSEntry:
+        """
+        Resolves host now, or waits for the resolution already running for it.
+        """
+        with self._lock:
+            in_flight = self._in_flight.get(host)
+            if in_flight is None:
+                self._in_flight[host] = Event()
+        if in_flight is not None:
+            in_flight.wait()
+            entry = self.get(host)
+            if entry is not None and monotonic() < entry.expires_at:
+                return entry
+            return self._lookup(host, keep_on_failure=False)
+        try:
+            return self._lookup(host, keep_on_failure=False)
+        finally:
+            with self._lock:
+                self._in_flight.pop(host).set()
+
+    def _refresh_in_background(self, host: str) -> None:
+        with self._lock:
+            if host in self._in_flight:
+                return
+            self._in_flight[host] = Event()
+
+        def _run():
+            try:
+                self._lookup(host, keep_on_failure=True)
+            finally:
+                with self._lock:
+                    self._in_flight.pop(host).set()
+
+        Thread(target=_run, name='dns-refresh', daemon=True).start()
+
+    def _lookup(self, host: str, keep_on_failure: bool) -> DNSEntry:
+        """
+        Resolves host with the resolver and stores the result. If keep_on_failure is True and the lookup fails,
+        the current entry is kept (until it expires) instead of being replaced by the failure.
+        """
+        try:
+            addresses, ttl = self.resolver(host)
+            if not addresses:
+                raise socket.gaierror(socket.EAI_NONAME, f"{host} has no addresses")
+            ttl = self.ttl if ttl is None else min(max(ttl, self.MIN_TTL), self.MAX_TTL)
+            now = monotonic()
+            entry = DNSEntry(tuple(addresses), None, now + ttl * self.refresh_ahead, now + ttl)
+        except OSError as e:
+            now = monotonic()
+            entry = DNSEntry((), (e.errno or socket.EAI_FAIL, str(e)), now + self.negative_ttl,
+                             now + self.negative_ttl)
+        with self._lock:
+            current = self._entries.get(host)
+            if entry.error is not None and keep_on_failure and current is not None and current.error is None:
+                return current
+            self._entries[host] = entry
+            self._entries.move_to_end(host)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
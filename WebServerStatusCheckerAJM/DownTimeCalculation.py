@@ -7,59 +7,81 @@ calculates the downtime of the Django/server etc. instance
 
 import datetime
 from abc import abstractmethod
+from typing import Hashable
+
+try:
+    from WebServerStatusCheckerAJM.PortStateMachine import PortState, PortStateMachine
+except (ModuleNotFoundError, ImportError):
+    from PortStateMachine import PortState, PortStateMachine
 
 
 class DownTimeCalculation:
     """
     Class representing a DownTimeCalculation instance for tracking system downtime.
+    Downtime is read from a PortStateMachine fed with every probe result, so none of these properties
+    run a check: a port that has not been checked yet is not down.
+
+    __init__(self, state_machine: PortStateMachine = None, fail_threshold: int = None, recover_threshold: int = None,
+             flap_history: int = None, flap_threshold: int = None):
+        Initializes the DownTimeCalculation instance with the given (possibly shared) state machine,
+        or a new one with the given hysteresis and flap detection settings (see PortStateMachine).
 
-    __init__(self):
-        Initializes the DownTimeCalculation instance.
+    state_key(self):
+        Abstract property, the key of the active port in the state machine.
+
+    port_state(self) -> PortState:
+        The current PortState of the active port.
 
     down_timestamp(self):
-        Property method to get the timestamp when the instance was last marked as down.
-        Sets the timestamp when the instance is down and not already set. Returns None if not down.
+        Property method to get the timestamp of the check that found the active port down.
+        Returns None if it is not down.
 
     length_of_time_down(self) -> datetime.timedelta:
-        Returns the length of time the system has been down. Returns None if the system is not currently down.
+        Returns the length of time the system has been down. Returns a zero timedelta if the system is not currently down.
         Calculated by subtracting the down timestamp from the current timestamp.
     """
-    def __init__(self):
-        self._length_of_time_down = datetime.timedelta()
-        self._down_timestamp: datetime.datetime or None = None
+    def __init__(self, state_machine: PortStateMachine = None, fail_threshold: int = None,
+                 recover_threshold: int = None, flap_history: int = None, flap_threshold: int = None):
+        if state_machine is None:
+            state_machine = PortStateMachine(fail_threshold=fail_threshold, recover_threshold=recover_threshold,
+                                             flap_history=flap_history, flap_threshold=flap_threshold)
+        self.state_machine = state_machine
 
     @property
     @abstractmethod
-    def is_down(self) -> bool:
+    def state_key(self) -> Hashable:
+        """
+        This method represents a property that should be implemented by subclasses to return the key
+        of the active port in state_machine.
+        """
+
+    @property
+    def port_state(self) -> PortState:
         """
-        This method represents a property that should be implemented by subclasses to determine
-        if an object is in down state or not. It should return a boolean value.
+        The current PortState of the active port, UNKNOWN if it has not been checked yet.
         """
+        return self.state_machine.state(self.state_key)
 
     @property
     def down_timestamp(self):
         """
-        Property method to get the timestamp when the instance was last marked as down.
-        It sets the timestamp when the instance is down and the timestamp is not already set.
-        If the instance is not marked as down, it sets the timestamp value to None.
+        Property method to get the timestamp of the check that found the active port down.
+        It stays the same while the port stays down, even if the reason changes (e.g. from DOWN to TIMEOUT).
+        If the port is not down, it returns None.
 
         Returns the last down timestamp value.
         """
-        if self.is_down and not self._down_timestamp:
-            self._down_timestamp = datetime.datetime.now().timestamp()
-        elif not self.is_down:
-            self._down_timestamp = None
-        return self._down_timestamp
+        return self.state_machine.down_since(self.state_key)
 
     @property
     def length_of_time_down(self) -> datetime.timedelta:
         """
-        Return the length of time the system has been down. If the system is currently not down, returns None.
+        Return the length of time the system has been down. If the system is currently not down,
+        returns a zero timedelta.
         Calculated by subtracting the down timestamp from the current timestamp.
         """
-        if not self.is_down:
-            pass
-        else:
-            self._length_of_time_down = (datetime.timedelta(seconds=datetime.datetime.now().timestamp())
-                                         - datetime.timedelta(seconds=self.down_timestamp))
-        return self._length_of_time_down
+        down_timestamp = self.down_timestamp
+        if down_timestamp is None:
+            return datetime.timedelta()
+        return (datetime.timedelta(seconds=datetime.datetime.now().timestamp())
+                - datetime.timedelta(seconds=down_timestamp))
@@ -0,0 +1,399 @@
+"""
+FleetMonitor.py
+
+Monitors many web servers from one object and one event loop.
+The local connectivity check, the machine pings, the http connection pool
+and the check loop are all shared between every target instead of being repeated per target.
+"""
+import asyncio
+import datetime
+from sys import exit as sys_exit
+from time import perf_counter
+from typing import Dict, List, Tuple, Union
+
+try:
+    from WebServerStatusCheckerAJM.WebServerStatusCheckerAJM import WebServerStatusCheck
+    from WebServerStatusCheckerAJM.AsyncWebServerStatusCheck import AsyncProbeRunner
+    from WebServerStatusCheckerAJM.ProbeCycle import ProbeSnapshot
+    from WebServerStatusCheckerAJM.Reachability import ReachabilityProbe
+    from WebServerStatusCheckerAJM.LocalUplinkCache import LocalUplinkCache
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+    from WebServerStatusCheckerAJM.AlertDispatcher import AlertDispatcher
+    from WebServerStatusCheckerAJM.CheckScheduler import CheckScheduler
+    from WebServerStatusCheckerAJM.StatusHistory import StatusHistory
+    from WebServerStatusCheckerAJM.SQLiteHistoryStore import SQLiteHistoryStore
+    from WebServerStatusCheckerAJM.UptimeAnalytics import SLAReport, UptimeAnalytics
+    from WebServerStatusCheckerAJM.ProbeMetrics import ProbeMetrics
+    from WebServerStatusCheckerAJM.MetricsServer import MetricsServer
+    from WebServerStatusCheckerAJM.DNSCache import DNSCache
+    from WebServerStatusCheckerAJM.StatusLogQueue import StatusLogQueue
+    from WebServerStatusCheckerAJM.PortStateMachine import PortState, PortStateMachine
+    from WebServerStatusCheckerAJM.ProbeDependencyGraph import ProbeDependencyGraph
+except (ModuleNotFoundError, ImportError):
+    from WebServerStatusCheckerAJM import WebServerStatusCheck
+    from AsyncWebServerStatusCheck import AsyncProbeRunner
+    from ProbeCycle import ProbeSnapshot
+    from Reachability import ReachabilityProbe
+    from LocalUplinkCache import LocalUplinkCache
+    from ProbeState import ProbeState
+    from LazyLogger import LazyLogger
+    from AlertDispatcher import AlertDispatcher
+    from CheckScheduler import CheckScheduler
+    from StatusHistory import StatusHistory
+    from SQLiteHistoryStore import SQLiteHistoryStore
+    from UptimeAnalytics import SLAReport, UptimeAnalytics
+    from ProbeMetrics import ProbeMetrics
+    from MetricsServer import MetricsServer
+    from DNSCache import DNSCache
+    from StatusLogQueue import StatusLogQueue
+    from PortStateMachine import PortState, PortStateMachine
+    from ProbeDependencyGraph import ProbeDependencyGraph
+
+
+class FleetMonitor(AsyncProbeRunner):
+    """
+    Class FleetMonitor:
+    Checks a whole fleet of web servers in one concurrent cycle.
+
+    Each target is given either as a server web address string, or as a dictionary of
+    WebServerStatusCheck keyword arguments that must include 'server_web_address' and may include
+    'name', 'server_ports', 'server_web_page', 'server_titles', 'use_friendly_server_names' and 'check_interval'
+    (seconds between checks of that target, defaults to the sleep_time given to run or MainLoop).
+
+    Per cycle, the local machine status is read from the LocalUplinkCache shared by every target,
+    every distinct server host is checked in a single batch sweep (see ReachabilityProbe.rtt_many),
+    no matter how many targets or ports each host has, and one http request is made
+    per target and port through the shared HTTPSessionPool. All of it runs concurrently,
+    bounded by max_concurrency, as far as probe_dependencies allows: hosts are only pinged and servers only
+    requested once the local machine is known to be up, so an outage of the local network costs no probes at all.
+
+    Properties:
+    - targets: Dictionary of target name to the WebServerStatusCheck holding that target's configuration and state.
+    - results: Dictionary of target name to a dictionary of that target's latest snapshot per port.
+    - down_targets: Dictionary of target name to the list of ports that were down in the latest cycle.
+    - history: Dictionary of target name to that target's StatusHistory.
+    - history_store: The SQLiteHistoryStore shared by every target, if a history_db path or a history_store was given.
+    - uptime_analytics: The UptimeAnalytics shared by every target.
+    - state_machine: The PortStateMachine shared by every target, keyed by (target name, port), built from the
+        fail_threshold, recover_threshold, flap_history and flap_threshold keyword arguments unless one is passed in.
+    - probe_dependencies: The ProbeDependencyGraph shared by every target, built from the probe_dependencies
+        keyword argument unless one is passed in.
+    - metrics: The ProbeMetrics shared by every target, served by MainLoop at /metrics if a metrics_port is given.
+    - log_queue: The StatusLogQueue that MainLoop writes the status logs of every target through,
+        None if async_logging is False.
+    - alert_dispatcher: The AlertDispatcher shared by every target, built from the alert_* keyword arguments
+        (see WebServerStatusCheck) unless one is passed in as alert_dispatcher.
+
+    Checks are timed by a CheckScheduler (see the scheduler keyword argument), which keeps a fixed, jittered cadence
+    per target and port, checks down or flapping targets more often and backs off from targets that stay dead.
+
+    Methods:
+    - run_cycle: Coroutine that checks every (or the given) target and port once, concurrently, and returns the results.
+    - check_once: Blocking wrapper around run_cycle.
+    - ping_many / ping_checks: Sweep many hosts, or the hosts of many checks, in one batch.
+    - sla_report: SLAReports of every target and port over a window.
+    - MainLoop: Checks the whole fleet every sleep_time seconds, printing and logging the results.
+    """
+    LOGGER = LazyLogger()
+    DEFAULT_MAX_CONCURRENCY = 50
+    TARGET_KEYS = ('name', 'server_web_address', 'server_ports', 'server_web_page',
+                   'server_titles', 'use_friendly_server_names', 'check_interval')
+
+    def __init__(self, targets: List[Union[str, dict]], silent_run: bool = False,
+                 local_machine_ping_host: str = None, max_concurrency: int = None,
+                 cycle_deadline: float = None, **kwargs):
+        AsyncProbeRunner.__init__(self, max_concurrency=max_concurrency)
+        self.cycle_deadline = cycle_deadline or WebServerStatusCheck.DEFAULT_CYCLE_DEADLINE
+        self._silent_run = silent_run
+        self._checker_kwargs = kwargs
+        self._targets: Dict[str, WebServerStatusCheck] = {}
+        self._local_machine_ping_host = local_machine_ping_host
+        if not kwargs.get('alert_dispatcher', None):
+            # build the one dispatcher the whole fleet shares, instead of one (with its own threads) per target.
+            kwargs['alert_dispatcher'] = AlertDispatcher.from_kwargs(**kwargs)
+        self.alert_dispatcher: AlertDispatcher = kwargs['alert_dispatcher']
+        # compared to None, an empty CheckScheduler is falsy.
+        self.scheduler: CheckScheduler = kwargs.pop('scheduler', None)
+        if self.scheduler is None:
+            self.scheduler = CheckScheduler()
+        if not kwargs.get('history_store', None) and kwargs.get('history_db', None):
+            kwargs['history_store'] = SQLiteHistoryStore(kwargs['history_db'])
+        self.history_store: SQLiteHistoryStore = kwargs.get('history_store', None)
+        kwargs.setdefault('uptime_analytics', UptimeAnalytics())
+        self.uptime_analytics: UptimeAnalytics = kwargs['uptime_analytics']
+        if kwargs.get('state_machine', None) is None:
+            kwargs['state_machine'] = PortStateMachine(fail_threshold=kwargs.get('fail_threshold', None),
+                                                       recover_threshold=kwargs.get('recover_threshold', None),
+                                                       flap_history=kwargs.get('flap_history', None),
+                                                       flap_threshold=kwargs.get('flap_threshold', None))
+        self.state_machine: PortStateMachine = kwargs['state_machine']
+        if not isinstance(kwargs.get('probe_dependencies', None), ProbeDependencyGraph):
+            kwargs['probe_dependencies'] = ProbeDependencyGraph(kwargs.get('probe_dependencies', None))
+        self.probe_dependencies: ProbeDependencyGraph = kwargs['probe_dependencies']
+        if kwargs.get('metrics', None) is None:
+            kwargs['metrics'] = ProbeMetrics()
+        self.metrics: ProbeMetrics = kwargs['metrics']
+        # one server for the whole fleet, the checkers must not each try to bind the port.
+        metrics_port, metrics_host = kwargs.pop('metrics_port', None), kwargs.pop('metrics_host', None)
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, port=metrics_port, host=metrics_host)
+        self.log_queue = None
+        if kwargs.get('async_logging', True):
+            kwargs['log_queue'] = kwargs.get('log_queue', None) or StatusLogQueue.shared()
+            self.log_queue: StatusLogQueue = kwargs['log_queue']
+        self.reachability = ReachabilityProbe(timeout=kwargs.get('ping_timeout', None),
+                                              method=kwargs.get('ping_method', 'auto'),
+                                              refused_is_up=kwargs.get('ping_refused_is_up', True))
+
+        for target in targets:
+            self.add_target(target)
+
+        if not self.silent_run:
+            print(f"Initialized fleet monitor with {len(self._targets)} target(s)...")
+
+    @property
+    def silent_run(self):
+        """
+        Whether the fleet monitor should run without printing anything.
+        """
+        return self._silent_run
+
+    @property
+    def targets(self) -> Dict[str, WebServerStatusCheck]:
+        """
+        Dictionary of target name to the WebServerStatusCheck for that target.
+        """
+        return self._targets
+
+    def add_target(self, target: Union[str, dict]) -> WebServerStatusCheck:
+        """
+        Adds a target to the fleet and returns its checker.
+        target can be a server web address or a dictionary of target settings (see the class docstring).
+        Raises a TypeError if the target is not a string or a dictionary,
+         and a ValueError if a dictionary target has no server_web_address or has unknown keys.
+        """
+        if isinstance(target, str):
+            target = {'server_web_address': target}
+        elif not isinstance(target, dict):
+            try:
+                raise TypeError("targets must be server web addresses or dictionaries of target settings")
+            except TypeError as e:
+                self.LOGGER.error(e, exc_info=True)
+                raise e
+        unknown_keys = set(target) - set(self.TARGET_KEYS)
+        if 'server_web_address' not in target or unknown_keys:
+            try:
+                raise ValueError(f"targets must have a server_web_address and only the keys {self.TARGET_KEYS},"
+                                 f" got {list(target)}")
+            except ValueError as e:
+                self.LOGGER.error(e, exc_info=True)
+                raise e
+
+        target = dict(target)
+        name = target.pop('name', None)
+        checker_kwargs = {'use_msg_box_on_error': False, **self._checker_kwargs, **target}
+        checker = WebServerStatusCheck(silent_run=True, init_msg=False, target_name=name, **checker_kwargs)
+        if self._local_machine_ping_host:
+            checker.local_machine_ping_host = self._local_machine_ping_host
+        self._targets[checker.target_name] = checker
+        return checker
+
+    @property
+    def local_machine_ping_host(self) -> str:
+        """
+        Host used to check the local machine's connectivity for the whole fleet.
+        """
+        return self._local_machine_ping_host or '8.8.8.8'
+
+    @property
+    def local_uplink(self) -> LocalUplinkCache:
+        """
+        The LocalUplinkCache for the fleet, which is the same shared cache every target's checker reads from.
+        """
+        return LocalUplinkCache.shared((self.local_machine_ping_host,
+                                        *(self._checker_kwargs.get('local_uplink_hosts', None) or [])),
+                                       ttl=self._checker_kwargs.get('local_uplink_ttl', None),
+                                       quorum=self._checker_kwargs.get('local_uplink_quorum', 1),
+                                       reachability=self.reachability)
+
+    @property
+    def local_machine_rtt(self) -> float or None:
+        """
+        Cached round trip time to the local machine's upstream host(s), None if the local machine is offline.
+        """
+        return self.local_uplink.rtt
+
+    @property
+    def results(self) -> Dict[str, Dict[int, ProbeSnapshot]]:
+        """
+        Dictionary of target name to the latest snapshot of each of that target's ports.
+        """
+        return {name: dict(checker.snapshots) for name, checker in self._targets.items()}
+
+    @property
+    def history(self) -> Dict[str, StatusHistory]:
+        """
+        Dictionary of target name to the StatusHistory of that target's checks.
+        """
+        return {name: checker.history for name, checker in self._targets.items()}
+
+    @property
+    def down_targets(self) -> Dict[str, List[int]]:
+        """
+        Dictionary of target name to the ports of that target that were down in their latest snapshot.
+        Targets with no down ports are left out.
+        """
+        down = {}
+        for name, checker in self._targets.items():
+            ports = [port for port, snapshot in checker.snapshots.items() if snapshot.is_down]
+            if ports:
+                down[name] = ports
+        return down
+
+    def ping_rtt(self, host: str) -> float or None:
+        """
+        Returns the round trip time to host in seconds, None if it is unreachable,
+        or ProbeState.DNS_FAILURE if its name could not be resolved.
+        """
+        return self.ping_many([host])[host]
+
+    def ping_many(self, hosts: List[str]) -> Dict[str, float or None]:
+        """
+        Sweeps every host in one batch and returns a dictionary of host to round trip time in seconds,
+        None for unreachable hosts and ProbeState.DNS_FAILURE for hosts whose name could not be resolved
+        (through the shared DNSCache). This is the single reachability path used for the whole fleet.
+        """
+        results, addresses = {}, {}
+        for host in hosts:
+            try:
+                addresses[host] = DNSCache.shared().resolve_ipv4(host)
+            except OSError:
+                results[host] = ProbeState.DNS_FAILURE
+        address_rtt = self.reachability.rtt_many(set(addresses.values()))
+        results.update({host: address_rtt[address] for host, address in addresses.items()})
+        return results
+
+    def ping_checks(self, checks: List[Tuple[str, int]]) -> Dict[Tuple[str, int], float or None]:
+        """
+        Sweeps the distinct server hosts of checks ((target name, port) pairs) in one batch (see ping_many)
+        and returns a dictionary of every check to the round trip time of its host.
+        """
+        host_rtt = self.ping_many(sorted({self._targets[name].server_host for name, _ in checks}))
+        return {(name, port): host_rtt[self._targets[name].server_host] for name, port in checks}
+
+    async def run_cycle(self, checks: List[Tuple[str, int]] = None) -> Dict[str, Dict[int, ProbeSnapshot]]:
+        """
+        Checks every target and port (or only the given (target name, port) checks) once, concurrently,
+        and returns the new snapshots as a dictionary of target name to a dictionary of snapshot per port.
+        The local machine status comes from the shared local uplink cache and every distinct server host
+         is checked in one batch sweep, while the http requests run concurrently alongside it.
+        Probes only run once the components they depend on (see probe_dependencies) are up: while the local machine
+         is offline no host is pinged and no http request is made, the whole fleet is reported as UNREACHABLE.
+        Probes still running when cycle_deadline runs out are reported as TIMEOUT, their threads are left to finish
+         on their own timeout (see AsyncProbeRunner.gather_until).
+        """
+        limiter = asyncio.Semaphore(self.max_concurrency)
+        timestamp = datetime.datetime.now().timestamp()
+        deadline = perf_counter() + self.cycle_deadline
+
+        if checks is None:
+            checks = [(name, port) for name, checker in self._targets.items() for port in checker.server_ports]
+        requests_to_make = [(name, port) for name, port in checks if name in self._targets]
+
+        def request_server(check: Tuple[str, int]):
+            checker = self._targets[check[0]]
+            return checker.timed_server_response(checker.full_address_for_port(check[1]),
+                                                 timeout=tuple(min(t, self.cycle_deadline)
+                                                               for t in checker.http_timeout))
+
+        results = await self.run_dependency_waves(
+            self.probe_dependencies, limiter, deadline, requests_to_make,
+            batched={'local': lambda batch: dict.fromkeys(batch, self.local_machine_rtt),
+                     'machine': self.ping_checks},
+            per_check={'server': request_server})
+
+        cycle_results = {name: {} for name, _ in requests_to_make}
+        for name, port in requests_to_make:
+            checker, result = self._targets[name], results[(name, port)]
+            snapshot = checker.build_snapshot(port, timestamp, result['local'], result['machine'], result['server'])
+            cycle_results[name][port] = checker.store_snapshot(snapshot)
+        return cycle_results
+
+    def sla_report(self, start: float, end: float = None) -> Dict[str, Dict[int, SLAReport]]:
+        """
+        Returns a dictionary of target name to a dictionary of SLAReport per port, between start and end
+        (defaults to now), for every target and port in the fleet.
+        """
+        reports = {name: {} for name in self._targets}
+        keys = [(name, port) for name, checker in self._targets.items() for port in checker.server_ports]
+        for (name, port), report in self.uptime_analytics.fleet_report(start, end, keys=keys).items():
+            reports[name][port] = report
+        return reports
+
+    def check_once(self) -> Dict[str, Dict[int, ProbeSnapshot]]:
+        """
+        Runs a single fleet cycle in a new event loop and returns its results.
+        """
+        return asyncio.run(self.run_cycle())
+
+    def log_results(self, cycle_results: Dict[str, Dict[int, ProbeSnapshot]]) -> None:
+        """
+        Prints (unless silent) and logs every snapshot in cycle_results through the checker of its target.
+        """
+        for name, snapshots in cycle_results.items():
+            checker = self._targets[name]
+            for snapshot in snapshots.values():
+                if not self.silent_run:
+                    print(checker.render_status_string(snapshot))
+                checker.log_status(snapshot)
+
+    async def run(self, sleep_time: int = 120):
+        """
+        Schedules every target and port on the scheduler, every check_interval of its target (defaults to sleep_time)
+         seconds, then runs run_cycle forever for the checks that are due, logging the results and reporting them
+          back to the scheduler. Checks that come due together share one cycle.
+        """
+        for name, checker in self._targets.items():
+            for port in checker.server_ports:
+                self.scheduler.add((name, port), checker.check_interval or sleep_time)
+        while True:
+            await self.scheduler.wait_until_next()
+            cycle_results = await self.run_cycle(self.scheduler.due())
+            self.log_results(cycle_results)
+            for name, snapshots in cycle_results.items():
+                checker = self._targets[name]
+                for port in snapshots:
+                    state = checker.state_for_port(port)
+                    self.scheduler.record_result((name, port), state.is_down, flapping=state is PortState.FLAPPING)
+
+    def MainLoop(self, sleep_time: int = 120):
+        """
+        Checks the whole fleet every sleep_time seconds from a single event loop.
+        If a KeyboardInterrupt is caught, it prints a termination message and exits.
+         Any other exceptions are logged as errors and re-raised.
+        """
+        try:
+            self.local_uplink.start()
+            if self.metrics_server is not None:
+                self.metrics_server.start()
+            if self.log_queue is not None:
+                self.log_queue.start(self.LOGGER)
+            asyncio.run(self.run(sleep_time))
+        except KeyboardInterrupt:
+            print("CTRL-C detected, quitting...")
+            sys_exit(-1)
+        except Exception as e:
+            self.LOGGER.error(e, exc_info=True)
+            raise e
+        finally:
+            self.local_uplink.stop()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+            if self.log_queue is not None:
+                self.log_queue.stop()
+            self.shutdown_executor()
+            self.alert_dispatcher.close()
+            if self.history_store is not None:
+                self.history_store.close()
@@ -0,0 +1,91 @@
+"""
+HTTPSessionPool.py
+
+Keeps one pooled, keep-alive requests.Session per target host so that repeated checks
+re-use open connections (and the TLS sessions negotiated on them)
+instead of opening a new connection for every request.
+Sessions use a TimedHTTPAdapter, so every response carries the time each phase of its request took.
+"""
+from threading import Lock
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    from WebServerStatusCheckerAJM.TimedHTTPAdapter import TimedHTTPAdapter
+except (ModuleNotFoundError, ImportError):
+    from TimedHTTPAdapter import TimedHTTPAdapter
+
+
+class HTTPSessionPool:
+    """
+    Class HTTPSessionPool:
+    Process-wide registry of requests.Session objects, one per target host and pool configuration.
+    Every checker that targets the same host with the same configuration shares the same session,
+    and therefore the same pool of open connections.
+
+    Attributes:
+    - DEFAULT_POOL_SIZE: Default maximum number of connections kept open per host.
+    - DEFAULT_KEEP_ALIVE: Whether connections are kept open between requests by default.
+
+    Class Methods:
+    - get_session: Get (or create) the shared session for the host of a given address.
+    - close_all: Close every session in the pool, closing all of their open connections.
+    """
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_KEEP_ALIVE = True
+
+    _sessions: Dict[Tuple[str, str, int, bool], requests.Session] = {}
+    _lock = Lock()
+
+    @staticmethod
+    def host_key(address: str) -> Tuple[str, str]:
+        """
+        Returns the (scheme, hostname) pair for the given address, which is what sessions are pooled on.
+        """
+        split_address = urlsplit(address)
+        return split_address.scheme.lower(), (split_address.hostname or '').lower()
+
+    @classmethod
+    def _new_session(cls, pool_size: int, keep_alive: bool) -> requests.Session:
+        session = requests.Session()
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    @classmethod
+    def get_session(cls, address: str, pool_size: int = None, keep_alive: bool = None) -> requests.Session:
+        """
+        Returns the shared session for the host of the given address, creating it if needed.
+
+        Parameters:
+            address (str): Any url on the target host.
+            pool_size (int): Maximum number of connections to keep open to the host. Defaults to DEFAULT_POOL_SIZE.
+            keep_alive (bool): Whether to keep connections open between requests. Defaults to DEFAULT_KEEP_ALIVE.
+        """
+        if pool_size is None:
+            pool_size = cls.DEFAULT_POOL_SIZE
+        if keep_alive is None:
+            keep_alive = cls.DEFAULT_KEEP_ALIVE
+        key = (*cls.host_key(address), pool_size, keep_alive)
+        with cls._lock:
+            session = cls._sessions.get(key)
+            if session is None:
+                session = cls._new_session(pool_size, keep_alive)
+                cls._sessions[key] = session
+        return session
+
+    @classmethod
+    def close_all(cls) -> None:
+        """
+        Closes every pooled session and empties the pool.
+        """
+        with cls._lock:
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+        for session in sessions:
+            session.close()
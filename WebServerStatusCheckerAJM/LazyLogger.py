@@ -0,0 +1,30 @@
+"""
+LazyLogger.py
+
+Creates the package logger the first time it is used instead of when a class is defined,
+so importing the package does not create log folders or file handlers as a side effect.
+"""
+from threading import Lock
+
+from EasyLoggerAJM import EasyLogger
+
+
+class LazyLogger:
+    """
+    Class LazyLogger:
+    Descriptor that returns the shared EasyLogger logger, creating it on first access.
+    Every LazyLogger shares the same logger, so it is only set up (and its file handlers created) once per process.
+
+    Usage:
+        class Example:
+            LOGGER = LazyLogger()
+    """
+    _logger = None
+    _lock = Lock()
+
+    def __get__(self, instance, owner):
+        if LazyLogger._logger is None:
+            with LazyLogger._lock:
+                if LazyLogger._logger is None:
+                    LazyLogger._logger = EasyLogger.UseLogger().logger
+        return LazyLogger._logger
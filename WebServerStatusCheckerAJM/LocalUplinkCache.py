@@ -0,0 +1,195 @@
+"""
+LocalUplinkCache.py
+
+Caches whether this machine can reach the outside world, so the same fact is not re-measured
+for every port and every target. The cache is shared process-wide and refreshed in the background.
+"""
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    from WebServerStatusCheckerAJM.Reachability import ReachabilityProbe
+except (ModuleNotFoundError, ImportError):
+    from Reachability import ReachabilityProbe
+
+
+class LocalUplinkCache:
+    """
+    Class LocalUplinkCache:
+    Time-to-live cache of the local machine's connectivity, measured against one or more upstream hosts.
+
+    The uplink is considered up when at least `quorum` of the hosts answer. Reads never wait on the network
+    once a first measurement exists: a stale value is returned while a refresh runs in the background,
+    and start() keeps the value fresh from a background thread so that reads are never stale at all.
+    As the cache is shared (see shared), start() and stop() are counted: the background thread runs until
+    every start() has been matched by a stop().
+
+    Parameters:
+    - hosts (Iterable[str]): Upstream hosts to check.
+    - ttl (float): Seconds a measurement is considered fresh. Defaults to DEFAULT_TTL.
+    - quorum (int): Number of hosts that must answer for the uplink to be up. Defaults to 1.
+    - reachability (ReachabilityProbe): Probe used to check the hosts. Defaults to a new ReachabilityProbe.
+
+    Class Methods:
+    - shared: Get (or create) the process-wide cache for a given hosts/ttl/quorum configuration.
+    - clear_shared: Stop and forget every shared cache.
+
+    Properties:
+    - is_up: Whether the uplink is up, according to the latest measurement.
+    - rtt: Fastest round trip time of the latest measurement, None if the uplink is down.
+    - is_stale: Whether the latest measurement is older than ttl.
+
+    Methods:
+    - refresh: Measure the uplink now (blocking).
+    - start / stop: Start refreshing every ttl seconds from a background thread (or count one more user),
+        or count one user less and stop refreshing once there are none (or at once, with force).
+    """
+    DEFAULT_TTL = 30.0
+
+    _shared: Dict[Tuple[Tuple[str, ...], float, int], 'LocalUplinkCache'] = {}
+    _shared_lock = Lock()
+
+    def __init__(self, hosts: Iterable[str], ttl: float = None, quorum: int = 1,
+                 reachability: ReachabilityProbe = None):
+        self.hosts = tuple(dict.fromkeys(hosts))
+        if not self.hosts:
+            raise ValueError("at least one upstream host is required")
+        if not 1 <= quorum <= len(self.hosts):
+            raise ValueError(f"quorum must be between 1 and the number of hosts ({len(self.hosts)})")
+        self.ttl = ttl or self.DEFAULT_TTL
+        self.quorum = quorum
+        self.reachability = reachability or ReachabilityProbe()
+
+        self._rtt: Optional[float] = None
+        self._is_up: Optional[bool] = None
+        self._measured_at: Optional[float] = None
+        self._refresh_lock = Lock()
+        self._refreshing = False
+        self._stop_event: Optional[Event] = None
+        self._thread: Optional[Thread] = None
+        self._users = 0
+        self._thread_lock = Lock()
+
+    @classmethod
+    def shared(cls, hosts: Iterable[str], ttl: float = None, quorum: int = 1,
+               reachability: ReachabilityProbe = None) -> 'LocalUplinkCache':
+        """
+        Returns the process-wide cache for the given configuration, creating it if needed.
+        reachability is only used when the cache is created.
+        """
+        hosts = tuple(dict.fromkeys(hosts))
+        key = (hosts, ttl or cls.DEFAULT_TTL, quorum)
+        with cls._shared_lock:
+            cache = cls._shared.get(key)
+            if cache is None:
+                cache = cls(hosts, ttl=ttl, quorum=quorum, reachability=reachability)
+                cls._shared[key] = cache
+        return cache
+
+    @classmethod
+    def clear_shared(cls) -> None:
+        """
+        Stops the background refresh of every shared cache and forgets them.
+        """
+        with cls._shared_lock:
+            caches = list(cls._shared.values())
+            cls._shared.clear()
+        for cache in caches:
+            cache.stop(force=True)
+
+    def refresh(self) -> bool:
+        """
+        Checks every upstream host in one sweep and stores the result. Returns whether the uplink is up.
+        """
+        results = self.reachability.rtt_many(self.hosts)
+        answered = [rtt for rtt in results.values() if rtt is not None]
+        is_up = len(answered) >= self.quorum
+        self._rtt = min(answered) if is_up else None
+        self._is_up = is_up
+        self._measured_at = monotonic()
+        return is_up
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        True if there is no measurement yet, or the latest one is older than ttl.
+        """
+        return self._measured_at is None or monotonic() - self._measured_at >= self.ttl
+
+    def _refresh_in_background(self) -> None:
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                self.refresh()
+            finally:
+                with self._refresh_lock:
+                    self._refreshing = False
+
+        Thread(target=_run, name='local-uplink-refresh', daemon=True).start()
+
+    def _current(self) -> bool:
+        """
+        Makes sure there is a measurement to read, only blocking if there has never been one.
+        """
+        if self._measured_at is None:
+            with self._refresh_lock:
+                if self._measured_at is None:
+                    self.refresh()
+        elif self.is_stale:
+            self._refresh_in_background()
+        return self._is_up
+
+    @property
+    def is_up(self) -> bool:
+        """
+        Whether at least quorum upstream hosts answered in the latest measurement.
+        """
+        return self._current()
+
+    @property
+    def rtt(self) -> Optional[float]:
+        """
+        Fastest round trip time of the latest measurement in seconds, None if the uplink is down.
+        """
+        self._current()
+        return self._rtt
+
+    def start(self) -> None:
+        """
+        Starts refreshing the measurement every ttl seconds from a background daemon thread.
+        If already started, only counts one more user.
+        """
+        with self._thread_lock:
+            self._users += 1
+            if self._thread is not None:
+                return
+            # every thread gets its own event, so a thread that is still winding down can not be revived.
+            stop_event = Event()
+
+            def _run():
+                while not stop_event.is_set():
+                    self.refresh()
+                    stop_event.wait(self.ttl)
+
+            self._stop_event = stop_event
+            self._thread = Thread(target=_run, name='local-uplink-cache', daemon=True)
+            self._thread.start()
+
+    def stop(self, force: bool = False) -> None:
+        """
+        Counts one user less, and stops the background refresh thread once no user is left.
+        With force, stops it straight away whatever the number of users.
+        """
+        with self._thread_lock:
+            if self._thread is None:
+                return
+            self._users = 0 if force else self._users - 1
+            if self._users > 0:
+                return
+            self._stop_event.set()
+            self._stop_event, self._thread = None, None
@@ -0,0 +1,122 @@
+"""
+MetricsServer.py
+
+Small embedded http server that serves a ProbeMetrics registry at /metrics for Prometheus to scrape.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Tuple
+
+try:
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+    from WebServerStatusCheckerAJM.ProbeMetrics import ProbeMetrics
+except (ModuleNotFoundError, ImportError):
+    from LazyLogger import LazyLogger
+    from ProbeMetrics import ProbeMetrics
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET /metrics with the rendered metrics of the server's registry, and anything else with 404.
+    """
+    def do_GET(self):
+        """
+        Sends the metrics rendered in the Prometheus text format for the metrics_path (ignoring any query string),
+        or a 404 for any other path. Rendering only reads the aggregates, it never runs a check.
+        """
+        if self.path.split('?', 1)[0] != self.server.metrics_path:
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', ProbeMetrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        MetricsServer.LOGGER.debug("metrics request from %s: " + format, self.address_string(), *args)
+
+
+class MetricsServer:
+    """
+    Class MetricsServer:
+    Serves a ProbeMetrics registry in the Prometheus text format from a daemon thread.
+    A scrape only renders the registry's in-memory aggregates, so it never waits on a check.
+
+    Parameters:
+    - metrics (ProbeMetrics): The registry to serve.
+    - port (int): Port to listen on, 0 picks a free one. Defaults to DEFAULT_PORT.
+    - host (str): Address to listen on. Defaults to DEFAULT_HOST, only the local machine;
+        use '0.0.0.0' to be scraped from other machines.
+    - path (str): Path the metrics are served at. Defaults to DEFAULT_PATH.
+
+    Properties:
+    - address: The (host, port) the server listens on once started.
+    - url: The url of the metrics once started.
+
+    Methods:
+    - start: Binds the port and starts serving in the background.
+    - stop: Stops serving and releases the port.
+    """
+    LOGGER = LazyLogger()
+    DEFAULT_HOST = '127.0.0.1'
+    DEFAULT_PORT = 9464
+    DEFAULT_PATH = '/metrics'
+
+    def __init__(self, metrics: ProbeMetrics, port: int = None, host: str = None, path: str = None):
+        self.metrics = metrics
+        self.port = self.DEFAULT_PORT if port is None else port
+        self.host = host or self.DEFAULT_HOST
+        self.path = path or self.DEFAULT_PATH
+        self._server = None
+        self._thread = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """
+        The (host, port) the server is listening on, with the real port if it was started on port 0.
+        """
+        if self._server is None:
+            return self.host, self.port
+        return self._server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        """
+        The url the metrics are served at.
+        """
+        host, port = self.address
+        return f'http://{host}:{port}{self.path}'
+
+    def start(self) -> 'MetricsServer':
+        """
+        Binds the port and starts serving metrics from a daemon thread. Does nothing if already started.
+        Raises an OSError if the port can not be bound.
+        """
+        if self._server is not None:
+            return self
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _MetricsRequestHandler)
+        except OSError as e:
+            self.LOGGER.error(e, exc_info=True)
+            raise e
+        self._server.daemon_threads = True
+        self._server.metrics = self.metrics
+        self._server.metrics_path = self.path
+        self._thread = Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        self.LOGGER.info("serving metrics at %s", self.url)
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops serving and releases the port.
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
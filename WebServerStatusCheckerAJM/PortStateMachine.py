@@ -0,0 +1,327 @@
+"""
+PortStateMachine.py
+
+Keeps the current state of every checked port, fed by the snapshots of the probe cycles,
+so reading whether a port is down (and since when) is a dictionary lookup instead of a new check,
+and every change of state is recorded as a transition event that can be subscribed to.
+Changes between up and down can require several results in a row (hysteresis), and ports that keep
+changing are marked FLAPPING, so a noisy link does not produce a stream of alerts.
+"""
+from enum import Enum
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional
+
+try:
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+except (ModuleNotFoundError, ImportError):
+    from LazyLogger import LazyLogger
+
+
+class PortState(Enum):
+    """
+    Enum PortState:
+    The overall state of one port, as of its latest check.
+
+    Members:
+    - UNKNOWN: The port has not been checked yet.
+    - UP: Every component answered in time.
+    - DEGRADED: Every component answered, but at least one slower than its degraded threshold.
+    - DOWN: A component did not answer, or answered with an error.
+    - TIMEOUT: Down because a check did not finish within its timeout or the cycle deadline.
+    - DNS_FAILURE: Down because the server host name could not be resolved.
+    - FLAPPING: Changed between up and down too often lately; not counted as down, and not alerted on.
+    """
+    UNKNOWN = 'UNKNOWN'
+    UP = 'UP'
+    DEGRADED = 'DEGRADED'
+    DOWN = 'DOWN'
+    TIMEOUT = 'TIMEOUT'
+    DNS_FAILURE = 'DNS_FAILURE'
+    FLAPPING = 'FLAPPING'
+
+    @property
+    def is_down(self) -> bool:
+        """
+        True for DOWN, TIMEOUT and DNS_FAILURE, the states that count as the port being down.
+        """
+        return self in (PortState.DOWN, PortState.TIMEOUT, PortState.DNS_FAILURE)
+
+    @property
+    def is_settled(self) -> bool:
+        """
+        False for UNKNOWN and FLAPPING, the states in which it is not settled whether the port is up or down.
+        """
+        return self is not PortState.UNKNOWN and self is not PortState.FLAPPING
+
+
+class StateTransition(NamedTuple):
+    """
+    One change of state of a port.
+
+    Fields:
+    - key: The port's key, (target name, port) for checkers.
+    - from_state: The PortState the port was in.
+    - to_state: The PortState the port is now in.
+    - timestamp: POSIX timestamp of the check that found the new state.
+    - duration: Seconds the port spent in from_state, None when coming from UNKNOWN.
+    - snapshot: The ProbeSnapshot that caused the transition.
+    """
+    key: Hashable
+    from_state: PortState
+    to_state: PortState
+    timestamp: float
+    duration: Optional[float]
+    snapshot: object
+
+
+class _PortRecord:
+    """
+    Current state of one port.
+    outcomes is a bitset of the latest results, newest in the lowest bit and 1 meaning down,
+    of which the lowest `checks` bits are valid.
+    """
+    __slots__ = ('state', 'since', 'down_since', 'last_checked', 'outcomes', 'checks', 'failures', 'successes',
+                 'flapping')
+
+    def __init__(self):
+        self.state = PortState.UNKNOWN
+        self.since: Optional[float] = None
+        self.down_since: Optional[float] = None
+        self.last_checked: Optional[float] = None
+        self.outcomes = 0
+        self.checks = 0
+        self.failures = 0
+        self.successes = 0
+        self.flapping = False
+
+
+class PortStateMachine:
+    """
+    Class PortStateMachine:
+    Thread safe state machine of every port it is fed snapshots for, keyed by any hashable key.
+
+    Each snapshot moves its port towards the PortState it describes (see state_of). When the state changes
+    a StateTransition, with the time spent in the previous state, is passed to every subscriber,
+    synchronously on the thread that fed the snapshot, so subscribers should return quickly.
+    Reading a state never runs a check: ports that were never fed are UNKNOWN.
+
+    Hysteresis: an up port only goes down after fail_threshold down results in a row, and a down port only comes
+    back up after recover_threshold up results in a row. FLAPPING ports need the same to settle either way,
+    UNKNOWN ports go down after fail_threshold down results but are up from their first up result.
+    Changes within up (UP and DEGRADED) or within down (DOWN, TIMEOUT and DNS_FAILURE) are immediate.
+
+    Flap detection: the latest flap_history results of every port are kept as a bitset, and a port whose results
+    changed between up and down at least flap_threshold times within them is FLAPPING until the changes drop below
+    half of flap_threshold. Flap detection is off while flap_threshold is None.
+
+    Parameters:
+    - fail_threshold (int): Down results in a row before an up port goes down. Defaults to DEFAULT_FAIL_THRESHOLD.
+    - recover_threshold (int): Up results in a row before a down port is back up.
+        Defaults to DEFAULT_RECOVER_THRESHOLD.
+    - flap_history (int): Number of latest results checked for flapping. Defaults to DEFAULT_FLAP_HISTORY.
+    - flap_threshold (int): Number of up/down changes within flap_history that count as flapping,
+        None (the default) turns flap detection off.
+
+    Properties:
+    - keys: The keys of every port that has been fed a snapshot.
+
+    Static Methods:
+    - state_of: The PortState a ProbeSnapshot describes.
+
+    Methods:
+    - feed: Moves a port to the state of a snapshot, returning the StateTransition if the state changed.
+    - subscribe / unsubscribe: Add or remove a callback that is passed every StateTransition.
+    - state: The current PortState of a port.
+    - since: Timestamp of the check that moved a port into its current state.
+    - down_since: Timestamp of the check that found a port down, None if it is not down,
+        even if it moved between DOWN, TIMEOUT and DNS_FAILURE since.
+    - last_checked: Timestamp of the latest check of a port.
+    - is_flapping: Whether a port is FLAPPING.
+    - flap_changes: Number of up/down changes within the latest flap_history results of a port.
+    - states: Dictionary of key to current PortState, for every port.
+    """
+    LOGGER = LazyLogger()
+    DEFAULT_FAIL_THRESHOLD = 1
+    DEFAULT_RECOVER_THRESHOLD = 1
+    DEFAULT_FLAP_HISTORY = 20
+
+    def __init__(self, fail_threshold: int = None, recover_threshold: int = None, flap_history: int = None,
+                 flap_threshold: int = None):
+        self.fail_threshold = fail_threshold or self.DEFAULT_FAIL_THRESHOLD
+        self.recover_threshold = recover_threshold or self.DEFAULT_RECOVER_THRESHOLD
+        self.flap_history = flap_history or self.DEFAULT_FLAP_HISTORY
+        self.flap_threshold = flap_threshold
+        if self.flap_threshold is not None and not 0 < self.flap_threshold < self.flap_history:
+            try:
+                raise ValueError(f"flap_threshold must be between 1 and flap_history - 1 ({self.flap_history - 1}),"
+                                 f" got {self.flap_threshold}")
+            except ValueError as e:
+                self.LOGGER.error(e, exc_info=True)
+                raise e
+        self._history_mask = (1 << self.flap_history) - 1
+        self._records: Dict[Hashable, _PortRecord] = {}
+        self._subscribers: List[Callable[[StateTransition], None]] = []
+        self._lock = Lock()
+
+    @staticmethod
+    def state_of(snapshot) -> PortState:
+        """
+        Returns the PortState of a ProbeSnapshot: UP or DEGRADED if it is not down, otherwise DNS_FAILURE
+        if the host name did not resolve, TIMEOUT if something timed out, and DOWN for anything else.
+        """
+        if not snapshot.is_down:
+            return PortState.DEGRADED if snapshot.is_degraded else PortState.UP
+        if snapshot.dns_failed:
+            return PortState.DNS_FAILURE
+        if snapshot.timed_out:
+            return PortState.TIMEOUT
+        return PortState.DOWN
+
+    @property
+    def keys(self) -> List[Hashable]:
+        """
+        The keys of every port the state machine was fed a snapshot for.
+        """
+        with self._lock:
+            return list(self._records)
+
+    def subscribe(self, callback: Callable[[StateTransition], None]) -> Callable[[StateTransition], None]:
+        """
+        Passes every future StateTransition to callback. Returns callback, so this can be used as a decorator.
+        """
+        with self._lock:
+            self._subscribers = [*self._subscribers, callback]
+        return callback
+
+    def unsubscribe(self, callback: Callable[[StateTransition], None]) -> None:
+        """
+        Stops passing StateTransitions to callback. Callbacks that were never subscribed are ignored.
+        """
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber != callback]
+
+    @staticmethod
+    def _changes(outcomes: int, checks: int) -> int:
+        """
+        Number of up/down changes between consecutive results in the lowest checks bits of outcomes.
+        """
+        if checks < 2:
+            return 0
+        return bin((outcomes ^ (outcomes >> 1)) & ((1 << (checks - 1)) - 1)).count('1')
+
+    def _next_state(self, record: _PortRecord, observed: PortState) -> PortState:
+        """
+        Records the result observed for a port and returns the state the port is in after it.
+        """
+        failed = observed.is_down
+        record.outcomes = ((record.outcomes << 1) | failed) & self._history_mask
+        record.checks = min(record.checks + 1, self.flap_history)
+        if failed:
+            record.failures, record.successes = record.failures + 1, 0
+        else:
+            record.failures, record.successes = 0, record.successes + 1
+
+        if self.flap_threshold is not None:
+            changes = self._changes(record.outcomes, record.checks)
+            if record.flapping:
+                record.flapping = changes * 2 >= self.flap_threshold
+            else:
+                record.flapping = changes >= self.flap_threshold
+            if record.flapping:
+                return PortState.FLAPPING
+
+        current = record.state
+        if current.is_settled and current.is_down == failed:
+            return observed
+        # nothing to recover from yet: a new port is up from its first good check.
+        if not failed and current is PortState.UNKNOWN:
+            return observed
+        if failed and record.failures >= self.fail_threshold:
+            return observed
+        if not failed and record.successes >= self.recover_threshold:
+            return observed
+        return current
+
+    def feed(self, key: Hashable, snapshot) -> Optional[StateTransition]:
+        """
+        Records the result of snapshot for the port key and moves the port to its new state (see the hysteresis
+        and flap detection above). Returns the StateTransition passed to the subscribers if its state changed,
+        None otherwise.
+        """
+        observed = self.state_of(snapshot)
+        timestamp = snapshot.timestamp
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                record = self._records[key] = _PortRecord()
+            record.last_checked = timestamp
+            new_state = self._next_state(record, observed)
+            if new_state is record.state:
+                return None
+            transition = StateTransition(key, record.state, new_state, timestamp,
+                                         None if record.since is None else max(timestamp - record.since, 0.0),
+                                         snapshot)
+            record.state, record.since = new_state, timestamp
+            if not new_state.is_down:
+                record.down_since = None
+            elif record.down_since is None:
+                record.down_since = timestamp
+            subscribers = self._subscribers
+        for subscriber in subscribers:
+            try:
+                subscriber(transition)
+            except Exception as e:
+                self.LOGGER.error(e, exc_info=True)
+        return transition
+
+    def state(self, key: Hashable) -> PortState:
+        """
+        Returns the PortState of the port key, UNKNOWN if it was never fed a snapshot.
+        Never runs a check.
+        """
+        record = self._records.get(key)
+        return PortState.UNKNOWN if record is None else record.state
+
+    def since(self, key: Hashable) -> Optional[float]:
+        """
+        Returns the POSIX timestamp of the check that moved the port key to its current state,
+        or None if it was never fed a snapshot.
+        """
+        record = self._records.get(key)
+        return None if record is None else record.since
+
+    def down_since(self, key: Hashable) -> Optional[float]:
+        """
+        Returns the POSIX timestamp of the check the port key went down at, or None if it is not down.
+        Changes between down states (e.g. DOWN to TIMEOUT) do not move it.
+        """
+        record = self._records.get(key)
+        return None if record is None else record.down_since
+
+    def last_checked(self, key: Hashable) -> Optional[float]:
+        """
+        Returns the POSIX timestamp of the latest snapshot fed for the port key, or None if there was none.
+        """
+        record = self._records.get(key)
+        return None if record is None else record.last_checked
+
+    def is_flapping(self, key: Hashable) -> bool:
+        """
+        True if the port key is FLAPPING.
+        """
+        return self.state(key) is PortState.FLAPPING
+
+    def flap_changes(self, key: Hashable) -> int:
+        """
+        Returns the number of up/down changes within the latest flap_history results of the port key,
+        which is compared to flap_threshold.
+        """
+        record = self._records.get(key)
+        return 0 if record is None else self._changes(record.outcomes, record.checks)
+
+    def states(self) -> Dict[Hashable, PortState]:
+        """
+        Returns a dictionary of the key of every port to its PortState.
+        """
+        with self._lock:
+            return {key: record.state for key, record in self._records.items()}
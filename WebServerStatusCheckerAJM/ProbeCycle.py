@@ -0,0 +1,413 @@
+"""
+ProbeCycle.py
+
+Collects the status of every component for a given port in a single pass, so that rendering,
+logging, downtime tracking and alerting can all read from one immutable snapshot
+instead of re-running the network checks each time a property is read.
+"""
+import datetime
+import hashlib
+from abc import abstractmethod
+from time import perf_counter
+from typing import Dict, NamedTuple
+
+try:
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+    from WebServerStatusCheckerAJM.TimedHTTPAdapter import HTTPTimings, TimedHTTPAdapter
+    from WebServerStatusCheckerAJM.ProbeDependencyGraph import ProbeDependencyGraph
+except (ModuleNotFoundError, ImportError):
+    from ProbeState import ProbeState
+    from TimedHTTPAdapter import HTTPTimings, TimedHTTPAdapter
+    from ProbeDependencyGraph import ProbeDependencyGraph
+
+
+class HTTPResult(NamedTuple):
+    """
+    Result of the single http request made for a port in a probe cycle.
+
+    Fields:
+    - response: The response, None if there was none.
+    - latency: Time in seconds until the response headers arrived, None if there was no response.
+    - state: ProbeState of the request (UP, DOWN, TIMEOUT, DNS_FAILURE or UNREACHABLE).
+    - title: The html title read from the response body, None if it was not read or there was none.
+    - body_digest: Digest of the part of the body that was read, None if none was read.
+    - not_modified: True if the server answered 304 Not Modified and the title and digest came from the cache.
+    - page_latency: Time in seconds until the response was read and released, None if there was no response.
+    - timings: HTTPTimings of the request (dns, connect, tls, ttfb and total), None if there was no response.
+    """
+    response: object
+    latency: float or None
+    state: ProbeState
+    title: str or None = None
+    body_digest: str or None = None
+    not_modified: bool = False
+    page_latency: float or None = None
+    timings: HTTPTimings or None = None
+
+
+class ProbeSnapshot(NamedTuple):
+    """
+    Immutable result of one probe cycle for a single port.
+
+    Fields:
+    - port: The port that was checked.
+    - timestamp: POSIX timestamp of when the cycle started.
+    - local_machine_status: ProbeState of the local machine's connection to its upstream host(s).
+    - machine_status: ProbeState of pinging the server machine.
+    - server_status: ProbeState of connecting to the http server on this port.
+    - page_status: ProbeState of the page, UP only if it returned an ok response.
+    - page_name: The configured web page, the html title of the page, or 'Homepage'.
+    - latency: Time in seconds until the http response headers arrived, None if no response was received.
+    - local_machine_rtt: Round trip time in seconds to the local_machine_ping_host, None if it was unreachable.
+    - machine_rtt: Round trip time in seconds to the server machine, None if it was unreachable.
+    - body_digest: Digest of the part of the page body that was read (or was cached, for a 304), None if unknown.
+    - page_latency: Time in seconds until the page was read (as far as needed) and released,
+        None if no response was received.
+    - timings: HTTPTimings of the http request, None if no response was received.
+    """
+    port: int
+    timestamp: float
+    local_machine_status: ProbeState
+    machine_status: ProbeState
+    server_status: ProbeState
+    page_status: ProbeState
+    page_name: str
+    latency: float or None = None
+    local_machine_rtt: float or None = None
+    machine_rtt: float or None = None
+    body_digest: str or None = None
+    page_latency: float or None = None
+    timings: HTTPTimings or None = None
+
+    @property
+    def is_down(self) -> bool:
+        """
+        True if any of the components in this snapshot are down.
+        """
+        return not (self.local_machine_status and self.machine_status
+                    and self.server_status and self.page_status)
+
+    @property
+    def is_degraded(self) -> bool:
+        """
+        True if any of the components in this snapshot answered slower than its degraded threshold.
+        """
+        return ProbeState.DEGRADED in (self.local_machine_status, self.machine_status,
+                                       self.server_status, self.page_status)
+
+    @property
+    def dns_failed(self) -> bool:
+        """
+        True if the server host name could not be resolved for this snapshot.
+        """
+        return ProbeState.DNS_FAILURE in (self.machine_status, self.server_status)
+
+    @property
+    def timed_out(self) -> bool:
+        """
+        True if any of the components in this snapshot timed out.
+        """
+        return ProbeState.TIMEOUT in (self.local_machine_status, self.machine_status,
+                                      self.server_status, self.page_status)
+
+
+class ProbeCycle:
+    """
+    Class ProbeCycle:
+    Runs each network check exactly once per port and stores the result as a ProbeSnapshot.
+    A cycle is bounded by cycle_deadline seconds, checks that can not run or finish before the deadline
+     are reported as ProbeState.TIMEOUT.
+    degraded_thresholds is an optional dictionary of component ('local', 'machine', 'server' or 'page')
+     to a latency in seconds, a component that answers slower than its threshold is reported as
+      ProbeState.DEGRADED instead of UP.
+    probe_dependencies (a ProbeDependencyGraph, or a dictionary of component to the components it depends on)
+     declares which components are only probed once the components they depend on are up. Components whose
+      upstream is down are not probed and are reported as ProbeState.UNREACHABLE, and components that do not
+       depend on each other are probed at the same time.
+
+    Methods:
+    - take_snapshot: Runs one probe cycle for a port and stores the resulting snapshot.
+    - build_snapshot: Builds a snapshot from probe results that were collected elsewhere.
+    - probe_state: The ProbeState of the result of one component's probe.
+    - store_snapshot: Stores a snapshot and passes it to on_snapshot.
+    - on_snapshot: Hook called with every new snapshot, meant to be overridden by subclasses.
+
+    Properties:
+    - snapshot: The latest snapshot for the active server port, taken on first access if there is none yet.
+    - snapshots: Dictionary of the latest snapshot for each port that has been checked.
+    """
+    LOGGER = None
+    DEFAULT_CYCLE_DEADLINE = 30.0
+    BODY_DIGEST_SIZE = 16
+    # component name -> (ProbeSnapshot state field, ProbeSnapshot latency field)
+    COMPONENT_FIELDS = {'local': ('local_machine_status', 'local_machine_rtt'),
+                        'machine': ('machine_status', 'machine_rtt'),
+                        'server': ('server_status', 'latency'),
+                        'page': ('page_status', 'page_latency')}
+
+    def __init__(self, cycle_deadline: float = None, degraded_thresholds: Dict[str, float] = None,
+                 probe_dependencies=None):
+        self._snapshots: Dict[int, ProbeSnapshot] = {}
+        self.cycle_deadline = cycle_deadline or self.DEFAULT_CYCLE_DEADLINE
+        self.degraded_thresholds = dict(degraded_thresholds or {})
+        unknown_components = set(self.degraded_thresholds) - set(self.COMPONENT_FIELDS)
+        if unknown_components:
+            try:
+                raise ValueError(f"degraded_thresholds can only be given for {tuple(self.COMPONENT_FIELDS)},"
+                                 f" got {sorted(unknown_components)}")
+            except ValueError as e:
+                self.LOGGER.error(e, exc_info=True)
+                raise e
+        if isinstance(probe_dependencies, ProbeDependencyGraph):
+            self.probe_dependencies = probe_dependencies
+        else:
+            try:
+                self.probe_dependencies = ProbeDependencyGraph(probe_dependencies)
+            except ValueError as e:
+                self.LOGGER.error(e, exc_info=True)
+                raise e
+
+    @property
+    @abstractmethod
+    def active_server_port(self):
+        """
+        This method is an abstract property that should return the currently active server port.
+        """
+
+    @property
+    @abstractmethod
+    def server_web_page(self):
+        """
+        This method is an abstract property that should return the configured server web page.
+        """
+
+    @property
+    @abstractmethod
+    def local_machine_rtt(self):
+        """
+        This method is an abstract property that should return the round trip time to the local machine's
+        upstream host(s), or None if the local machine is offline.
+        """
+
+    @abstractmethod
+    def full_address_for_port(self, port: int):
+        """
+        This method should return the full address of the server for the given port.
+        """
+
+    @abstractmethod
+    def ping_rtt(self, **kwargs):
+        """
+        This method should return the round trip time to the host in seconds, None if it is unreachable,
+        or ProbeState.DNS_FAILURE if its name could not be resolved.
+        """
+
+    @property
+    @abstractmethod
+    def http_timeout(self):
+        """
+        This method is an abstract property that should return the (connect, read) timeout for http requests.
+        """
+
+    @property
+    @abstractmethod
+    def conditional_requests(self):
+        """
+        This method is an abstract property that should return whether requests carry the cached validators.
+        """
+
+    @property
+    @abstractmethod
+    def validator_cache(self):
+        """
+        This method is an abstract property that should return the ValidatorCache used for conditional requests.
+        """
+
+    @abstractmethod
+    def request_server(self, address: str, timeout: tuple = None, conditional: bool = False):
+        """
+        This method should make a GET request to address and return a tuple of
+        the response (or None) and a ProbeState.
+        """
+
+    @abstractmethod
+    def read_response_title(self, response, digest=None):
+        """
+        This method should return the html title read from the response body, or None,
+        feeding the chunks it read into digest if one is given.
+        """
+
+    @abstractmethod
+    def release_response(self, response):
+        """
+        This method should finish with a (possibly streamed) response, releasing its connection.
+        """
+
+    @property
+    def snapshots(self) -> Dict[int, ProbeSnapshot]:
+        """
+        Dictionary of the latest ProbeSnapshot for each port that has been checked.
+        """
+        return self._snapshots
+
+    @property
+    def snapshot(self) -> ProbeSnapshot:
+        """
+        The latest ProbeSnapshot for the active server port.
+        If the active port has not been checked yet, a probe cycle is run for it first.
+        """
+        if self.active_server_port not in self._snapshots:
+            self.take_snapshot()
+        return self._snapshots[self.active_server_port]
+
+    def take_snapshot(self, port: int = None) -> ProbeSnapshot:
+        """
+        Runs one probe cycle for the given port (defaults to the active server port).
+        The local machine status is read from the shared local uplink cache, the server machine is pinged once
+         and a single GET request is made to the server, which is used for the server status,
+          the page status and the page title.
+        The probes are run in the order of probe_dependencies: by default the ping and the GET request run at the
+         same time once the local machine is known to be up, and neither is made if it is not.
+        Any check that would start after cycle_deadline has passed, or that runs alongside another and has not
+         finished by then, is reported as TIMEOUT, and the http timeouts are shortened so the request can not run
+          past the deadline.
+        The snapshot is stored, passed to on_snapshot and returned.
+        """
+        if port is None:
+            port = self.active_server_port
+        timestamp = datetime.datetime.now().timestamp()
+        deadline = perf_counter() + self.cycle_deadline
+        address = self.full_address_for_port(port)
+
+        def request_server():
+            remaining = max(deadline - perf_counter(), 0)
+            return self.timed_server_response(address, timeout=tuple(min(t, remaining) for t in self.http_timeout))
+
+        results = self.probe_dependencies.run({'local': lambda: self.local_machine_rtt,
+                                               'machine': self.ping_rtt,
+                                               'server': request_server},
+                                              self.probe_state, deadline)
+        return self.store_snapshot(self.build_snapshot(port, timestamp, results['local'],
+                                                       results['machine'], results['server']))
+
+    def timed_server_response(self, address: str, timeout: tuple = None) -> HTTPResult:
+        """
+        Requests address and returns an HTTPResult of the response, the time in seconds until its headers arrived,
+        the time until it was read and released, the time each phase of the request took, its ProbeState and,
+        when no server_web_page is configured, the html title and a digest of the body read.
+        The title is read incrementally from the body, which is then released so that no more of it is downloaded
+         than needed.
+        When conditional_requests is on, the request carries the validators from validator_cache. A 304 Not Modified
+         answer re-uses the cached title and body digest without reading any body, while the validators of a full
+          answer are stored for the next check.
+        """
+        start = perf_counter()
+        response, state = self.request_server(address, timeout=timeout, conditional=self.conditional_requests)
+        if response is None:
+            return HTTPResult(None, None, state)
+        latency = perf_counter() - start
+        title = body_digest = None
+        not_modified = response.status_code == 304
+        try:
+            if not_modified:
+                cached = self.validator_cache.get(address)
+                if cached is not None:
+                    title, body_digest = cached.title, cached.body_digest
+            elif response.ok and response.request.method != 'HEAD':
+                if not self.server_web_page:
+                    digest = hashlib.blake2b(digest_size=self.BODY_DIGEST_SIZE)
+                    title = self.read_response_title(response, digest)
+                    body_digest = digest.hexdigest()
+                if self.conditional_requests:
+                    self.validator_cache.store(address, response.headers, title, body_digest)
+        finally:
+            self.release_response(response)
+        page_latency = perf_counter() - start
+        timings = TimedHTTPAdapter.timings(response)
+        return HTTPResult(response, latency, state, title, body_digest, not_modified=not_modified,
+                          page_latency=page_latency,
+                          timings=None if timings is None else timings._replace(total=page_latency))
+
+    def build_snapshot(self, port: int, timestamp: float, local_machine_rtt,
+                       machine_rtt, http_result) -> ProbeSnapshot:
+        """
+        Builds a ProbeSnapshot from the results of the individual probes without running any of them.
+        The local machine and machine statuses are derived from their round trip times (None meaning unreachable),
+         and the server status, page status and page name are all derived from the single http_result.
+        Any of the results may be ProbeState.TIMEOUT instead, for probes that did not finish before the deadline,
+         machine_rtt may be ProbeState.DNS_FAILURE if the server host name could not be resolved,
+          and any of them may be ProbeState.UNREACHABLE for probes that were skipped.
+        Every component that depends (see probe_dependencies) on a component that is not up is reported as
+         UNREACHABLE, whether or not it was probed.
+        Components that are up but slower than their degraded_thresholds are reported as DEGRADED.
+        """
+        if http_result is ProbeState.TIMEOUT or http_result is ProbeState.UNREACHABLE:
+            http_result = HTTPResult(None, None, http_result)
+
+        server_status = http_result.state
+        if server_status is ProbeState.UP:
+            page_status = ProbeState.UP if http_result.response.ok else ProbeState.DOWN
+        else:
+            page_status = server_status
+        states = self.probe_dependencies.resolve_states({'local': ProbeState.from_rtt(local_machine_rtt),
+                                                         'machine': ProbeState.from_rtt(machine_rtt),
+                                                         'server': server_status,
+                                                         'page': page_status})
+        local_machine_status, machine_status = states['local'], states['machine']
+        server_status, page_status = states['server'], states['page']
+
+        page_name = self.server_web_page
+        if not page_name:
+            page_name = (http_result.title if page_status else None) or 'Homepage'
+
+        snapshot = ProbeSnapshot(port=port, timestamp=timestamp,
+                                 local_machine_status=local_machine_status,
+                                 machine_status=machine_status,
+                                 server_status=server_status,
+                                 page_status=page_status,
+                                 page_name=page_name,
+                                 latency=http_result.latency,
+                                 local_machine_rtt=local_machine_rtt if local_machine_status else None,
+                                 machine_rtt=machine_rtt if machine_status else None,
+                                 body_digest=http_result.body_digest if page_status else None,
+                                 page_latency=http_result.page_latency, timings=http_result.timings)
+        return self.apply_degraded_thresholds(snapshot)
+
+    @staticmethod
+    def probe_state(component: str, result) -> ProbeState:
+        """
+        Returns the ProbeState of result, the outcome of probing component: a round trip time (or None, or a
+         ProbeState) for 'local' and 'machine', an HTTPResult (or a ProbeState) for 'server'.
+        """
+        if isinstance(result, ProbeState):
+            return result
+        if isinstance(result, HTTPResult):
+            return result.state
+        return ProbeState.from_rtt(result)
+
+    def apply_degraded_thresholds(self, snapshot: ProbeSnapshot) -> ProbeSnapshot:
+        """
+        Returns snapshot with every UP component whose latency is above its degraded_thresholds entry
+         marked DEGRADED.
+        """
+        degraded = {}
+        for component, threshold in self.degraded_thresholds.items():
+            state_field, latency_field = self.COMPONENT_FIELDS[component]
+            latency = getattr(snapshot, latency_field)
+            if getattr(snapshot, state_field) is ProbeState.UP and latency is not None and latency > threshold:
+                degraded[state_field] = ProbeState.DEGRADED
+        return snapshot._replace(**degraded) if degraded else snapshot
+
+    def store_snapshot(self, snapshot: ProbeSnapshot) -> ProbeSnapshot:
+        """
+        Stores snapshot as the latest snapshot for its port, passes it to on_snapshot and returns it.
+        """
+        self._snapshots[snapshot.port] = snapshot
+        self.on_snapshot(snapshot)
+        return snapshot
+
+    def on_snapshot(self, snapshot: ProbeSnapshot) -> None:
+        """
+        Called once for every snapshot taken. Subclasses can override this to track downtime
+        or raise alerts without running any additional probes.
+        """
@@ -0,0 +1,189 @@
+"""
+ProbeDependencyGraph.py
+
+Declares which components of a check depend on which (the local uplink, the machine ping, the http server
+and the page), so a component whose upstream failed is reported UNREACHABLE instead of being probed,
+and components that do not depend on each other are probed at the same time.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Mapping, Tuple
+
+try:
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+except (ModuleNotFoundError, ImportError):
+    from ProbeState import ProbeState
+
+
+class ProbeDependencyGraph:
+    """
+    Class ProbeDependencyGraph:
+    Directed acyclic graph of the components of a check, each pointing to the components it depends on.
+
+    A component is blocked when any component it depends on is not up (its ProbeState is falsy, DEGRADED counts
+    as up); blocked components are not probed and their state is ProbeState.UNREACHABLE, which in turn blocks
+    everything that depends on them. The components are grouped in waves: every component only depends on
+    components of earlier waves, so the probes of one wave can all run at the same time.
+
+    By default (DEFAULT_DEPENDENCIES) the machine ping and the http server depend on the local uplink, and the page
+    depends on the http server. The machine ping and the http server do not depend on each other, as plenty of
+    servers answer http while dropping pings; pass {'server': ('machine',)} to only request servers that answer
+    a ping.
+
+    Parameters:
+    - dependencies (Mapping[str, Iterable[str]]): Component to the components it depends on. Components that are
+        not given keep their DEFAULT_DEPENDENCIES. Raises a ValueError for unknown components or a cycle.
+
+    Class Methods:
+    - executor: The thread pool run uses for the extra probes of a wave, shared by every graph.
+    - abandoned_probes: Number of probes run stopped waiting for that still hold an executor thread.
+
+    Properties:
+    - waves: The components grouped in the order they can be probed, each group only depending on earlier ones.
+
+    Methods:
+    - dependencies_of: The components a component directly depends on.
+    - is_blocked: True if a component depends on a component that is not up.
+    - resolve_states: Replaces the state of every blocked component with ProbeState.UNREACHABLE.
+    - run: Runs the probes of one check wave by wave, skipping blocked components.
+    """
+    COMPONENTS = ('local', 'machine', 'server', 'page')
+    DEFAULT_DEPENDENCIES = {'local': (), 'machine': ('local',), 'server': ('local',), 'page': ('server',)}
+    EXECUTOR_WORKERS = 16
+
+    _executor = None
+    _executor_lock = Lock()
+    _abandoned_probes = 0
+
+    def __init__(self, dependencies: Mapping[str, Iterable[str]] = None):
+        self._dependencies: Dict[str, Tuple[str, ...]] = dict(self.DEFAULT_DEPENDENCIES)
+        for component, upstream in (dependencies or {}).items():
+            self._dependencies[component] = tuple(upstream)
+        named = set(self._dependencies).union(*self._dependencies.values())
+        unknown = named - set(self.COMPONENTS)
+        if unknown:
+            raise ValueError(f"probe dependencies can only be given between {self.COMPONENTS},"
+                             f" got {sorted(unknown)}")
+        self._waves = self._build_waves()
+
+    def _build_waves(self) -> Tuple[Tuple[str, ...], ...]:
+        """
+        Groups the components by the length of their longest chain of dependencies,
+        raising a ValueError if the dependencies form a cycle.
+        """
+        depths: Dict[str, int] = {}
+        while len(depths) < len(self.COMPONENTS):
+            placed = {component: 1 + max((depths[upstream] for upstream in self._dependencies[component]),
+                                         default=-1)
+                      for component in self.COMPONENTS if component not in depths
+                      and all(upstream in depths for upstream in self._dependencies[component])}
+            if not placed:
+                raise ValueError(f"probe dependencies form a cycle between "
+                                 f"{sorted(set(self.COMPONENTS) - set(depths))}")
+            depths.update(placed)
+        return tuple(tuple(component for component in self.COMPONENTS if depths[component] == depth)
+                     for depth in range(max(depths.values()) + 1))
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        """
+        Returns the process-wide thread pool run uses for the probes of a wave beyond the first,
+        creating it on first use.
+        """
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.EXECUTOR_WORKERS,
+                                                   thread_name_prefix='probe-wave')
+        return cls._executor
+
+    @classmethod
+    def abandoned_probes(cls) -> int:
+        """
+        Returns the number of probes that had not finished by the deadline of run and are still running
+        on the executor, each holding one of its EXECUTOR_WORKERS threads until its own timeout ends it.
+        """
+        with cls._executor_lock:
+            return cls._abandoned_probes
+
+    @classmethod
+    def _probe_finished(cls, _future) -> None:
+        with cls._executor_lock:
+            ProbeDependencyGraph._abandoned_probes -= 1
+
+    @property
+    def waves(self) -> Tuple[Tuple[str, ...], ...]:
+        """
+        The components grouped in the order they are probed: every component only depends on components
+        of earlier groups, so the components of one group can be probed at the same time.
+        """
+        return self._waves
+
+    def dependencies_of(self, component: str) -> Tuple[str, ...]:
+        """
+        Returns the components component directly depends on, an empty tuple if it depends on none.
+        """
+        return self._dependencies[component]
+
+    def is_blocked(self, component: str, states: Mapping[str, ProbeState]) -> bool:
+        """
+        True if any component that component depends on has a state in states that is not up.
+        Components missing from states (not probed yet, or never probed) do not block.
+        """
+        return any(upstream in states and not states[upstream] for upstream in self._dependencies[component])
+
+    def resolve_states(self, states: Mapping[str, ProbeState]) -> Dict[str, ProbeState]:
+        """
+        Returns a copy of states (component to ProbeState) in which every blocked component,
+        including those only blocked through another blocked component, is ProbeState.UNREACHABLE.
+        """
+        resolved = dict(states)
+        for wave in self._waves:
+            for component in wave:
+                if component in resolved and self.is_blocked(component, resolved):
+                    resolved[component] = ProbeState.UNREACHABLE
+        return resolved
+
+    def run(self, probes: Mapping[str, Callable[[], object]], state_of: Callable[[str, object], ProbeState],
+            deadline: float) -> Dict[str, object]:
+        """
+        Runs probes (component to a callable returning its result) wave by wave and returns a dictionary of
+        component to result, for every component in probes.
+        state_of(component, result) gives the ProbeState of a result. Blocked components are not probed, their
+         result is ProbeState.UNREACHABLE. Probes that would start at or after the perf_counter() time deadline,
+         or that run on the executor and have not finished by then, are reported as ProbeState.TIMEOUT.
+         The latter are not stopped: they keep their executor thread until their own timeout ends them,
+          and are counted in abandoned_probes until then.
+        The probes of one wave run at the same time: the last on the calling thread, the others on the executor.
+        Components without a probe are skipped and do not block the components that depend on them.
+        """
+        results: Dict[str, object] = {}
+        states: Dict[str, ProbeState] = {}
+        for wave in self._waves:
+            ready: List[str] = []
+            for component in wave:
+                if self.is_blocked(component, states):
+                    results[component] = states[component] = ProbeState.UNREACHABLE
+                elif component in probes:
+                    ready.append(component)
+            if not ready:
+                continue
+            if perf_counter() >= deadline:
+                wave_results = dict.fromkeys(ready, ProbeState.TIMEOUT)
+            else:
+                futures = {component: self.executor().submit(probes[component]) for component in ready[:-1]}
+                wave_results = {ready[-1]: probes[ready[-1]]()}
+                wait(futures.values(), timeout=max(deadline - perf_counter(), 0))
+                for component, future in futures.items():
+                    if future.done():
+                        wave_results[component] = future.result()
+                    else:
+                        wave_results[component] = ProbeState.TIMEOUT
+                        if not future.cancel():
+                            with self._executor_lock:
+                                ProbeDependencyGraph._abandoned_probes += 1
+                            future.add_done_callback(self._probe_finished)
+            for component in ready:
+                results[component] = wave_results[component]
+                states[component] = state_of(component, wave_results[component])
+        return results
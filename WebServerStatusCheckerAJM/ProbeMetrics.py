@@ -0,0 +1,294 @@
+"""
+ProbeMetrics.py
+
+Aggregates check results into in-memory counters, gauges and latency histograms per target and port,
+and renders them in the Prometheus text exposition format. Scraping only reads these aggregates,
+it never runs or waits on a network probe.
+"""
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+try:
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+    from WebServerStatusCheckerAJM.ProbeCycle import ProbeCycle
+    from WebServerStatusCheckerAJM.QuantileSketch import QuantileSketch
+except (ModuleNotFoundError, ImportError):
+    from ProbeState import ProbeState
+    from ProbeCycle import ProbeCycle
+    from QuantileSketch import QuantileSketch
+
+
+class LatencyHistogram:
+    """
+    Class LatencyHistogram:
+    Fixed-bucket histogram of latencies in seconds, as a Prometheus histogram.
+
+    counts[i] is the number of observations in bucket i only (the last bucket being +Inf),
+    the cumulative counts Prometheus expects are only summed up when rendering.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    @classmethod
+    def bucket_for(cls, value: float) -> int:
+        """
+        The index of the bucket value falls in, len(BUCKETS) for +Inf.
+        """
+        return bisect_left(cls.BUCKETS, value)
+
+    def observe(self, value: float, bucket: int = None) -> None:
+        """
+        Adds an observation of value seconds, in bucket if it was already looked up with bucket_for.
+        """
+        self.counts[self.bucket_for(value) if bucket is None else bucket] += 1
+        self.total += value
+        self.count += 1
+
+    def copy(self) -> 'LatencyHistogram':
+        """
+        Returns an independent copy of the histogram.
+        """
+        histogram = LatencyHistogram()
+        histogram.counts = list(self.counts)
+        histogram.total = self.total
+        histogram.count = self.count
+        return histogram
+
+
+class _TargetMetrics:
+    """
+    The aggregates kept for one target and port, guarded by their own lock.
+    """
+    __slots__ = ('lock', 'up', 'states', 'latencies', 'sketches', 'probes', 'timeouts', 'downtime',
+                 'last_timestamp', 'last_down')
+
+    def __init__(self, components, phases=()):
+        self.lock = Lock()
+        self.up = 0
+        self.states: Dict[str, ProbeState] = {}
+        self.latencies = {component: LatencyHistogram() for component in components}
+        self.sketches = {name: QuantileSketch() for name in (*components, *phases)}
+        self.probes = 0
+        self.timeouts = dict.fromkeys(components, 0)
+        self.downtime = 0.0
+        self.last_timestamp = None
+        self.last_down = False
+
+    def copy(self) -> '_TargetMetrics':
+        """
+        Returns an independent copy of the aggregates, with a lock of its own. The caller holds this one's lock.
+        """
+        metrics = _TargetMetrics(())
+        metrics.up = self.up
+        metrics.states = dict(self.states)
+        metrics.latencies = {component: histogram.copy() for component, histogram in self.latencies.items()}
+        metrics.sketches = {name: sketch.copy() for name, sketch in self.sketches.items()}
+        metrics.probes = self.probes
+        metrics.timeouts = dict(self.timeouts)
+        metrics.downtime = self.downtime
+        metrics.last_timestamp = self.last_timestamp
+        metrics.last_down = self.last_down
+        return metrics
+
+
+class ProbeMetrics:
+    """
+    Class ProbeMetrics:
+    Thread safe registry of check metrics per (target, port), fed with ProbeSnapshots.
+    Besides the fixed-bucket histograms, every component latency and every phase of the http request
+    (dns, connect, tls, ttfb) is fed into a QuantileSketch, so p50/p95/p99 are available in constant memory.
+
+    Everything that can be worked out from a snapshot (bucket lookups, states) is done before taking any lock.
+    The registry lock only guards the dictionary of (target, port) to aggregates, while the aggregates of each
+    (target, port) have a lock of their own: recording holds it for a handful of additions, and a scrape copies
+    the aggregates one (target, port) at a time under it. So a scrape never holds up the recording of the whole
+    fleet, a check only waits, at most, for the copy of its own port's histograms and sketches.
+
+    Metrics exposed (every series is labelled with target and port):
+    - wssc_up: 1 if every component was up in the latest check, else 0.
+    - wssc_component_up: 1 per component (local, machine, server, page) if it was up in the latest check.
+    - wssc_component_degraded: 1 per component if it was DEGRADED (up but slow) in the latest check.
+    - wssc_probe_latency_seconds: Histogram of latencies per component; the local and machine round trip times,
+        the time until the server's response headers arrived and the time until the page was read.
+    - wssc_probe_latency_quantile_seconds: Summary of the same latencies, with the p50, p95 and p99 per component.
+    - wssc_http_phase_seconds: Summary of the phases of the http request, with the p50, p95 and p99 per phase.
+    - wssc_probes_total: Number of checks.
+    - wssc_probe_timeouts_total: Number of checks per component that timed out.
+    - wssc_downtime_seconds_total: Seconds spent down, counted between consecutive checks that started down
+        (as passed to record, so the port's confirmed state for checkers).
+    - wssc_last_check_timestamp_seconds: POSIX timestamp of the latest check.
+
+    Methods:
+    - record: Adds a snapshot of a target to the aggregates.
+    - collect: A copy of the aggregates per (target, port), each consistent on its own.
+    - percentiles: The latency quantiles of every component and phase of a target and port.
+    - render: The aggregates in the Prometheus text exposition format.
+    - clear: Forgets every aggregate.
+    """
+    # component label -> (ProbeSnapshot state field, ProbeSnapshot latency field)
+    COMPONENTS = ProbeCycle.COMPONENT_FIELDS
+    PHASES = ('dns', 'connect', 'tls', 'ttfb')
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[Hashable, int], _TargetMetrics] = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._metrics)
+
+    def record(self, target: Hashable, snapshot, is_down: bool = None) -> None:
+        """
+        Adds snapshot (a ProbeSnapshot) of target to the aggregates of its port.
+        is_down is whether the port counts as down from this check on, for wssc_downtime_seconds_total,
+        e.g. from its PortStateMachine state; it defaults to whether the snapshot itself is down.
+        """
+        states = {component: getattr(snapshot, state_field)
+                  for component, (state_field, _) in self.COMPONENTS.items()}
+        latencies = []
+        for component, (_, latency_field) in self.COMPONENTS.items():
+            latency = getattr(snapshot, latency_field)
+            if latency is not None:
+                latencies.append((component, latency, LatencyHistogram.bucket_for(latency)))
+        phases = []
+        if snapshot.timings is not None:
+            phases = [(phase, getattr(snapshot.timings, phase)) for phase in self.PHASES
+                      if getattr(snapshot.timings, phase) is not None]
+        snapshot_down = snapshot.is_down
+        if is_down is None:
+            is_down = snapshot_down
+        key = (target, snapshot.port)
+
+        with self._lock:
+            metrics = self._metrics.get(key)
+            if metrics is None:
+                metrics = self._metrics[key] = _TargetMetrics(self.COMPONENTS, self.PHASES)
+        with metrics.lock:
+            if metrics.last_down and metrics.last_timestamp is not None:
+                metrics.downtime += max(snapshot.timestamp - metrics.last_timestamp, 0.0)
+            metrics.last_timestamp = snapshot.timestamp
+            metrics.last_down = is_down
+            metrics.up = 0 if snapshot_down else 1
+            metrics.states = states
+            metrics.probes += 1
+            for component, state in states.items():
+                if state is ProbeState.TIMEOUT:
+                    metrics.timeouts[component] += 1
+            for component, latency, bucket in latencies:
+                metrics.latencies[component].observe(latency, bucket)
+                metrics.sketches[component].add(latency)
+            for phase, latency in phases:
+                metrics.sketches[phase].add(latency)
+
+    def collect(self) -> Dict[Tuple[Hashable, int], _TargetMetrics]:
+        """
+        Returns a copy of the aggregates of every (target, port). Each (target, port) is copied under its own lock,
+        so its aggregates are consistent as of one moment, but different ports may be copied a few checks apart.
+        """
+        with self._lock:
+            registered = list(self._metrics.items())
+        collected = {}
+        for key, metrics in registered:
+            with metrics.lock:
+                collected[key] = metrics.copy()
+        return collected
+
+    def percentiles(self, target: Hashable, port: int,
+                    quantiles: Iterable[float] = None) -> Dict[str, Dict[float, float]]:
+        """
+        Returns a dictionary of component or http phase name to a dictionary of quantile to latency in seconds,
+        for quantiles (defaults to p50, p95 and p99) of target's port. Names with no measurements are left out.
+        """
+        quantiles = tuple(quantiles or QuantileSketch.DEFAULT_QUANTILES)
+        with self._lock:
+            metrics = self._metrics.get((target, port))
+        if metrics is None:
+            return {}
+        with metrics.lock:
+            return {name: sketch.quantiles(quantiles) for name, sketch in metrics.sketches.items() if sketch.count}
+
+    def clear(self) -> None:
+        """
+        Forgets every aggregate.
+        """
+        with self._lock:
+            self._metrics.clear()
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+    @classmethod
+    def _labels(cls, **labels) -> str:
+        return '{' + ','.join(f'{name}="{cls._escape(value)}"' for name, value in labels.items()) + '}'
+
+    @staticmethod
+    def _number(value: float) -> str:
+        return repr(float(value)) if isinstance(value, float) else str(value)
+
+    @classmethod
+    def _render_summary(cls, samples: List[str], name: str, sketch: QuantileSketch, **labels) -> None:
+        for quantile, value in sketch.quantiles().items():
+            samples.append(f'{name}{cls._labels(**labels, quantile=quantile)} {cls._number(value)}')
+        samples.append(f'{name}_sum{cls._labels(**labels)} {cls._number(sketch.total)}')
+        samples.append(f'{name}_count{cls._labels(**labels)} {sketch.count}')
+
+    def render(self) -> str:
+        """
+        Returns every aggregate in the Prometheus text exposition format (version 0.0.4).
+        """
+        collected = sorted(self.collect().items(), key=lambda item: (str(item[0][0]), item[0][1]))
+        families: List[Tuple[str, str, str, List[str]]] = [
+            ('wssc_up', 'gauge', 'Whether every component of the target was up in the latest check.', []),
+            ('wssc_component_up', 'gauge', 'Whether a component was up in the latest check.', []),
+            ('wssc_component_degraded', 'gauge', 'Whether a component was up but slow in the latest check.', []),
+            ('wssc_probe_latency_seconds', 'histogram', 'Latency of each component of a check.', []),
+            ('wssc_probe_latency_quantile_seconds', 'summary', 'Latency quantiles of each component of a check.', []),
+            ('wssc_http_phase_seconds', 'summary', 'Latency quantiles of each phase of the http request.', []),
+            ('wssc_probes_total', 'counter', 'Number of checks made.', []),
+            ('wssc_probe_timeouts_total', 'counter', 'Number of checks in which a component timed out.', []),
+            ('wssc_downtime_seconds_total', 'counter', 'Seconds the target was down.', []),
+            ('wssc_last_check_timestamp_seconds', 'gauge', 'Time of the latest check.', [])]
+        (up, component_up, component_degraded, latency, latency_quantiles, phase_quantiles,
+         probes, timeouts, downtime, last_check) = (family[3] for family in families)
+
+        for (target, port), metrics in collected:
+            labels = self._labels(target=target, port=port)
+            up.append(f'wssc_up{labels} {metrics.up}')
+            probes.append(f'wssc_probes_total{labels} {metrics.probes}')
+            downtime.append(f'wssc_downtime_seconds_total{labels} {self._number(metrics.downtime)}')
+            last_check.append(f'wssc_last_check_timestamp_seconds{labels} {self._number(metrics.last_timestamp)}')
+            for component in self.COMPONENTS:
+                component_labels = self._labels(target=target, port=port, component=component)
+                component_up.append(f'wssc_component_up{component_labels} '
+                                    f'{1 if metrics.states.get(component) else 0}')
+                component_degraded.append(f'wssc_component_degraded{component_labels} '
+                                          f'{1 if metrics.states.get(component) is ProbeState.DEGRADED else 0}')
+                timeouts.append(f'wssc_probe_timeouts_total{component_labels} {metrics.timeouts[component]}')
+                histogram = metrics.latencies[component]
+                cumulative = 0
+                for bound, count in zip((*LatencyHistogram.BUCKETS, '+Inf'), histogram.counts):
+                    cumulative += count
+                    bucket_labels = self._labels(target=target, port=port, component=component, le=bound)
+                    latency.append(f'wssc_probe_latency_seconds_bucket{bucket_labels} {cumulative}')
+                latency.append(f'wssc_probe_latency_seconds_sum{component_labels} {self._number(histogram.total)}')
+                latency.append(f'wssc_probe_latency_seconds_count{component_labels} {histogram.count}')
+                self._render_summary(latency_quantiles, 'wssc_probe_latency_quantile_seconds',
+                                     metrics.sketches[component], target=target, port=port, component=component)
+            for phase in self.PHASES:
+                self._render_summary(phase_quantiles, 'wssc_http_phase_seconds', metrics.sketches[phase],
+                                     target=target, port=port, phase=phase)
+
+        lines = []
+        for name, metric_type, help_text, samples in families:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
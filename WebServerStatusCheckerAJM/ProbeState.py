@@ -0,0 +1,46 @@
+"""
+ProbeState.py
+
+States a single component check can end up in.
+"""
+from enum import Enum
+
+
+class ProbeState(Enum):
+    """
+    Enum ProbeState:
+    The result of checking one component.
+
+    Members:
+    - UP: The component answered.
+    - DOWN: The component did not answer, or answered with an error.
+    - TIMEOUT: The check did not finish within its timeout or the cycle deadline.
+    - DEGRADED: The component answered, but slower than its configured degraded threshold.
+    - DNS_FAILURE: The host name of the server could not be resolved, so it was never reached.
+    - UNREACHABLE: Not checked, because a component it depends on is down (see ProbeDependencyGraph).
+
+    A ProbeState is truthy only when the component answered (UP or DEGRADED), so existing `if status:` checks
+    keep working and a degraded component does not count as down.
+    New members are only ever added at the end, as StatusHistory stores states by their position.
+    """
+    UP = 'UP'
+    DOWN = 'DOWN'
+    TIMEOUT = 'TIMEOUT'
+    DEGRADED = 'DEGRADED'
+    DNS_FAILURE = 'DNS_FAILURE'
+    UNREACHABLE = 'UNREACHABLE'
+
+    def __bool__(self):
+        return self is ProbeState.UP or self is ProbeState.DEGRADED
+
+    @classmethod
+    def from_rtt(cls, rtt) -> 'ProbeState':
+        """
+        Converts a round trip time into a state: None is DOWN, ProbeState.TIMEOUT, ProbeState.DNS_FAILURE
+        and ProbeState.UNREACHABLE stay as they are and any measured time is UP.
+        """
+        if rtt is cls.TIMEOUT or rtt is cls.DNS_FAILURE or rtt is cls.UNREACHABLE:
+            return rtt
+        if rtt is None:
+            return cls.DOWN
+        return cls.UP
@@ -0,0 +1,133 @@
+"""
+QuantileSketch.py
+
+Streaming latency percentiles (p50, p95, p99, ...) in constant memory,
+instead of keeping every measurement to sort it.
+"""
+from math import ceil, log
+from typing import Dict, Iterable
+
+
+class QuantileSketch:
+    """
+    Class QuantileSketch:
+    Log-bucketed quantile sketch (in the style of DDSketch) for positive values such as latencies.
+
+    Each value is counted in the bucket ceil(log(value, gamma)), with gamma = (1 + accuracy) / (1 - accuracy),
+    so any quantile is answered within a relative error of accuracy. Buckets only exist for the ranges values
+    actually fell in, and at most max_buckets are kept: beyond that the lowest buckets are merged together,
+    which only costs accuracy for the very fastest values. Sketches with the same accuracy can be merged.
+
+    Parameters:
+    - accuracy (float): Relative accuracy of the quantiles, between 0 and 1. Defaults to DEFAULT_ACCURACY.
+    - max_buckets (int): Maximum number of buckets kept. Defaults to DEFAULT_MAX_BUCKETS.
+
+    Properties:
+    - count: Number of values added.
+    - total: Sum of the values added.
+
+    Methods:
+    - add: Adds a value.
+    - quantile: The value at a quantile (0 to 1), None if the sketch is empty.
+    - quantiles: Dictionary of quantile to value for several quantiles at once.
+    - merge: Adds the values counted by another sketch.
+    - copy: An independent copy of the sketch.
+    """
+    DEFAULT_ACCURACY = 0.01
+    DEFAULT_MAX_BUCKETS = 1024
+    DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+    # values at or below this are counted as zero, rather than in an ever lower bucket.
+    MIN_VALUE = 1e-9
+
+    __slots__ = ('accuracy', 'max_buckets', '_gamma', '_log_gamma', '_buckets', '_zero_count', 'count', 'total')
+
+    def __init__(self, accuracy: float = None, max_buckets: int = None):
+        self.accuracy = accuracy or self.DEFAULT_ACCURACY
+        if not 0 < self.accuracy < 1:
+            raise ValueError("accuracy must be between 0 and 1")
+        self.max_buckets = max_buckets or self.DEFAULT_MAX_BUCKETS
+        self._gamma = (1 + self.accuracy) / (1 - self.accuracy)
+        self._log_gamma = log(self._gamma)
+        self._buckets: Dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+        self.total = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value: float) -> None:
+        """
+        Adds value. Negative values are counted as zero.
+        """
+        self.count += 1
+        self.total += value
+        if value <= self.MIN_VALUE:
+            self._zero_count += 1
+            return
+        index = ceil(log(value) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        if len(self._buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """
+        Merges the lowest buckets into one, so no more than max_buckets are kept.
+        """
+        indexes = sorted(self._buckets)
+        excess = len(indexes) - self.max_buckets
+        merged = sum(self._buckets.pop(index) for index in indexes[:excess])
+        self._buckets[indexes[excess]] += merged
+
+    def quantile(self, q: float):
+        """
+        Returns the value at quantile q (e.g. 0.95 for p95), or None if no value was added.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("quantile must be between 0 and 1")
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self._zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if rank < seen:
+                # the middle of the bucket (gamma^(index-1), gamma^index], relative to both of its edges.
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+    def quantiles(self, qs: Iterable[float] = None) -> Dict[float, float]:
+        """
+        Returns a dictionary of quantile to value for every quantile in qs (defaults to DEFAULT_QUANTILES),
+        empty if no value was added.
+        """
+        if not self.count:
+            return {}
+        return {q: self.quantile(q) for q in (qs or self.DEFAULT_QUANTILES)}
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        """
+        Adds every value counted by other, which must have the same accuracy.
+        """
+        if other.accuracy != self.accuracy:
+            raise ValueError("only sketches with the same accuracy can be merged")
+        for index, bucket_count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + bucket_count
+        self._zero_count += other._zero_count
+        self.count += other.count
+        self.total += other.total
+        if len(self._buckets) > self.max_buckets:
+            self._collapse()
+
+    def copy(self) -> 'QuantileSketch':
+        """
+        Returns an independent copy of the sketch.
+        """
+        sketch = QuantileSketch(self.accuracy, self.max_buckets)
+        sketch._buckets = dict(self._buckets)
+        sketch._zero_count = self._zero_count
+        sketch.count = self.count
+        sketch.total = self.total
+        return sketch
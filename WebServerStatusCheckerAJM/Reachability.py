@@ -0,0 +1,303 @@
+"""
+Reachability.py
+
+In-process host reachability checks that replace forking a ping subprocess for every check.
+Uses unprivileged ICMP datagram sockets where the kernel allows them
+(on linux this depends on net.ipv4.ping_group_range) and falls back to timing a TCP connection otherwise.
+Host names are resolved through the shared DNSCache.
+"""
+import errno
+import os
+import selectors
+import socket
+import struct
+from select import select
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from WebServerStatusCheckerAJM.DNSCache import DNSCache
+except (ModuleNotFoundError, ImportError):
+    from DNSCache import DNSCache
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def icmp_checksum(data: bytes) -> int:
+    """
+    Returns the internet checksum (RFC 1071) of data.
+    """
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(identifier: int, sequence: int, payload: bytes = b'WSSC') -> bytes:
+    """
+    Builds an ICMP echo request packet with the given identifier, sequence number and payload.
+    """
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier & 0xFFFF, sequence & 0xFFFF)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum,
+                       identifier & 0xFFFF, sequence & 0xFFFF) + payload
+
+
+def parse_echo_reply(packet: bytes) -> Optional[tuple]:
+    """
+    Returns the (identifier, sequence) of an ICMP echo reply packet, or None if it is not an echo reply.
+    Some platforms include the IP header on datagram ICMP sockets, so it is stripped if present.
+    """
+    if len(packet) >= 20 and packet[0] >> 4 == 4:
+        packet = packet[(packet[0] & 0x0F) * 4:]
+    if len(packet) < 8:
+        return None
+    icmp_type, _code, _checksum, identifier, sequence = struct.unpack('!BBHHH', packet[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return identifier, sequence
+
+
+class ReachabilityProbe:
+    """
+    Class ReachabilityProbe:
+    Checks whether a host is reachable and measures the round trip time, without spawning a process.
+
+    Parameters:
+    - timeout (float): Seconds to wait for an answer. Defaults to DEFAULT_TIMEOUT.
+    - method (str): 'icmp', 'tcp' or 'auto'. 'auto' (the default) uses ICMP when the kernel allows
+      unprivileged ICMP sockets and TCP connect otherwise.
+    - tcp_ports (Iterable[int]): Ports tried, all at once, by the TCP connect check. Defaults to DEFAULT_TCP_PORTS.
+        A port that refuses the connection answers just as well as one that accepts it, unless refused_is_up
+        is False: behind a firewall that REJECTs (rather than drops) traffic, every host would look reachable.
+    - refused_is_up (bool): Whether a refused TCP connection counts as reachable. Defaults to True.
+
+    Methods:
+    - rtt: Returns the round trip time to a host in seconds, or None if it is unreachable.
+    - rtt_many: Sweeps many hosts at once and returns a dictionary of host to round trip time.
+    - is_reachable: Returns True if the host is reachable.
+    - icmp_rtt: ICMP echo round trip time using an unprivileged datagram socket.
+    - tcp_rtt: Time taken for a TCP connection attempt to be answered (accepted or, if refused_is_up, refused).
+    - icmp_rtt_many: ICMP sweep of many hosts from a single socket.
+    - tcp_rtt_many: TCP connect sweep of many hosts with all connections in flight at once.
+    """
+    DEFAULT_TIMEOUT = 2.0
+    DEFAULT_TCP_PORTS = (80, 443)
+    VALID_METHODS = ('auto', 'icmp', 'tcp')
+
+    _icmp_available = None
+
+    def __init__(self, timeout: float = None, method: str = 'auto', tcp_ports: Iterable[int] = None,
+                 refused_is_up: bool = True):
+        if method not in self.VALID_METHODS:
+            raise ValueError(f"method must be one of {self.VALID_METHODS}")
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self.method = method
+        self.tcp_ports = tuple(tcp_ports or self.DEFAULT_TCP_PORTS)
+        self.refused_is_up = refused_is_up
+        self._sequence = 0
+
+    @classmethod
+    def icmp_available(cls) -> bool:
+        """
+        True if this process is allowed to open an unprivileged ICMP datagram socket.
+        The result is checked once and then cached for the life of the process.
+        """
+        if cls._icmp_available is None:
+            try:
+                socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+                cls._icmp_available = True
+            except (OSError, AttributeError):
+                cls._icmp_available = False
+        return cls._icmp_available
+
+    @staticmethod
+    def open_icmp_socket() -> socket.socket:
+        """
+        Opens a non-blocking unprivileged ICMP datagram socket.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        sock.setblocking(False)
+        return sock
+
+    def next_sequence(self) -> int:
+        """
+        Returns the next ICMP sequence number for this probe.
+        """
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        return self._sequence
+
+    def icmp_rtt(self, host: str) -> Optional[float]:
+        """
+        Sends a single ICMP echo request to host and returns the round trip time in seconds,
+        or None if no reply was received within the timeout or the host could not be resolved.
+        Raises an OSError if this process is not allowed to open ICMP datagram sockets.
+        """
+        try:
+            address = DNSCache.shared().resolve_ipv4(host)
+        except OSError:
+            return None
+        sequence = self.next_sequence()
+        with self.open_icmp_socket() as sock:
+            start = perf_counter()
+            try:
+                sock.sendto(build_echo_request(os.getpid(), sequence), (address, 0))
+            except OSError:
+                return None
+            deadline = start + self.timeout
+            while True:
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    return None
+                readable, _, _ = select([sock], [], [], remaining)
+                if not readable:
+                    return None
+                try:
+                    packet, (reply_address, _port) = sock.recvfrom(1024)
+                except OSError:
+                    return None
+                reply = parse_echo_reply(packet)
+                # the kernel owns the identifier of datagram ICMP sockets, so match on sequence and source.
+                if reply and reply[1] == sequence and reply_address == address:
+                    return perf_counter() - start
+
+    def tcp_rtt(self, host: str) -> Optional[float]:
+        """
+        Tries a TCP connection to every one of tcp_ports on host at the same time (see tcp_rtt_many)
+        and returns how long the first answer took, so a filtered host costs one timeout, not one per port.
+        A refused connection still proves the host is up, so it counts as reachable unless refused_is_up is False.
+        Returns None if no port answered within the timeout or host could not be resolved.
+        """
+        return self.tcp_rtt_many([host])[host]
+
+    def rtt(self, host: str) -> Optional[float]:
+        """
+        Returns the round trip time to host in seconds using the configured method,
+        or None if the host is unreachable.
+        """
+        if self.method == 'icmp' or (self.method == 'auto' and self.icmp_available()):
+            return self.icmp_rtt(host)
+        return self.tcp_rtt(host)
+
+    @staticmethod
+    def resolve_hosts(hosts: Iterable[str]) -> Dict[str, List[str]]:
+        """
+        Resolves each host to an IPv4 address and returns a dictionary of address to the hosts that resolved to it.
+        Hosts that can not be resolved are left out.
+        """
+        addresses = {}
+        for host in hosts:
+            try:
+                addresses.setdefault(DNSCache.shared().resolve_ipv4(host), []).append(host)
+            except OSError:
+                continue
+        return addresses
+
+    def icmp_rtt_many(self, hosts: Iterable[str]) -> Dict[str, Optional[float]]:
+        """
+        Sends one ICMP echo request to every host from a single datagram socket and waits for the replies,
+        which are matched back to their host by identifier, sequence number and source address.
+        The whole sweep is bounded by one timeout. Returns a dictionary of host to round trip time in seconds,
+         None for hosts that did not reply or could not be resolved.
+        Raises an OSError if this process is not allowed to open ICMP datagram sockets.
+        """
+        hosts = list(dict.fromkeys(hosts))
+        results: Dict[str, Optional[float]] = {host: None for host in hosts}
+        pending = {}
+        with self.open_icmp_socket() as sock:
+            for address, address_hosts in self.resolve_hosts(hosts).items():
+                sequence = self.next_sequence()
+                try:
+                    sock.sendto(build_echo_request(os.getpid(), sequence), (address, 0))
+                except OSError:
+                    continue
+                pending[(address, sequence)] = (perf_counter(), address_hosts)
+            # for datagram ICMP sockets the kernel replaces the identifier with the socket's "port".
+            identifier = sock.getsockname()[1] or os.getpid() & 0xFFFF
+
+            deadline = perf_counter() + self.timeout
+            while pending:
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select([sock], [], [], remaining)
+                if not readable:
+                    break
+                try:
+                    packet, (reply_address, _port) = sock.recvfrom(1024)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    break
+                reply = parse_echo_reply(packet)
+                if not reply or reply[0] != identifier:
+                    continue
+                sent = pending.pop((reply_address, reply[1]), None)
+                if sent:
+                    start, address_hosts = sent
+                    for host in address_hosts:
+                        results[host] = perf_counter() - start
+        return results
+
+    def tcp_rtt_many(self, hosts: Iterable[str]) -> Dict[str, Optional[float]]:
+        """
+        Starts a non-blocking TCP connection to each of tcp_ports on every host at the same time and waits for
+        the answers, so the whole sweep is bounded by one timeout, and ends as soon as every host answered.
+         Accepted connections, and refused ones while refused_is_up, count as reachable.
+        Returns a dictionary of host to round trip time in seconds, None for unreachable hosts.
+        """
+        hosts = list(dict.fromkeys(hosts))
+        results: Dict[str, Optional[float]] = {host: None for host in hosts}
+        answered = (0, errno.ECONNREFUSED) if self.refused_is_up else (0,)
+        with selectors.DefaultSelector() as selector:
+            for address, address_hosts in self.resolve_hosts(hosts).items():
+                for port in self.tcp_ports:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    start = perf_counter()
+                    error = sock.connect_ex((address, port))
+                    if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                        if error in answered:
+                            for host in address_hosts:
+                                results[host] = perf_counter() - start
+                        sock.close()
+                        continue
+                    selector.register(sock, selectors.EVENT_WRITE, (start, address_hosts))
+
+            deadline = perf_counter() + self.timeout
+            while selector.get_map() and any(results[host] is None for key in selector.get_map().values()
+                                             for host in key.data[1]):
+                remaining = deadline - perf_counter()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    start, address_hosts = key.data
+                    error = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if error in answered:
+                        for host in address_hosts:
+                            if results[host] is None:
+                                results[host] = perf_counter() - start
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+            for key in list(selector.get_map().values()):
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+        return results
+
+    def rtt_many(self, hosts: Iterable[str]) -> Dict[str, Optional[float]]:
+        """
+        Checks every host in one sweep using the configured method and returns a dictionary of
+        host to round trip time in seconds, None for hosts that are unreachable.
+        """
+        if self.method == 'icmp' or (self.method == 'auto' and self.icmp_available()):
+            return self.icmp_rtt_many(hosts)
+        return self.tcp_rtt_many(hosts)
+
+    def is_reachable(self, host: str) -> bool:
+        """
+        Returns True if host is reachable using the configured method.
+        """
+        return self.rtt(host) is not None
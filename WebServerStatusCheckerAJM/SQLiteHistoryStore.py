@@ -0,0 +1,303 @@
+"""
+SQLiteHistoryStore.py
+
+Optional durable check history in a local SQLite database.
+Results are queued by the checkers and written in batches by a background thread,
+so disk I/O never stalls a check.
+"""
+import sqlite3
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import monotonic, time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from WebServerStatusCheckerAJM.StatusHistory import HistoryRecord, StatusHistory
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+    from WebServerStatusCheckerAJM.PortStateMachine import PortStateMachine
+except (ModuleNotFoundError, ImportError):
+    from StatusHistory import HistoryRecord, StatusHistory
+    from LazyLogger import LazyLogger
+    from PortStateMachine import PortStateMachine
+
+
+class SQLiteHistoryStore:
+    """
+    Class SQLiteHistoryStore:
+    Writes every check result, and every change of a port's overall state, to a SQLite database.
+
+    record() only puts the result on a bounded queue; a background writer thread takes every result already queued
+    (up to batch_size at a time) and inserts them in one transaction.
+    If the queue is full, results are dropped (and counted in dropped) rather than making the checker wait.
+    The database uses WAL journaling, so queries can read while the writer writes.
+
+    Every retention_interval seconds the writer applies the retention policy: raw checks older than
+    retention_days are downsampled into one row per target, port and hour in checks_hourly and then deleted,
+    and hourly rows older than downsampled_retention_days are deleted.
+
+    Parameters:
+    - path (str): Path of the database file, created if needed.
+    - batch_size (int): Maximum results written per transaction. Defaults to DEFAULT_BATCH_SIZE.
+    - flush_interval (float): Seconds the writer waits for new results before checking if retention is due.
+        Defaults to DEFAULT_FLUSH_INTERVAL.
+    - queue_size (int): Maximum results waiting to be written. Defaults to DEFAULT_QUEUE_SIZE.
+    - retention_days (float): Days raw checks are kept. Defaults to DEFAULT_RETENTION_DAYS.
+    - downsampled_retention_days (float): Days hourly rows are kept. Defaults to DEFAULT_DOWNSAMPLED_RETENTION_DAYS.
+    - retention_interval (float): Seconds between retention runs. Defaults to DEFAULT_RETENTION_INTERVAL.
+
+    Methods:
+    - record: Queues a snapshot of a target to be written.
+    - flush: Waits until every queued result has been written.
+    - apply_retention: Downsamples and deletes old rows now.
+    - checks / transitions / hourly: Query the stored history.
+    - close: Writes what is queued and stops the writer thread.
+    """
+    LOGGER = LazyLogger()
+    DEFAULT_BATCH_SIZE = 500
+    DEFAULT_FLUSH_INTERVAL = 1.0
+    DEFAULT_QUEUE_SIZE = 10000
+    DEFAULT_RETENTION_DAYS = 7
+    DEFAULT_DOWNSAMPLED_RETENTION_DAYS = 365
+    DEFAULT_RETENTION_INTERVAL = 3600.0
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS checks (
+            target TEXT NOT NULL, port INTEGER NOT NULL, timestamp REAL NOT NULL,
+            states INTEGER NOT NULL, latency REAL);
+        CREATE INDEX IF NOT EXISTS checks_target_port_timestamp ON checks (target, port, timestamp);
+        CREATE TABLE IF NOT EXISTS transitions (
+            target TEXT NOT NULL, port INTEGER NOT NULL, timestamp REAL NOT NULL,
+            from_state TEXT, to_state TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS transitions_target_port_timestamp ON transitions (target, port, timestamp);
+        CREATE TABLE IF NOT EXISTS checks_hourly (
+            target TEXT NOT NULL, port INTEGER NOT NULL, hour REAL NOT NULL,
+            checks INTEGER NOT NULL, down INTEGER NOT NULL, latency_sum REAL NOT NULL, latency_count INTEGER NOT NULL,
+            PRIMARY KEY (target, port, hour));
+    """
+    _STOP = object()
+
+    def __init__(self, path: str, batch_size: int = None, flush_interval: float = None, queue_size: int = None,
+                 retention_days: float = None, downsampled_retention_days: float = None,
+                 retention_interval: float = None):
+        self.path = path
+        self.batch_size = batch_size or self.DEFAULT_BATCH_SIZE
+        self.flush_interval = flush_interval or self.DEFAULT_FLUSH_INTERVAL
+        self.retention_days = retention_days or self.DEFAULT_RETENTION_DAYS
+        self.downsampled_retention_days = downsampled_retention_days or self.DEFAULT_DOWNSAMPLED_RETENTION_DAYS
+        self.retention_interval = retention_interval or self.DEFAULT_RETENTION_INTERVAL
+        self.dropped = 0
+        self._queue = Queue(maxsize=queue_size or self.DEFAULT_QUEUE_SIZE)
+        self._last_states: Dict[Tuple[str, int], str] = {}
+        self._lock = Lock()
+
+        connection = self.connect()
+        try:
+            with connection:
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.executescript(self.SCHEMA)
+        finally:
+            connection.close()
+        self._writer = Thread(target=self._write_batches, name='history-store', daemon=True)
+        self._writer.start()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Opens a new connection to the database. Each thread must use its own connection.
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    @staticmethod
+    def overall_state(snapshot) -> str:
+        """
+        The overall state of a snapshot: 'UP', 'DEGRADED' if it is up but a component is slow,
+        'DNS_FAILURE' if it is down because the server host name did not resolve,
+        'TIMEOUT' if it is down because something timed out, or 'DOWN'.
+        """
+        return PortStateMachine.state_of(snapshot).value
+
+    def record(self, target: str, snapshot, state: str = None) -> bool:
+        """
+        Queues snapshot (a ProbeSnapshot) of target to be written, along with a transition row if the state
+        of the port changed. state is the port's state after snapshot, e.g. its PortStateMachine state,
+        so the transitions follow its hysteresis; it defaults to the overall state of the snapshot alone.
+        Never blocks: returns False, and counts the result in dropped, if the queue is full.
+        """
+        if state is None:
+            state = self.overall_state(snapshot)
+        with self._lock:
+            previous = self._last_states.get((target, snapshot.port))
+            self._last_states[(target, snapshot.port)] = state
+        transition = (previous, state) if previous != state else None
+        try:
+            self._queue.put_nowait((target, snapshot, transition))
+            return True
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _write_batches(self) -> None:
+        connection = self.connect()
+        connection.create_function('is_down', 1, self._packed_is_down, deterministic=True)
+        next_retention = monotonic()
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                try:
+                    if batch:
+                        self._write(connection, batch)
+                    if monotonic() >= next_retention:
+                        self._apply_retention(connection)
+                        next_retention = monotonic() + self.retention_interval
+                finally:
+                    for _ in range(len(batch) + stop):
+                        self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            connection.close()
+
+    def _next_batch(self) -> Tuple[list, bool]:
+        """
+        Waits up to flush_interval seconds for the first result, then takes whatever else is already queued,
+        up to batch_size results. Returns the batch and whether the writer was asked to stop.
+        """
+        batch = []
+        try:
+            item = self._queue.get(timeout=self.flush_interval)
+            while True:
+                if item is self._STOP:
+                    return batch, True
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                item = self._queue.get_nowait()
+        except Empty:
+            pass
+        return batch, False
+
+    def _write(self, connection: sqlite3.Connection, batch: list) -> None:
+        checks, transitions = [], []
+        for target, snapshot, transition in batch:
+            checks.append((target, snapshot.port, snapshot.timestamp,
+                           StatusHistory.pack_states(*(getattr(snapshot, name) for name in StatusHistory.COMPONENTS)),
+                           snapshot.latency))
+            if transition:
+                transitions.append((target, snapshot.port, snapshot.timestamp, *transition))
+        try:
+            with connection:
+                connection.executemany('INSERT INTO checks VALUES (?, ?, ?, ?, ?)', checks)
+                connection.executemany('INSERT INTO transitions VALUES (?, ?, ?, ?, ?)', transitions)
+        except sqlite3.Error as e:
+            self.LOGGER.error("could not write %d check(s) to %s due to - %s", len(checks), self.path, e)
+
+    @staticmethod
+    def _packed_is_down(states: int) -> int:
+        return int(not all(StatusHistory.unpack_states(states)))
+
+    def _apply_retention(self, connection: sqlite3.Connection, now: float = None) -> None:
+        now = time() if now is None else now
+        raw_cutoff = now - self.retention_days * 86400
+        hourly_cutoff = now - self.downsampled_retention_days * 86400
+        try:
+            with connection:
+                connection.execute("""
+                    INSERT INTO checks_hourly (target, port, hour, checks, down, latency_sum, latency_count)
+                    SELECT target, port, CAST(timestamp / 3600 AS INTEGER) * 3600 AS hour, COUNT(*),
+                           SUM(is_down(states)), TOTAL(latency), COUNT(latency)
+                    FROM checks WHERE timestamp < ? GROUP BY target, port, hour
+                    ON CONFLICT (target, port, hour) DO UPDATE SET
+                        checks = checks + excluded.checks, down = down + excluded.down,
+                        latency_sum = latency_sum + excluded.latency_sum,
+                        latency_count = latency_count + excluded.latency_count""", (raw_cutoff,))
+                connection.execute('DELETE FROM checks WHERE timestamp < ?', (raw_cutoff,))
+                connection.execute('DELETE FROM transitions WHERE timestamp < ?', (hourly_cutoff,))
+                connection.execute('DELETE FROM checks_hourly WHERE hour < ?', (hourly_cutoff,))
+        except sqlite3.Error as e:
+            self.LOGGER.error("could not apply the retention policy to %s due to - %s", self.path, e)
+
+    def apply_retention(self, now: float = None) -> None:
+        """
+        Applies the retention policy now, as of the POSIX timestamp now (defaults to the current time),
+        from a connection of the calling thread. The writer thread also does this every retention_interval seconds.
+        """
+        with self.connect() as connection:
+            connection.create_function('is_down', 1, self._packed_is_down, deterministic=True)
+            self._apply_retention(connection, now)
+        connection.close()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits up to timeout seconds (forever if None) until every queued result has been written.
+        Returns True if the queue was emptied.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    @staticmethod
+    def _range_query(table: str, time_column: str, target: str, port: Optional[int],
+                     start: Optional[float], end: Optional[float]) -> Tuple[str, list]:
+        query, params = f'SELECT * FROM {table} WHERE target = ?', [target]
+        if port is not None:
+            query += ' AND port = ?'
+            params.append(port)
+        if start is not None:
+            query += f' AND {time_column} >= ?'
+            params.append(start)
+        if end is not None:
+            query += f' AND {time_column} <= ?'
+            params.append(end)
+        return query + f' ORDER BY {time_column}', params
+
+    def _fetch(self, query: str, params: list) -> list:
+        connection = self.connect()
+        try:
+            return connection.execute(query, params).fetchall()
+        finally:
+            connection.close()
+
+    def checks(self, target: str, port: int = None, start: float = None, end: float = None) -> List[HistoryRecord]:
+        """
+        Returns the raw checks of target (and port, if given) with start <= timestamp <= end, oldest first.
+        """
+        rows = self._fetch(*self._range_query('checks', 'timestamp', target, port, start, end))
+        return [HistoryRecord(timestamp, port, *StatusHistory.unpack_states(states), latency=latency)
+                for _target, port, timestamp, states, latency in rows]
+
+    def transitions(self, target: str, port: int = None, start: float = None,
+                    end: float = None) -> List[Tuple[int, float, Optional[str], str]]:
+        """
+        Returns the (port, timestamp, from_state, to_state) changes of target's overall state, oldest first.
+        from_state is None for the first check of a port.
+        """
+        rows = self._fetch(*self._range_query('transitions', 'timestamp', target, port, start, end))
+        return [row[1:] for row in rows]
+
+    def hourly(self, target: str, port: int = None, start: float = None,
+               end: float = None) -> List[Tuple[int, float, int, int, Optional[float]]]:
+        """
+        Returns the downsampled (port, hour, checks, down checks, mean latency) rows of target, oldest first.
+        """
+        rows = self._fetch(*self._range_query('checks_hourly', 'hour', target, port, start, end))
+        return [(port, hour, checks, down, latency_sum / latency_count if latency_count else None)
+                for _target, port, hour, checks, down, latency_sum, latency_count in rows]
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Writes everything still queued and stops the writer thread, waiting up to timeout seconds for it.
+        """
+        if not self._writer.is_alive():
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except Full:
+            self.LOGGER.warning("history store %s is still busy, results still queued are lost", self.path)
+            return
+        self._writer.join(timeout)
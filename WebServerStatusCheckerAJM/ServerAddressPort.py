@@ -1,5 +1,6 @@
 from abc import abstractmethod
 from typing import List
+from urllib.parse import urlsplit
 
 
 class ServerAddressPort:
@@ -23,9 +24,13 @@ class ServerAddressPort:
     - server_ports: Getter property to retrieve the list of server ports ensuring they are integers.
     - active_server_port: Getter and setter property to manage the active server port.
     - server_web_address: Getter property to handle the server web address ensuring it is formatted correctly.
+    - server_host: Getter property for the host name part of the server web address.
     - server_web_page: Getter property to retrieve the server webpage.
     - server_full_address: Getter property to construct the full server address with port and webpage.
 
+    Methods:
+    - full_address_for_port: Construct the full server address for any of the server ports.
+
     Note:
     - The class provides validation and handling of server address, ports, and web page for server communication.
     """
@@ -124,6 +129,14 @@ class ServerAddressPort:
             raise TypeError("self._server_web_address must be a string")
         return self._server_web_address
 
+    @property
+    def server_host(self) -> str:
+        """
+        The host name (or IP address) part of the server web address, without scheme, port or path.
+        This is what gets pinged to check the machine status.
+        """
+        return urlsplit(self.server_web_address).hostname
+
     @property
     def server_web_page(self):
         """
@@ -145,10 +158,19 @@ class ServerAddressPort:
 
         Returns the server's full address.
         """
-        self._server_full_address = ('/'.join(self.server_web_address.rsplit('/', maxsplit=1)[:-1])
-                                     + f':{self.active_server_port}/' + self.server_web_page)
-        if self._server_full_address.endswith('/'):
+        self._server_full_address = self.full_address_for_port(self.active_server_port)
+        return self._server_full_address
+
+    def full_address_for_port(self, port: int) -> str:
+        """
+        Constructs the full address of the server for the given port, using the server's web address
+         and web page information. If the constructed address does not end with a '/', a trailing '/' is added.
+          Unlike server_full_address this does not depend on (or change) the active server port.
+        """
+        full_address = ('/'.join(self.server_web_address.rsplit('/', maxsplit=1)[:-1])
+                        + f':{port}/' + self.server_web_page)
+        if full_address.endswith('/'):
             pass
         else:
-            self._server_full_address = self._server_full_address + '/'
-        return self._server_full_address
+            full_address = full_address + '/'
+        return full_address
@@ -0,0 +1,334 @@
+"""
+ShardedFleetMonitor.py
+
+Splits a very large fleet over several worker processes, so checking it is no longer bound to the one CPU core
+a single Python process can use. Each worker checks its share of the targets with its own FleetMonitor
+and streams the snapshots back to the coordinating process, which does the alerting, history, metrics and logging.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+from sys import exit as sys_exit
+from time import monotonic
+from typing import Dict, List, Union
+
+try:
+    from WebServerStatusCheckerAJM.WebServerStatusCheckerAJM import WebServerStatusCheck
+    from WebServerStatusCheckerAJM.FleetMonitor import FleetMonitor
+    from WebServerStatusCheckerAJM.ConsistentHashRing import ConsistentHashRing
+    from WebServerStatusCheckerAJM.AlertDispatcher import AlertDispatcher
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+    from WebServerStatusCheckerAJM.ProbeCycle import ProbeSnapshot
+except (ModuleNotFoundError, ImportError):
+    from WebServerStatusCheckerAJM import WebServerStatusCheck
+    from FleetMonitor import FleetMonitor
+    from ConsistentHashRing import ConsistentHashRing
+    from AlertDispatcher import AlertDispatcher
+    from LazyLogger import LazyLogger
+    from ProbeCycle import ProbeSnapshot
+
+
+class _ShardFleet(FleetMonitor):
+    """
+    FleetMonitor run by a worker process, which sends its results to the coordinator instead of logging them.
+    """
+    def __init__(self, shard: int, results, targets: List[dict], **kwargs):
+        self.shard = shard
+        self._results = results
+        super().__init__(targets, silent_run=True, **kwargs)
+
+    def log_results(self, cycle_results: Dict[str, Dict[int, ProbeSnapshot]]) -> None:
+        self._results.put((self.shard, cycle_results))
+
+
+def _run_shard(shard: int, targets: List[dict], kwargs: dict, sleep_time: int, results, once: bool) -> None:
+    """
+    Worker process: checks targets with a FleetMonitor, once or forever, and puts every cycle's results
+    on the results queue as (shard, cycle results). Alerting is left to the coordinator.
+    """
+    fleet = _ShardFleet(shard, results, targets, alert_dispatcher=AlertDispatcher(), async_logging=False, **kwargs)
+    try:
+        if once:
+            fleet.log_results(fleet.check_once())
+        else:
+            fleet.local_uplink.start()
+            asyncio.run(fleet.run(sleep_time))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        fleet.LOGGER.error(e, exc_info=True)
+        raise e
+    finally:
+        if not once:
+            fleet.local_uplink.stop()
+        fleet.shutdown_executor()
+        fleet.alert_dispatcher.close()
+
+
+class ShardedFleetMonitor:
+    """
+    Class ShardedFleetMonitor:
+    Checks a fleet (see FleetMonitor for the targets and keyword arguments) from a pool of worker processes.
+
+    Targets are assigned to workers by consistent hashing of their names (see ConsistentHashRing), so a target
+    is always checked by the same worker, and changing the number of workers only moves the targets of the workers
+    added or removed. Each worker runs a FleetMonitor over its shard with its own scheduler, connection pools
+    and DNS cache, and streams its results back over a queue.
+    The coordinating process keeps a FleetMonitor of every target that does not check anything itself: it stores
+    the snapshots from the workers, so history, uptime analytics, metrics (and the metrics server) and alerts
+    all work as they do for a FleetMonitor, and prints and logs them. A worker that dies is started again.
+
+    The coordinator-only keyword arguments (COORDINATOR_KEYS) are kept in the coordinator, every other keyword
+    argument is passed on to the workers, so it must be picklable.
+    With the default 'spawn' start method, MainLoop and check_once must be called from under an
+    `if __name__ == '__main__':` guard.
+
+    Parameters:
+    - targets (List[Union[str, dict]]): The fleet, as for FleetMonitor.
+    - workers (int): Number of worker processes. Defaults to the number of CPU cores.
+    - silent_run (bool): Whether to run without printing anything.
+    - start_method (str): multiprocessing start method of the workers. Defaults to 'spawn'.
+
+    Properties:
+    - fleet: The coordinator's FleetMonitor, holding the state of every target.
+    - targets / results / down_targets / history / metrics / alert_dispatcher: As for FleetMonitor.
+    - shards: Dictionary of worker number to the names of the targets it checks.
+
+    Methods:
+    - add_target: Adds a target to the fleet, before the workers are started.
+    - store_results / log_results: Store, or print and log, the results received from the workers.
+    - check_once: Checks the whole fleet once from the workers and returns the results.
+    - MainLoop: Checks the whole fleet from the workers every sleep_time seconds, forever.
+    """
+    LOGGER = LazyLogger()
+    COORDINATOR_KEYS = ('alert_dispatcher', 'alert_sinks', 'alert_webhook_url', 'alert_dedup_window',
+                        'alert_rate_limit', 'alert_rate_period', 'history_store', 'history_db', 'history_size',
+                        'uptime_analytics', 'metrics', 'metrics_port', 'metrics_host', 'scheduler',
+                        'log_queue', 'async_logging', 'state_machine')
+    DEFAULT_START_METHOD = 'spawn'
+    # seconds a worker is given to start (import the package and build its checkers) on top of a cycle.
+    STARTUP_TIMEOUT = 30.0
+    RESULT_POLL_INTERVAL = 1.0
+    RESTART_DELAY = 5.0
+
+    def __init__(self, targets: List[Union[str, dict]], workers: int = None, silent_run: bool = False,
+                 start_method: str = None, **kwargs):
+        self.workers = workers or os.cpu_count() or 1
+        self._silent_run = silent_run
+        self.fleet = FleetMonitor([], silent_run=True, **kwargs)
+        self._worker_kwargs = {key: value for key, value in kwargs.items() if key not in self.COORDINATOR_KEYS}
+        self._worker_targets: Dict[str, dict] = {}
+        self.ring = ConsistentHashRing(range(self.workers))
+        self._context = multiprocessing.get_context(start_method or self.DEFAULT_START_METHOD)
+        self._results = None
+        self._processes: Dict[int, multiprocessing.process.BaseProcess] = {}
+        self._restart_at: Dict[int, float] = {}
+
+        for target in targets:
+            self.add_target(target)
+
+        if not self.silent_run:
+            print(f"Initialized sharded fleet monitor with {len(self._worker_targets)} target(s)"
+                  f" over {self.workers} worker(s)...")
+
+    @property
+    def silent_run(self):
+        """
+        Whether the coordinator prints nothing to the console. The workers always run silently.
+        """
+        return self._silent_run
+
+    @property
+    def targets(self) -> Dict[str, WebServerStatusCheck]:
+        """
+        Dictionary of target name to the coordinator's checker for it, which is fed the workers' snapshots.
+        """
+        return self.fleet.targets
+
+    @property
+    def results(self) -> Dict[str, Dict[int, ProbeSnapshot]]:
+        """
+        Dictionary of target name to the latest snapshot of every port, as streamed back by the workers.
+        """
+        return self.fleet.results
+
+    @property
+    def down_targets(self) -> Dict[str, List[int]]:
+        """
+        Dictionary of target name to the ports of that target that were down in their latest snapshot.
+        """
+        return self.fleet.down_targets
+
+    @property
+    def history(self):
+        """
+        Dictionary of target name to the StatusHistory of that target's checks, kept by the coordinator.
+        """
+        return self.fleet.history
+
+    @property
+    def metrics(self):
+        """
+        The ProbeMetrics of the whole fleet, kept by the coordinator.
+        """
+        return self.fleet.metrics
+
+    @property
+    def alert_dispatcher(self):
+        """
+        The AlertDispatcher the coordinator sends the alerts of every target through.
+        """
+        return self.fleet.alert_dispatcher
+
+    @property
+    def shards(self) -> Dict[int, List[str]]:
+        """
+        Dictionary of worker number to the names of the targets that worker checks.
+        """
+        return self.ring.assign(self._worker_targets)
+
+    def add_target(self, target: Union[str, dict]) -> WebServerStatusCheck:
+        """
+        Adds a target to the coordinator's fleet and returns its checker (see FleetMonitor.add_target).
+        The workers only check the targets that were added before they were started.
+        """
+        checker = self.fleet.add_target(target)
+        worker_target = dict(target) if isinstance(target, dict) else {'server_web_address': target}
+        # the coordinator's name for the target, so the worker's results come back under the same name.
+        worker_target['name'] = checker.target_name
+        self._worker_targets[checker.target_name] = worker_target
+        return checker
+
+    def _start_worker(self, shard: int, sleep_time: int, once: bool = False) -> bool:
+        """
+        Starts the worker process for shard, unless the shard has no targets. Returns whether one was started.
+        """
+        names = self.shards[shard]
+        if not names:
+            return False
+        process = self._context.Process(
+            target=_run_shard, name=f'wssc-shard-{shard}', daemon=True,
+            args=(shard, [self._worker_targets[name] for name in names], self._worker_kwargs, sleep_time,
+                  self._results, once))
+        process.start()
+        self._processes[shard] = process
+        return True
+
+    def _restart_dead_workers(self, sleep_time: int) -> None:
+        """
+        Starts again, RESTART_DELAY seconds after it was found dead, every worker process that exited.
+        """
+        now = monotonic()
+        for shard, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            if shard not in self._restart_at:
+                self.LOGGER.warning("shard worker %d exited with code %s, restarting it in %s seconds",
+                                    shard, process.exitcode, self.RESTART_DELAY)
+                self._restart_at[shard] = now + self.RESTART_DELAY
+            elif now >= self._restart_at[shard]:
+                del self._restart_at[shard]
+                self._start_worker(shard, sleep_time)
+
+    def _stop_workers(self) -> None:
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(5)
+        self._processes.clear()
+        self._restart_at.clear()
+
+    def store_results(self, cycle_results: Dict[str, Dict[int, ProbeSnapshot]]) -> Dict[str, Dict[int, ProbeSnapshot]]:
+        """
+        Stores every snapshot received from a worker in the coordinator's checker of its target, which records
+        it in history, uptime analytics and metrics and raises any alert. Returns the results of known targets.
+        """
+        stored = {}
+        for name, snapshots in cycle_results.items():
+            checker = self.fleet.targets.get(name)
+            if checker is None:
+                continue
+            stored[name] = {port: checker.store_snapshot(snapshot) for port, snapshot in snapshots.items()}
+        return stored
+
+    def log_results(self, cycle_results: Dict[str, Dict[int, ProbeSnapshot]]) -> None:
+        """
+        Prints (unless silent) and logs every snapshot in cycle_results through the checker of its target.
+        """
+        for name, snapshots in cycle_results.items():
+            checker = self.fleet.targets[name]
+            for snapshot in snapshots.values():
+                if not self.silent_run:
+                    print(checker.render_status_string(snapshot))
+                checker.log_status(snapshot)
+
+    def check_once(self, timeout: float = None) -> Dict[str, Dict[int, ProbeSnapshot]]:
+        """
+        Starts a worker per shard to check its targets once, stores and returns the combined results.
+        Workers that have not answered within timeout seconds (defaults to the cycle deadline plus STARTUP_TIMEOUT)
+         are stopped and their targets left out of the results.
+        """
+        self._results = self._context.Queue()
+        pending = {shard for shard in range(self.workers) if self._start_worker(shard, 0, once=True)}
+        deadline = monotonic() + (timeout or self.fleet.cycle_deadline + self.STARTUP_TIMEOUT)
+        combined = {}
+        try:
+            while pending and monotonic() < deadline:
+                try:
+                    shard, cycle_results = self._results.get(timeout=min(self.RESULT_POLL_INTERVAL,
+                                                                         max(deadline - monotonic(), 0)))
+                except queue.Empty:
+                    if not any(self._processes[shard].is_alive() for shard in pending):
+                        break
+                    continue
+                pending.discard(shard)
+                combined.update(self.store_results(cycle_results))
+            if pending:
+                self.LOGGER.warning("shard worker(s) %s did not return results", sorted(pending))
+        finally:
+            self._stop_workers()
+        return combined
+
+    def MainLoop(self, sleep_time: int = 120):
+        """
+        Starts a worker per shard, which checks its targets every sleep_time seconds (or their check_interval),
+         then stores, prints and logs the results as they stream in, restarting any worker that dies.
+        If a KeyboardInterrupt is caught, it prints a termination message and exits.
+         Any other exceptions are logged as errors and re-raised.
+        """
+        try:
+            self._results = self._context.Queue()
+            for shard in range(self.workers):
+                self._start_worker(shard, sleep_time)
+            if self.fleet.metrics_server is not None:
+                self.fleet.metrics_server.start()
+            if self.fleet.log_queue is not None:
+                self.fleet.log_queue.start(self.LOGGER)
+            next_health_check = monotonic()
+            while True:
+                try:
+                    _shard, cycle_results = self._results.get(timeout=self.RESULT_POLL_INTERVAL)
+                    self.log_results(self.store_results(cycle_results))
+                except queue.Empty:
+                    pass
+                if monotonic() >= next_health_check:
+                    self._restart_dead_workers(sleep_time)
+                    next_health_check = monotonic() + self.RESULT_POLL_INTERVAL
+        except KeyboardInterrupt:
+            print("CTRL-C detected, quitting...")
+            sys_exit(-1)
+        except Exception as e:
+            self.LOGGER.error(e, exc_info=True)
+            raise e
+        finally:
+            self._stop_workers()
+            if self.fleet.metrics_server is not None:
+                self.fleet.metrics_server.stop()
+            if self.fleet.log_queue is not None:
+                self.fleet.log_queue.stop()
+            self.fleet.shutdown_executor()
+            self.fleet.alert_dispatcher.close()
+            if self.fleet.history_store is not None:
+                self.fleet.history_store.close()
@@ -0,0 +1,176 @@
+"""
+StatusHistory.py
+
+Keeps the latest results of a target in a fixed-capacity ring buffer of compact records,
+so the memory used per target stays flat no matter how long the monitor runs.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from math import isnan, nan
+from typing import Iterator, List, NamedTuple, Optional
+
+try:
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+except (ModuleNotFoundError, ImportError):
+    from ProbeState import ProbeState
+
+
+class HistoryRecord(NamedTuple):
+    """
+    One check, as read back from a StatusHistory.
+
+    Fields:
+    - timestamp: POSIX timestamp of the check.
+    - port: The port that was checked.
+    - local_machine_status, machine_status, server_status, page_status: ProbeState of each component.
+    - latency: Time in seconds until the http response headers arrived, None if there was no response.
+    """
+    timestamp: float
+    port: int
+    local_machine_status: ProbeState
+    machine_status: ProbeState
+    server_status: ProbeState
+    page_status: ProbeState
+    latency: Optional[float]
+
+    @property
+    def is_down(self) -> bool:
+        """
+        True if any of the components were down.
+        """
+        return not (self.local_machine_status and self.machine_status
+                    and self.server_status and self.page_status)
+
+
+class _TimestampView:
+    """
+    Read-only sequence of the history's timestamps in insertion order, so bisect can search the ring buffer.
+    """
+    __slots__ = ('history',)
+
+    def __init__(self, history: 'StatusHistory'):
+        self.history = history
+
+    def __len__(self):
+        return len(self.history)
+
+    def __getitem__(self, index: int) -> float:
+        return self.history._timestamps[self.history._physical(index)]
+
+
+class StatusHistory:
+    """
+    Class StatusHistory:
+    Fixed-capacity ring buffer of check records for one target, oldest records are overwritten first.
+
+    Records are stored column-wise in pre-allocated arrays, 16 bytes per record: the timestamp (double),
+    the port (unsigned short), the four component states packed 4 bits each into an unsigned short,
+    and the latency (float, NaN for no response). Records are expected to be added in time order,
+    which lets time window queries use a binary search.
+
+    Parameters:
+    - capacity (int): Maximum number of records kept. Defaults to DEFAULT_CAPACITY.
+
+    Methods:
+    - append: Adds a record from a ProbeSnapshot.
+    - last: The latest n records, oldest first, optionally for one port only.
+    - window: The records between two timestamps, optionally for one port only.
+    - clear: Forgets every record.
+    """
+    DEFAULT_CAPACITY = 1440
+    # the order states are encoded in, new ProbeState members are appended so stored codes stay valid.
+    STATES = tuple(ProbeState)
+    STATE_BITS = 4
+    COMPONENTS = ('local_machine_status', 'machine_status', 'server_status', 'page_status')
+
+    __slots__ = ('capacity', '_timestamps', '_ports', '_states', '_latencies', '_start', '_size')
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or self.DEFAULT_CAPACITY
+        self._timestamps = array('d', bytes(8 * self.capacity))
+        self._ports = array('H', bytes(2 * self.capacity))
+        self._states = array('H', bytes(2 * self.capacity))
+        self._latencies = array('f', bytes(4 * self.capacity))
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self) -> Iterator[HistoryRecord]:
+        return (self._record(index) for index in range(self._size))
+
+    def _physical(self, index: int) -> int:
+        return (self._start + index) % self.capacity
+
+    @classmethod
+    def pack_states(cls, *states: ProbeState) -> int:
+        """
+        Packs the four component states into one integer, STATE_BITS per component.
+        """
+        packed = 0
+        for state in states:
+            packed = (packed << cls.STATE_BITS) | cls.STATES.index(state)
+        return packed
+
+    @classmethod
+    def unpack_states(cls, packed: int) -> List[ProbeState]:
+        """
+        Unpacks an integer made by pack_states back into the four component states.
+        """
+        mask = (1 << cls.STATE_BITS) - 1
+        return [cls.STATES[(packed >> (cls.STATE_BITS * shift)) & mask]
+                for shift in reversed(range(len(cls.COMPONENTS)))]
+
+    def append(self, snapshot) -> None:
+        """
+        Adds a record of snapshot (a ProbeSnapshot), overwriting the oldest record if the history is full.
+        """
+        if self._size < self.capacity:
+            index = self._physical(self._size)
+            self._size += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._timestamps[index] = snapshot.timestamp
+        self._ports[index] = snapshot.port
+        self._states[index] = self.pack_states(*(getattr(snapshot, name) for name in self.COMPONENTS))
+        self._latencies[index] = nan if snapshot.latency is None else snapshot.latency
+
+    def _record(self, index: int) -> HistoryRecord:
+        index = self._physical(index)
+        latency = self._latencies[index]
+        return HistoryRecord(self._timestamps[index], self._ports[index],
+                             *self.unpack_states(self._states[index]),
+                             latency=None if isnan(latency) else latency)
+
+    def last(self, n: int, port: int = None) -> List[HistoryRecord]:
+        """
+        Returns the latest n records (of port only, if given), oldest first.
+        """
+        records = []
+        for index in reversed(range(self._size)):
+            if len(records) >= n:
+                break
+            if port is None or self._ports[self._physical(index)] == port:
+                records.append(self._record(index))
+        records.reverse()
+        return records
+
+    def window(self, start: float = None, end: float = None, port: int = None) -> List[HistoryRecord]:
+        """
+        Returns the records with start <= timestamp <= end (of port only, if given), oldest first.
+        start and end default to the oldest and newest records.
+        """
+        timestamps = _TimestampView(self)
+        first = 0 if start is None else bisect_left(timestamps, start)
+        last = self._size if end is None else bisect_right(timestamps, end)
+        return [self._record(index) for index in range(first, last)
+                if port is None or self._ports[self._physical(index)] == port]
+
+    def clear(self) -> None:
+        """
+        Forgets every record, keeping the allocated buffer.
+        """
+        self._start = 0
+        self._size = 0
@@ -0,0 +1,153 @@
+"""
+StatusLogQueue.py
+
+Moves the formatting, colorizing and writing of log records off the probe threads:
+records are put on a queue as they are logged and written out by a background thread,
+so a slow disk or network log share never holds up the next check.
+"""
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+from typing import Callable, List, Optional
+
+
+class StatusMessage:
+    """
+    The message of a status log record: the snapshot it is about and the function that renders it.
+    The status string is only rendered (and colorized) when a handler actually formats the record,
+    so records dropped by a logger or handler level never render at all.
+    """
+    __slots__ = ('render', 'snapshot')
+
+    def __init__(self, render: Callable, snapshot):
+        self.render = render
+        self.snapshot = snapshot
+
+    def __str__(self):
+        return self.render(self.snapshot)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that queues records as they are, instead of formatting them on the logging thread first,
+    and counts the records dropped when the queue is full instead of waiting for room.
+    """
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _StatusQueueListener(QueueListener):
+    """
+    QueueListener that waits for room to queue its stop sentinel, so it can be stopped while the queue is full.
+    """
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+class StatusLogQueue:
+    """
+    Class StatusLogQueue:
+    Routes the records of a logger through a queue to its handlers, which format and write them
+    from a background thread (a logging QueueListener).
+
+    start(logger) replaces the handlers of logger with a handler that only queues records,
+    and hands the original handlers to the listener; each handler still only gets the levels it accepts.
+    Several checkers share one StatusLogQueue (see shared), so it is started once and only stopped,
+    writing out every queued record and giving the logger its handlers back, when the last of them stops it.
+
+    Parameters:
+    - max_size (int): Maximum number of queued records, records logged while it is full are dropped
+        (and counted in dropped) rather than blocking the probe. Defaults to DEFAULT_MAX_SIZE, 0 is unbounded.
+
+    Class Methods:
+    - shared: The process-wide StatusLogQueue, shared by every checker.
+
+    Properties:
+    - is_running: Whether records are currently being queued.
+    - dropped: Number of records dropped because the queue was full.
+
+    Methods:
+    - start: Starts queueing the records of a logger (or counts one more user if already started).
+    - stop: Counts one user less, and once there are none writes out the queue and restores the handlers.
+    """
+    DEFAULT_MAX_SIZE = 10000
+
+    _shared = None
+    _shared_lock = Lock()
+
+    def __init__(self, max_size: int = None):
+        self.max_size = self.DEFAULT_MAX_SIZE if max_size is None else max_size
+        self._queue: queue.Queue = queue.Queue(self.max_size)
+        self._handler = _DeferredQueueHandler(self._queue)
+        self._listener: Optional[QueueListener] = None
+        self._logger: Optional[logging.Logger] = None
+        self._original_handlers: List[logging.Handler] = []
+        self._users = 0
+        self._lock = Lock()
+
+    @classmethod
+    def shared(cls) -> 'StatusLogQueue':
+        """
+        Returns the process-wide StatusLogQueue, creating it on first use.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+        return cls._shared
+
+    @property
+    def is_running(self) -> bool:
+        """
+        True while records are being queued, between the first start() and the stop() of its last user.
+        """
+        return self._listener is not None
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of records dropped, since this queue was created, because the queue was full when they were logged.
+        """
+        return self._handler.dropped
+
+    def start(self, logger: logging.Logger) -> None:
+        """
+        Starts queueing the records of logger and writing them to its current handlers from a background thread.
+        If already started, only counts one more user.
+        """
+        with self._lock:
+            self._users += 1
+            if self._listener is not None:
+                return
+            self._logger = logger
+            self._original_handlers = list(logger.handlers)
+            # swapped in one assignment, so no record is logged while the logger has no handlers.
+            logger.handlers = [self._handler]
+            self._listener = _StatusQueueListener(self._queue, *self._original_handlers, respect_handler_level=True)
+            self._listener.start()
+
+    def stop(self) -> None:
+        """
+        Counts one user less. Once no user is left, waits for every queued record to be written
+        and gives the logger its handlers back.
+        """
+        with self._lock:
+            if self._listener is None:
+                return
+            self._users -= 1
+            if self._users > 0:
+                return
+            self._logger.handlers = self._original_handlers
+            # the listener writes out every record already queued before its thread ends.
+            self._listener.stop()
+            self._listener, self._logger, self._original_handlers = None, None, []
@@ -0,0 +1,171 @@
+"""
+TimedHTTPAdapter.py
+
+requests transport adapter whose connections time each phase of a request:
+name resolution, the TCP connection, the TLS handshake and the time to the first byte of the response.
+Names are resolved through the shared DNSCache instead of the system resolver on every new connection.
+"""
+from time import perf_counter
+from typing import NamedTuple, Optional
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+try:
+    from urllib3.exceptions import NameResolutionError
+except ImportError:
+    # urllib3 1.x reports resolution errors as a NewConnectionError.
+    NameResolutionError = None
+
+try:
+    from WebServerStatusCheckerAJM.DNSCache import DNSCache
+except (ModuleNotFoundError, ImportError):
+    from DNSCache import DNSCache
+
+
+class HTTPTimings(NamedTuple):
+    """
+    Time in seconds spent in each phase of one http request.
+
+    Fields:
+    - dns: Resolving the host name (usually from the DNSCache), 0.0 if a kept-alive connection was re-used.
+    - connect: Opening the TCP connection, 0.0 if a kept-alive connection was re-used.
+    - tls: The TLS handshake, 0.0 if a kept-alive connection was re-used, None for plain http.
+    - ttfb: From the request being sent to the response headers being read (time to first byte).
+    - total: From the start of the request until the response was read and released, None until it is.
+    """
+    dns: float
+    connect: float
+    tls: Optional[float]
+    ttfb: float
+    total: Optional[float] = None
+
+
+class _TimedConnectionMixin:
+    """
+    Records how long resolving, connecting and (for https) the TLS handshake took when a connection is opened,
+    and attaches an HTTPTimings to every response read from the connection as phase_timings.
+    """
+    USES_TLS = False
+
+    _opened_timings = None
+    _open_started_at = None
+    _resolved_at = None
+    _connected_at = None
+    _request_sent_at = None
+
+    def _new_conn(self):
+        self._open_started_at = perf_counter()
+        try:
+            addresses = DNSCache.shared().resolve(self._dns_host)
+        except OSError as e:
+            if NameResolutionError is not None:
+                raise NameResolutionError(self.host, self, e) from e
+            raise NewConnectionError(self, f"Failed to resolve '{self.host}' ({e})") from e
+        self._resolved_at = perf_counter()
+
+        host = self._dns_host
+        try:
+            # connect to the addresses already resolved, in order, so the name is only resolved once.
+            for index, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError):
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+        self._connected_at = perf_counter()
+        return sock
+
+    def connect(self):
+        """
+        Opens the connection (through _new_conn, which times resolving and connecting) and times the TLS handshake
+        that follows it for https, keeping the three timings for the response to the first request sent on it.
+        """
+        super().connect()
+        # everything connect() does after opening the socket is the TLS handshake.
+        self._opened_timings = (self._resolved_at - self._open_started_at, self._connected_at - self._resolved_at,
+                                perf_counter() - self._connected_at if self.USES_TLS else None)
+
+    def request(self, *args, **kwargs):
+        """
+        Sends the request and notes when it was sent, which getresponse measures the time to first byte from.
+        """
+        result = super().request(*args, **kwargs)
+        self._request_sent_at = perf_counter()
+        return result
+
+    def getresponse(self, *args, **kwargs):
+        """
+        Reads the response headers and attaches an HTTPTimings to the response as phase_timings, with the time
+        to first byte since the request was sent and the opening timings of the connection (zero if re-used).
+        """
+        response = super().getresponse(*args, **kwargs)
+        ttfb = perf_counter() - self._request_sent_at
+        # a connection opened for this request carries its opening times, a re-used one took no time to open.
+        dns, connect, tls = self._opened_timings or (0.0, 0.0, 0.0 if self.USES_TLS else None)
+        self._opened_timings = None
+        response.phase_timings = HTTPTimings(dns, connect, tls, ttfb)
+        return response
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    """
+    urllib3 HTTPConnection that times each phase of its requests.
+    """
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    """
+    urllib3 HTTPSConnection that times each phase of its requests, including the TLS handshake.
+    """
+    USES_TLS = True
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    """
+    urllib3 HTTPConnectionPool whose connections are TimedHTTPConnections.
+    """
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    """
+    urllib3 HTTPSConnectionPool whose connections are TimedHTTPSConnections.
+    """
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    Class TimedHTTPAdapter:
+    HTTPAdapter whose connections time each phase of every request (see HTTPTimings).
+    The timings of a response are read with TimedHTTPAdapter.timings(response).
+
+    Static Methods:
+    - timings: The HTTPTimings of a requests.Response, None if it did not come through a timed connection.
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        """
+        Creates the pool manager, with the timed connection pools for both http and https.
+        """
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
+
+    @staticmethod
+    def timings(response) -> Optional[HTTPTimings]:
+        """
+        Returns the HTTPTimings of response (a requests.Response), or None if it was not timed.
+        """
+        raw = getattr(response, 'raw', None)
+        timings = getattr(raw, 'phase_timings', None)
+        if timings is None:
+            # urllib3 1.x wraps the response of the connection instead of returning it.
+            timings = getattr(getattr(raw, '_original_response', None), 'phase_timings', None)
+        return timings
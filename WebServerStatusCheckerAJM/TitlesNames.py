@@ -1,8 +1,6 @@
 from abc import abstractmethod
 from typing import Dict
 
-import requests
-
 
 class TitlesNames:
     """
@@ -20,7 +18,7 @@ class TitlesNames:
             Retrieve the page name associated with the server web page.
 
         html_title:
-            Retrieve the HTML title of the web page.
+            Retrieve the HTML title of the web page, as last read by page_name.
 
         server_titles:
             Retrieve the server titles dictionary.
@@ -31,6 +29,17 @@ class TitlesNames:
         current_server_name:
             Retrieve the current server name based on configuration.
 
+    Other Methods:
+        server_name_for_port(port: int):
+            Retrieve the server name for any port based on configuration.
+
+        parse_html_title(req_content):
+            Extract the text of the <title> tag from HTML content.
+
+        read_response_title(response, digest=None):
+            Incrementally read a response body only until its </title> tag (or title_max_bytes) to find the title,
+            optionally feeding every chunk read into a hashlib digest.
+
     Setter Methods:
         html_title(req_content):
             Set the HTML title based on the given request content.
@@ -39,8 +48,12 @@ class TitlesNames:
             Set the flag to indicate the use of friendly server names.
     """
     LOGGER = None
+    DEFAULT_TITLE_MAX_BYTES = 32 * 1024
+    TITLE_CHUNK_SIZE = 4096
 
-    def __init__(self, server_titles: Dict[int, str] = None, use_friendly_server_names: bool = True):
+    def __init__(self, server_titles: Dict[int, str] = None, use_friendly_server_names: bool = True,
+                 title_max_bytes: int = None):
+        self.title_max_bytes = title_max_bytes or self.DEFAULT_TITLE_MAX_BYTES
         self._html_title = None
         self._server_titles = server_titles
         self._use_friendly_server_names = use_friendly_server_names
@@ -56,15 +69,6 @@ class TitlesNames:
         Returns the server web page.
         """
 
-    @property
-    @abstractmethod
-    def server_status(self):
-        """
-        This method is an abstract property that represents the status of the server.
-        Any class that inherits this method must implement its getter method to return
-        the server status information.
-        """
-
     @property
     @abstractmethod
     def server_full_address(self):
@@ -91,28 +95,31 @@ class TitlesNames:
         Subclasses must implement this property by returning the web address of the server.
         """
 
+    @abstractmethod
+    def timed_server_response(self, address: str, timeout: tuple = None):
+        """
+        This method should request address and return an HTTPResult whose title is the html title of the page,
+        or None if it has none (see ProbeCycle.timed_server_response).
+        """
+
     @property
     def page_name(self):
         """
         This property returns the name of the web page.
         If the 'server_web_page' attribute is empty or not present,
-        it makes a request to the server using the 'server_full_address' attribute to fetch the HTML content.
-         If the request is successful, it sets the 'html_title' attribute to the content,
-         otherwise it does nothing.
-         If a ConnectionError occurs during the request, it sets the 'html_title' attribute to None.
+        it makes a request to the server using the 'server_full_address' attribute through timed_server_response,
+         which reads the body only as far as the html title and then releases the response, so a heavy page is
+          not downloaded just for its title. With conditional_requests on, the cached validators are sent and
+           a 304 Not Modified answer re-uses the cached title without reading any body.
+         If the request is successful and the page has a title, it sets the 'html_title' attribute to it,
+         otherwise it keeps the previous one.
          Finally, it returns the page name based on the 'html_title' attribute or
           defaults to 'Homepage' if 'html_title' is empty.
         """
         if self.server_web_page == '' or not self.server_web_page:
-            if self.server_status:
-                try:
-                    r = requests.get(self.server_full_address)
-                    if r.ok:
-                        self.html_title = r.content
-                    else:
-                        pass
-                except requests.exceptions.ConnectionError:
-                    self.html_title = None
+            title = self.timed_server_response(self.server_full_address).title
+            if title:
+                self._html_title = title
 
             if self.html_title:
                 self._page_name = self.html_title
@@ -136,11 +143,72 @@ class TitlesNames:
         If the provided content contains a <title> tag, it extracts the text
         between the opening and closing tags to set as the HTML title.
         """
+        title = self.parse_html_title(req_content)
+        if title:
+            self._html_title = title
+
+    @staticmethod
+    def parse_html_title(req_content):
+        """
+        Returns the text between the <title> and </title> tags of the provided HTML content,
+        or None if the content has no complete title tag.
+        """
         req_content = str(req_content)
         if '<title>' in req_content:
             x = req_content.rsplit('<title>', maxsplit=1)[-1]
             if '</title>' in x:
-                self._html_title = x.split('</title>')[0]
+                return x.split('</title>')[0]
+        return None
+
+    @staticmethod
+    def find_title_in_chunks(chunks, max_bytes: int, encoding: str = None):
+        """
+        Incrementally scans an iterable of body chunks (bytes) for the html title,
+        and stops reading as soon as the closing </title> tag has been seen or max_bytes have been read.
+        Returns the decoded title, or None if no complete title was found.
+        """
+        buffer = bytearray()
+        title_start = None
+        for chunk in chunks:
+            buffer += chunk
+            lowered = bytes(buffer).lower()
+            if title_start is None:
+                tag_start = lowered.find(b'<title')
+                tag_end = lowered.find(b'>', tag_start) if tag_start != -1 else -1
+                if tag_end != -1:
+                    title_start = tag_end + 1
+            if title_start is not None:
+                title_end = lowered.find(b'</title', title_start)
+                if title_end != -1:
+                    return bytes(buffer[title_start:title_end]).decode(encoding or 'utf-8',
+                                                                       errors='replace').strip()
+            if len(buffer) >= max_bytes:
+                break
+        return None
+
+    @staticmethod
+    def digest_chunks(chunks, digest):
+        """
+        Yields every chunk of chunks unchanged, after feeding it into the hashlib digest object.
+        """
+        for chunk in chunks:
+            digest.update(chunk)
+            yield chunk
+
+    def read_response_title(self, response, digest=None):
+        """
+        Reads the response body only as far as needed to find the html title (at most title_max_bytes)
+        and returns the title, or None if there is none.
+        If a hashlib digest object is given, every chunk that was read is fed into it.
+        """
+        chunks = response.iter_content(self.TITLE_CHUNK_SIZE)
+        if digest is not None:
+            chunks = self.digest_chunks(chunks, digest)
+        try:
+            return self.find_title_in_chunks(chunks, self.title_max_bytes, response.encoding)
+        except Exception as e:
+            self.LOGGER.warning("could not read html title due to - %s", e)
+            return None
 
     @property
     def server_titles(self):
@@ -188,16 +256,26 @@ class TitlesNames:
 
          Returns the current server name.
         """
-        self._current_server_name = False
+        self._current_server_name = self.server_name_for_port(self.active_server_port)
+        return self._current_server_name
+
+    def server_name_for_port(self, port: int):
+        """
+        Gets the server name for the given port.
+        If `use_friendly_server_names` attribute is True,
+        it tries to fetch the friendly server name from `server_titles` for that port.
+         If there are any exceptions or errors, it logs a warning and defaults to `server_web_address`.
+        """
+        server_name = False
         if self.use_friendly_server_names:
             try:
-                self._current_server_name = self.server_titles[self.active_server_port]
+                server_name = self.server_titles[port]
             except TypeError:
                 self.LOGGER.warning("defaulting to non-friendly server_names due to error")
             except KeyError:
                 self.LOGGER.warning("defaulting to non-friendly server_names due to error")
             except Exception:
                 self.LOGGER.warning("defaulting to non-friendly server_names due to error")
-        if not self._current_server_name:
-            self._current_server_name = self.server_web_address
-        return self._current_server_name
+        if not server_name:
+            server_name = self.server_web_address
+        return server_name
@@ -0,0 +1,238 @@
+"""
+UptimeAnalytics.py
+
+Availability, MTTR, MTBF and outage counts over any time window, computed from closed outage intervals
+kept per target and port in a sorted index, instead of from a scan of the logs.
+"""
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from threading import Lock
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class SLAReport(NamedTuple):
+    """
+    Uptime figures of one target and port over one window.
+
+    Fields:
+    - start, end: POSIX timestamps of the window.
+    - availability: Percentage of the window the port was up.
+    - downtime: Seconds of the window the port was down.
+    - outages: Number of outages that overlap the window.
+    - mttr: Mean time to recovery, downtime / outages, None if there were no outages.
+    - mtbf: Mean time between failures, uptime / outages, None if there were no outages.
+    """
+    start: float
+    end: float
+    availability: float
+    downtime: float
+    outages: int
+    mttr: Optional[float]
+    mtbf: Optional[float]
+
+
+class OutageIntervals:
+    """
+    Class OutageIntervals:
+    Sorted, non-overlapping outage intervals of one target and port, with a prefix sum of their durations.
+
+    The starts, ends and cumulative durations are kept in arrays, so the downtime and the number of outages
+    within any window are found with two binary searches and a subtraction, whatever the number of intervals.
+
+    Methods:
+    - add: Adds a closed outage interval.
+    - downtime: Seconds of downtime and number of outages within a window.
+    """
+    __slots__ = ('starts', 'ends', 'cumulative')
+
+    def __init__(self):
+        self.starts = array('d')
+        self.ends = array('d')
+        # cumulative[i] is the total duration of the first i intervals.
+        self.cumulative = array('d', [0.0])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start: float, end: float) -> None:
+        """
+        Adds the outage from start to end. Outages are normally added in time order, which is O(1);
+        an outage that overlaps or precedes the latest one is merged in and the prefix sums are rebuilt.
+        """
+        if end < start:
+            raise ValueError("an outage can not end before it starts")
+        if not self.starts or start > self.ends[-1]:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.cumulative.append(self.cumulative[-1] + end - start)
+            return
+        intervals = list(zip(self.starts, self.ends))
+        insort(intervals, (start, end))
+        merged: List[List[float]] = []
+        for interval_start, interval_end in intervals:
+            if merged and interval_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], interval_end)
+            else:
+                merged.append([interval_start, interval_end])
+        self.starts = array('d', (interval[0] for interval in merged))
+        self.ends = array('d', (interval[1] for interval in merged))
+        self.cumulative = array('d', [0.0])
+        for interval_start, interval_end in merged:
+            self.cumulative.append(self.cumulative[-1] + interval_end - interval_start)
+
+    def downtime(self, start: float, end: float) -> Tuple[float, int]:
+        """
+        Returns the seconds of downtime between start and end, and the number of outages that overlap that window.
+        Outages that run over either edge of the window are clipped to it.
+        """
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end)
+        if first >= last:
+            return 0.0, 0
+        downtime = self.cumulative[last] - self.cumulative[first]
+        downtime -= max(0.0, start - self.starts[first])
+        downtime -= max(0.0, self.ends[last - 1] - end)
+        return downtime, last - first
+
+
+class UptimeAnalytics:
+    """
+    Class UptimeAnalytics:
+    Turns check results into outage intervals per (target, port) and reports uptime figures over any window.
+
+    record() opens an outage on the first down snapshot of a port and closes it on the next up snapshot,
+    record_transition() does the same from the StateTransitions of a PortStateMachine, so the outages follow
+    the port's confirmed state (with its hysteresis and flap detection) rather than every single check.
+    Open outages count as down until the end of the window (or now) in reports, without being stored.
+
+    Methods:
+    - record: Updates the outages of a target's port from a snapshot.
+    - record_transition: Updates the outages of a target's port from a StateTransition.
+    - add_outage: Adds a closed outage directly, e.g. when loading history.
+    - load_transitions: Adds the outages found in SQLiteHistoryStore.transitions rows.
+    - report: SLAReport of one target and port over a window.
+    - fleet_report: SLAReport of every target and port over a window.
+    - periodic_reports: SLAReports of every target and port for each window between consecutive boundaries.
+    - month_boundaries: The timestamps of the start of each month in a range, for monthly reports.
+    """
+    # states (see PortState) that count as an outage, every other state ends one.
+    DOWN_STATES = ('DOWN', 'TIMEOUT', 'DNS_FAILURE')
+
+    def __init__(self):
+        self._intervals: Dict[Tuple[Hashable, int], OutageIntervals] = {}
+        self._open: Dict[Tuple[Hashable, int], float] = {}
+        self._lock = Lock()
+
+    @property
+    def keys(self) -> List[Tuple[Hashable, int]]:
+        """
+        Every (target, port) with a closed or open outage.
+        """
+        with self._lock:
+            return list(dict.fromkeys([*self._intervals, *self._open]))
+
+    def add_outage(self, target: Hashable, port: int, start: float, end: float) -> None:
+        """
+        Adds a closed outage of target's port from start to end.
+        """
+        with self._lock:
+            self._intervals.setdefault((target, port), OutageIntervals()).add(start, end)
+
+    def record(self, target: Hashable, snapshot) -> None:
+        """
+        Opens an outage for target's snapshot.port if snapshot (a ProbeSnapshot) is down and none is open,
+        or closes the open outage if it is up.
+        """
+        key = (target, snapshot.port)
+        with self._lock:
+            if snapshot.is_down:
+                self._open.setdefault(key, snapshot.timestamp)
+                return
+            start = self._open.pop(key, None)
+        if start is not None:
+            self.add_outage(target, snapshot.port, start, snapshot.timestamp)
+
+    def record_transition(self, target: Hashable, transition) -> None:
+        """
+        Opens an outage for target's port (the second item of transition.key) when transition (a StateTransition)
+        goes down and none is open, or closes the open outage when it goes to a state that is not down.
+        """
+        port = transition.key[1]
+        if transition.to_state.is_down:
+            with self._lock:
+                self._open.setdefault((target, port), transition.timestamp)
+            return
+        with self._lock:
+            start = self._open.pop((target, port), None)
+        if start is not None:
+            self.add_outage(target, port, start, transition.timestamp)
+
+    def load_transitions(self, target: Hashable, transitions: Iterable[Tuple[int, float, Optional[str], str]]) -> None:
+        """
+        Adds the outages described by (port, timestamp, from_state, to_state) rows, as returned by
+        SQLiteHistoryStore.transitions, in time order. An outage still open at the last row is left open.
+        Only DOWN, TIMEOUT and DNS_FAILURE open an outage, any other state (UP, DEGRADED, FLAPPING, ...) ends one.
+        """
+        for port, timestamp, _from_state, to_state in transitions:
+            key = (target, port)
+            if to_state in self.DOWN_STATES:
+                with self._lock:
+                    self._open.setdefault(key, timestamp)
+            else:
+                with self._lock:
+                    start = self._open.pop(key, None)
+                if start is not None:
+                    self.add_outage(target, port, start, timestamp)
+
+    def report(self, target: Hashable, port: int, start: float, end: float = None) -> SLAReport:
+        """
+        Returns the SLAReport of target's port between start and end (defaults to now).
+        """
+        if end is None:
+            end = datetime.datetime.now().timestamp()
+        if end <= start:
+            raise ValueError("a report window must end after it starts")
+        key = (target, port)
+        with self._lock:
+            intervals = self._intervals.get(key)
+            downtime, outages = intervals.downtime(start, end) if intervals is not None else (0.0, 0)
+            open_since = self._open.get(key)
+        if open_since is not None and open_since < end:
+            downtime += end - max(open_since, start)
+            outages += 1
+        window = end - start
+        return SLAReport(start, end, availability=100.0 * (window - downtime) / window, downtime=downtime,
+                         outages=outages, mttr=downtime / outages if outages else None,
+                         mtbf=(window - downtime) / outages if outages else None)
+
+    def fleet_report(self, start: float, end: float = None,
+                     keys: Iterable[Tuple[Hashable, int]] = None) -> Dict[Tuple[Hashable, int], SLAReport]:
+        """
+        Returns a dictionary of (target, port) to its SLAReport between start and end, for every key in keys
+        (defaults to every target and port with an outage; the others were up for the whole window).
+        """
+        return {key: self.report(*key, start, end) for key in (self.keys if keys is None else keys)}
+
+    def periodic_reports(self, boundaries: List[float], keys: Iterable[Tuple[Hashable, int]] = None
+                         ) -> Dict[Tuple[Hashable, int], List[SLAReport]]:
+        """
+        Returns a dictionary of (target, port) to its SLAReports for each window between consecutive boundaries,
+        e.g. the twelve months of a year from month_boundaries.
+        """
+        keys = self.keys if keys is None else list(keys)
+        return {key: [self.report(*key, start, end) for start, end in zip(boundaries, boundaries[1:])]
+                for key in keys}
+
+    @staticmethod
+    def month_boundaries(first_month: datetime.date, months: int = 12) -> List[float]:
+        """
+        Returns the local POSIX timestamps of the start of first_month's month and of each of the following
+        months, months + 1 in all, so they bound months windows.
+        """
+        boundaries = []
+        year, month = first_month.year, first_month.month
+        for _ in range(months + 1):
+            boundaries.append(datetime.datetime(year, month, 1).timestamp())
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return boundaries
@@ -0,0 +1,113 @@
+"""
+ValidatorCache.py
+
+Remembers the ETag and Last-Modified validators of each checked page along with its parsed title,
+so later checks can send a conditional GET and, on a 304 Not Modified, re-use the cached title
+instead of downloading and parsing the page again.
+"""
+from collections import OrderedDict
+from threading import Lock
+from time import time
+from typing import Dict, NamedTuple, Optional
+
+
+class CachedPage(NamedTuple):
+    """
+    Validators and parsed results stored for one url.
+
+    Fields:
+    - etag: The ETag header of the last full response, None if it had none.
+    - last_modified: The Last-Modified header of the last full response, None if it had none.
+    - title: The html title parsed from the last full response.
+    - body_digest: Digest of the part of the body that was read from the last full response.
+    - stored_at: POSIX timestamp of when the entry was stored.
+    """
+    etag: Optional[str]
+    last_modified: Optional[str]
+    title: Optional[str]
+    body_digest: Optional[str]
+    stored_at: float
+
+
+class ValidatorCache:
+    """
+    Class ValidatorCache:
+    Thread safe, size bounded (least recently used entries are dropped first) cache of CachedPage per url.
+
+    Class Methods:
+    - shared: The process-wide cache, shared by every checker.
+
+    Methods:
+    - get: Returns the CachedPage for a url, or None.
+    - store: Stores the validators and parsed results of a full response, if it had any validators.
+    - conditional_headers: Returns the If-None-Match / If-Modified-Since headers to send for a url.
+    - clear: Forgets every entry.
+    """
+    DEFAULT_MAX_ENTRIES = 4096
+
+    _shared = None
+    _shared_lock = Lock()
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or self.DEFAULT_MAX_ENTRIES
+        self._entries: 'OrderedDict[str, CachedPage]' = OrderedDict()
+        self._lock = Lock()
+
+    @classmethod
+    def shared(cls) -> 'ValidatorCache':
+        """
+        Returns the process-wide ValidatorCache, creating it on first use.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+        return cls._shared
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Returns the CachedPage stored for url, or None if there is none.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def store(self, url: str, headers, title: Optional[str], body_digest: Optional[str]) -> Optional[CachedPage]:
+        """
+        Stores the ETag and Last-Modified of a full (200) response for url, together with its parsed title and
+        body digest. Responses without either validator can not be revalidated, so any old entry is dropped instead.
+        Returns the stored CachedPage, or None.
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        with self._lock:
+            if not etag and not last_modified:
+                self._entries.pop(url, None)
+                return None
+            entry = CachedPage(etag, last_modified, title, body_digest, time())
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """
+        Returns the conditional request headers for url, an empty dictionary if nothing is cached for it.
+        """
+        entry = self.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def clear(self) -> None:
+        """
+        Forgets every cached entry.
+        """
+        with self._lock:
+            self._entries.clear()
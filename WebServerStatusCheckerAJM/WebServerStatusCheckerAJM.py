@@ -7,32 +7,56 @@ Pings a machine to see if it is up, then checks for the presence of a given http
 """
 from sys import exit as sys_exit
 import datetime
+import logging
+from functools import partial
 
 from time import sleep
-import platform
 import subprocess
 
+from os import name as os_name
 from os.path import isdir
 
-import ctypes
-import winsound
-
 try:
     from WebServerStatusCheckerAJM._version import __version__
+    from WebServerStatusCheckerAJM.LazyLogger import LazyLogger
+    from WebServerStatusCheckerAJM.AlertDispatcher import AlertDispatcher
+    from WebServerStatusCheckerAJM.AlertSinks import Alert, DesktopPopupAlertSink
+    from WebServerStatusCheckerAJM.CheckScheduler import CheckScheduler
+    from WebServerStatusCheckerAJM.StatusHistory import StatusHistory
+    from WebServerStatusCheckerAJM.SQLiteHistoryStore import SQLiteHistoryStore
+    from WebServerStatusCheckerAJM.UptimeAnalytics import UptimeAnalytics
+    from WebServerStatusCheckerAJM.ProbeMetrics import ProbeMetrics
+    from WebServerStatusCheckerAJM.MetricsServer import MetricsServer
+    from WebServerStatusCheckerAJM.StatusLogQueue import StatusLogQueue, StatusMessage
     from WebServerStatusCheckerAJM.ServerAddressPort import ServerAddressPort
     from WebServerStatusCheckerAJM.ComponentStatus import ComponentStatus
     from WebServerStatusCheckerAJM.TitlesNames import TitlesNames
     from WebServerStatusCheckerAJM.DownTimeCalculation import DownTimeCalculation
+    from WebServerStatusCheckerAJM.ProbeCycle import ProbeCycle, ProbeSnapshot
+    from WebServerStatusCheckerAJM.ProbeState import ProbeState
+    from WebServerStatusCheckerAJM.PortStateMachine import PortState
 
 except (ModuleNotFoundError, ImportError):
     from _version import __version__
+    from LazyLogger import LazyLogger
+    from AlertDispatcher import AlertDispatcher
+    from AlertSinks import Alert, DesktopPopupAlertSink
+    from CheckScheduler import CheckScheduler
+    from StatusHistory import StatusHistory
+    from SQLiteHistoryStore import SQLiteHistoryStore
+    from UptimeAnalytics import UptimeAnalytics
+    from ProbeMetrics import ProbeMetrics
+    from MetricsServer import MetricsServer
+    from StatusLogQueue import StatusLogQueue, StatusMessage
     from ServerAddressPort import ServerAddressPort
     from ComponentStatus import ComponentStatus
     from TitlesNames import TitlesNames
     from DownTimeCalculation import DownTimeCalculation
+    from ProbeCycle import ProbeCycle, ProbeSnapshot
+    from ProbeState import ProbeState
+    from PortStateMachine import PortState
 
 from EasyLoggerAJM import EasyLogger
-from ColorizerAJM.ColorizerAJM import Colorizer
 
 
 class WebServerEasyLogger(EasyLogger):
@@ -50,7 +74,7 @@ class WebServerEasyLogger(EasyLogger):
 
 
 class _InitWSSCProperties:
-    LOGGER = EasyLogger.UseLogger().logger
+    LOGGER = LazyLogger()
     INITIALIZATION_STRING = f'Initializing server status checker v{__version__}...'
 
     def __init__(self, silent_run: bool = False, **kwargs):
@@ -115,16 +139,32 @@ class _InitWSSCProperties:
 
 class WebServerStatusCheck(_InitWSSCProperties, ServerAddressPort,
                            ComponentStatus,
-                           TitlesNames, DownTimeCalculation):
+                           TitlesNames, DownTimeCalculation, ProbeCycle):
     """
     This class is responsible for checking the status of a web server.
     It can ping a server to check if it is up and running.
-    The class initializes with server details and settings.
-    It provides methods to display status, log status,
-    and show message boxes if errors occur.
-    The class also contains utility functions to handle
-    server status checks and time calculations.
-    The main loop continuously checks and logs the server status.
+    Each check of a port is collected once into a ProbeSnapshot, which is then used for display, logging,
+    downtime tracking and alerts. The main loop continuously checks and logs the server status.
+    Platform specific and optional pieces (the Windows message box and the colorizer) are only imported
+    when they are used, so importing this module has no side effects and works on any platform.
+
+    Features (see the class named for details), each configured through kwargs:
+    - history: the latest history_size snapshots as compact records (StatusHistory), and every snapshot
+        written to SQLite under target_name if a history_db or history_store is given (SQLiteHistoryStore).
+    - state_machine: the state of every port with hysteresis and flap detection
+        (fail_threshold, recover_threshold, flap_history, flap_threshold; see PortStateMachine).
+    - uptime_analytics: outages, availability, MTTR and MTBF per port (UptimeAnalytics).
+    - metrics: Prometheus metrics, served by MainLoop if a metrics_port (and metrics_host) is given (ProbeMetrics).
+    - latency_percentiles and degraded_thresholds: phase by phase http timings and the DEGRADED state.
+    - probe_dependencies: the order components are probed in, UNREACHABLE when upstream is down
+        (ProbeDependencyGraph).
+    - http_*, conditional_requests, page_check_mode and cycle_deadline: the pooled, timed http requests
+        and the time budget of one check (ProbeCycle).
+    - ping_method, ping_timeout and ping_refused_is_up: how machines are pinged (ReachabilityProbe).
+    - check_interval and scheduler: when each port is due for its next check (CheckScheduler).
+    - local_uplink_*: the shared local machine status (LocalUplinkCache), and DNS_FAILURE from DNSCache.
+    - async_logging: status records formatted and written by a background thread (StatusLogQueue).
+    - alert_*: alerts delivered to their sinks from background threads (AlertDispatcher).
     """
     WINAPI_MSG_BOX_STYLES = {
         'OK': 0,
@@ -137,6 +177,9 @@ class WebServerStatusCheck(_InitWSSCProperties, ServerAddressPort,
         'Above_All_OK': 0x1000,
         'Error_Above_All_OK': 0x00000010}
 
+    # TitlesNames comes before ProbeCycle in the MRO, so its abstract declaration would otherwise win.
+    timed_server_response = ProbeCycle.timed_server_response
+
     def __init__(self, server_web_address: str, silent_run: bool = False,
                  use_msg_box_on_error: bool = True, **kwargs):
         super().__init__(silent_run=silent_run, init_msg=kwargs.get('init_msg', True))
@@ -147,73 +190,214 @@ class WebServerStatusCheck(_InitWSSCProperties, ServerAddressPort,
                                    server_web_page=kwargs.get('server_web_page', None),
                                    server_ports=kwargs.get('server_ports', None))
 
-        ComponentStatus.__init__(self)
+        ComponentStatus.__init__(self, http_pool_size=kwargs.get('http_pool_size', None),
+                                 http_keep_alive=kwargs.get('http_keep_alive', None),
+                                 http_connect_timeout=kwargs.get('http_connect_timeout', None),
+                                 http_read_timeout=kwargs.get('http_read_timeout', None),
+                                 page_check_mode=kwargs.get('page_check_mode', 'stream'),
+                                 conditional_requests=kwargs.get('conditional_requests', True),
+                                 ping_timeout=kwargs.get('ping_timeout', None),
+                                 ping_method=kwargs.get('ping_method', 'auto'),
+                                 local_uplink_hosts=kwargs.get('local_uplink_hosts', None),
+                                 local_uplink_ttl=kwargs.get('local_uplink_ttl', None),
+                                 local_uplink_quorum=kwargs.get('local_uplink_quorum', 1),
+                                 ping_refused_is_up=kwargs.get('ping_refused_is_up', True))
 
         TitlesNames.__init__(self, server_titles=kwargs.get('server_titles', None),
-                             use_friendly_server_names=kwargs.get('use_friendly_server_names', True))
-        DownTimeCalculation.__init__(self)
+                             use_friendly_server_names=kwargs.get('use_friendly_server_names', True),
+                             title_max_bytes=kwargs.get('title_max_bytes', None))
+        DownTimeCalculation.__init__(self, state_machine=kwargs.get('state_machine', None),
+                                     fail_threshold=kwargs.get('fail_threshold', None),
+                                     recover_threshold=kwargs.get('recover_threshold', None),
+                                     flap_history=kwargs.get('flap_history', None),
+                                     flap_threshold=kwargs.get('flap_threshold', None))
+        ProbeCycle.__init__(self, cycle_deadline=kwargs.get('cycle_deadline', None),
+                            degraded_thresholds=kwargs.get('degraded_thresholds', None),
+                            probe_dependencies=kwargs.get('probe_dependencies', None))
 
         if self.use_colorizer:
+            from ColorizerAJM.ColorizerAJM import Colorizer
             self.colorizer = Colorizer()
         else:
             self.colorizer = None
 
-        self.use_msg_box_on_error = use_msg_box_on_error
+        self._message_box = None
+        # message boxes are silently turned off where the platform can not show them (e.g. headless linux nodes).
+        self.use_msg_box_on_error = use_msg_box_on_error and self.message_box is not None
+        self._alerted_down_ports = set()
+        self.check_interval = kwargs.get('check_interval', None)
+        # compared to None, an empty CheckScheduler is falsy.
+        self.scheduler = kwargs.get('scheduler', None)
+        if self.scheduler is None:
+            self.scheduler = CheckScheduler()
+        self.history = StatusHistory(kwargs.get('history_size', None))
+        self.target_name = kwargs.get('target_name', None) or self.server_web_address
+        self.history_store = kwargs.get('history_store', None)
+        if self.history_store is None and kwargs.get('history_db', None):
+            self.history_store = SQLiteHistoryStore(kwargs['history_db'])
+        self.uptime_analytics = kwargs.get('uptime_analytics', None) or UptimeAnalytics()
+        self.metrics = kwargs.get('metrics', None)
+        if self.metrics is None:
+            self.metrics = ProbeMetrics()
+        self.metrics_server = None
+        if kwargs.get('metrics_port', None) is not None:
+            self.metrics_server = MetricsServer(self.metrics, port=kwargs['metrics_port'],
+                                                host=kwargs.get('metrics_host', None))
+        self.log_queue = None
+        if kwargs.get('async_logging', True):
+            self.log_queue = kwargs.get('log_queue', None) or StatusLogQueue.shared()
+        self.alert_dispatcher = kwargs.get('alert_dispatcher', None)
+        if self.alert_dispatcher is None:
+            popup_sinks = []
+            if self.use_msg_box_on_error:
+                popup_sinks.append(DesktopPopupAlertSink(
+                    partial(self.show_message_box, style=self.WINAPI_MSG_BOX_STYLES['Error_Above_All_OK'])))
+            self.alert_dispatcher = AlertDispatcher.from_kwargs(popup_sinks, **kwargs)
         self._full_status_string = None
-        self._is_down = False
 
     @property
     def full_status_string(self):
         """
         This method returns a formatted system status string containing current date and time, active server port,
-        machine status, server name, server status, page name, and page status. If the server is down,
-        it also handles displaying an error message using the specified styles.
-        It ensures that down_timestamp is set when the page goes down.
-        """
-        # this was made a variable purely to make the full_status_string declaration more readable.
-        cur_datetime = datetime.datetime.now().ctime()
-        self._full_status_string = (f"\t{cur_datetime}: System Status on port {self.active_server_port} is:"
-                                    f"\n\t\tLocal machine is: {self.get_status_string(self.local_machine_status)}"
-                                    f"\n\t\tMachine is: {self.get_status_string(self.machine_status)}"
-                                    f"\n\t\tServer: \'{self.current_server_name}\' on "
-                                    f"\n\t\tPort: {self.active_server_port} is "
-                                    f"{self.get_status_string(self.server_status)}. "
-                                    f"\n\t\tPage: \'{self.server_web_page or self.page_name}\' is "
-                                    f"{self.get_status_string(self.page_status)}")
-        if self.is_down:
-            if self.use_msg_box_on_error:
-                try:
-                    self.show_message_box("PART OR ALL OF SERVER DOWN",
-                                          self._full_status_string.replace('\t', ''),
-                                          self.WINAPI_MSG_BOX_STYLES['Error_Above_All_OK'])
+        machine status, server name, server status, page name, and page status.
+        The string is rendered from the latest snapshot of the active server port,
+         so reading it does not run any network checks once that port has been checked.
+        """
+        self._full_status_string = self.render_status_string(self.snapshot)
+        return self._full_status_string
 
-                except Exception as e:
-                    self.LOGGER.warning("could not show msgbox due to - %s", e)
-                    print(f"could not show msgbox due to - {e}")
+    def render_status_string(self, snapshot: ProbeSnapshot, colorize: bool = True) -> str:
+        """
+        Formats the given snapshot into a status string.
+        If use_colorizer is True and colorize is True, the string is colored red if the snapshot is down,
+         yellow if it is degraded and green otherwise.
+        """
+        # this was made a variable purely to make the status string declaration more readable.
+        cur_datetime = datetime.datetime.fromtimestamp(snapshot.timestamp).ctime()
+        status_string = (f"\t{cur_datetime}: System Status on port {snapshot.port} is:"
+                         f"\n\t\tLocal machine is: {self.get_status_string(snapshot.local_machine_status)}"
+                         f"\n\t\tMachine is: {self.get_status_string(snapshot.machine_status)}"
+                         f"\n\t\tServer: \'{self.server_name_for_port(snapshot.port)}\' on "
+                         f"\n\t\tPort: {snapshot.port} is "
+                         f"{self.get_status_string(snapshot.server_status)}. "
+                         f"\n\t\tPage: \'{snapshot.page_name}\' is "
+                         f"{self.get_status_string(snapshot.page_status)}")
+        if self.use_colorizer and colorize:
+            if snapshot.is_down:
+                status_string = self.colorizer.colorize(status_string, self.colorizer.RED)
+            elif snapshot.is_degraded:
+                status_string = self.colorizer.colorize(status_string, self.colorizer.YELLOW)
+            else:
+                status_string = self.colorizer.colorize(status_string, self.colorizer.GREEN)
+        return status_string
 
-            # this is here purely to make sure down_timestamp is set when the page goes down.
-            x = self.down_timestamp
-            del x
+    def latency_percentiles(self, port: int = None, quantiles=None) -> dict:
+        """
+        Returns a dictionary of component ('local', 'machine', 'server', 'page') or http phase
+         ('dns', 'connect', 'tls', 'ttfb') to a dictionary of quantile to latency in seconds,
+          for the given port (defaults to the active server port) and quantiles (defaults to p50, p95 and p99).
+        """
+        if port is None:
+            port = self.active_server_port
+        return self.metrics.percentiles(self.target_name, port, quantiles)
 
-        if self.use_colorizer:
-            if self.is_down:
-                self._full_status_string = self.colorizer.colorize(self._full_status_string, Colorizer.RED)
+    def build_alert(self, snapshot: ProbeSnapshot) -> Alert:
+        """
+        Builds the Alert for a snapshot: CRITICAL if the server (or anything before it) is not up,
+         WARNING if only the page is down, and INFO for a port that is back up.
+        """
+        if not snapshot.is_down:
+            level, title, state = logging.INFO, "SERVER BACK UP", ProbeState.UP.value
+        else:
+            level = logging.WARNING if snapshot.server_status else logging.CRITICAL
+            if snapshot.dns_failed:
+                state = ProbeState.DNS_FAILURE.value
             else:
-                self._full_status_string = self.colorizer.colorize(self._full_status_string, Colorizer.GREEN)
-        return self._full_status_string
+                state = (ProbeState.TIMEOUT if snapshot.timed_out else ProbeState.DOWN).value
+            title = "PART OR ALL OF SERVER DOWN"
+        return Alert(key=f"{self.server_name_for_port(snapshot.port)}:{snapshot.port}", state=state,
+                     level=level, title=title,
+                     text=self.render_status_string(snapshot, colorize=False).replace('\t', ''),
+                     timestamp=snapshot.timestamp)
+
+    def on_snapshot(self, snapshot: ProbeSnapshot) -> None:
+        """
+        Called once for every new snapshot.
+        Feeds the snapshot to the state_machine (which tracks down_timestamp and emits a StateTransition when
+         the port changes state) and records the snapshot as it is in history and the history_store checks.
+          The history_store transitions, the uptime_analytics outages and the metrics downtime follow the port's
+           state instead, as does the alert handed to the alert_dispatcher while the port is down, or once it is
+            back up after an alert was raised for it: the port's state (with its hysteresis) decides, not the
+             snapshot alone, and no alert is raised while the port is FLAPPING.
+              Dispatching never waits for the alert to be delivered.
+        """
+        key = (self.target_name, snapshot.port)
+        transition = self.state_machine.feed(key, snapshot)
+        state = self.state_machine.state(key)
+        # every check is kept as it is, but outages and downtime follow the port's confirmed state.
+        self.history.append(snapshot)
+        if self.history_store is not None:
+            self.history_store.record(self.target_name, snapshot, state=state.value)
+        if transition is not None:
+            self.uptime_analytics.record_transition(self.target_name, transition)
+        self.metrics.record(self.target_name, snapshot, is_down=state.is_down)
+
+        if state is PortState.FLAPPING:
+            if transition is not None:
+                self.LOGGER.warning("%s:%s is flapping (%d changes in its latest %d checks), alerts are suppressed",
+                                    self.server_name_for_port(snapshot.port), snapshot.port,
+                                    self.state_machine.flap_changes(key), self.state_machine.flap_history)
+            return
+        # while a port waits out its recover_threshold (or fail_threshold), the snapshot and the state disagree.
+        if state.is_down and snapshot.is_down:
+            self._alerted_down_ports.add(snapshot.port)
+        elif state.is_settled and not state.is_down and snapshot.port in self._alerted_down_ports:
+            self._alerted_down_ports.discard(snapshot.port)
+        else:
+            return
+        self.alert_dispatcher.dispatch(self.build_alert(snapshot))
+
+    @property
+    def state_key(self) -> tuple:
+        """
+        The key of the active server port in state_machine: (target_name, active_server_port).
+        """
+        return self.target_name, self.active_server_port
+
+    def state_for_port(self, port: int) -> PortState:
+        """
+        The PortState of port in state_machine, UNKNOWN if it has not been checked yet.
+        """
+        return self.state_machine.state((self.target_name, port))
+
+    def record_scheduled_result(self, port: int) -> None:
+        """
+        Reports the confirmed state of port, after its latest check, back to the scheduler.
+        """
+        state = self.state_for_port(port)
+        self.scheduler.record_result(port, state.is_down, flapping=state is PortState.FLAPPING)
 
     @property
     def is_down(self):
         """
-        This is a property method that checks the status of multiple components (local_machine_status, machine_status,
-        server_status, page_status) to determine if the overall status is down.
-        It returns a boolean value indicating whether the components are in a down state.
+        Whether the active server port is down (DOWN, TIMEOUT or DNS_FAILURE), according to its latest check.
+        It is read from the state_machine, so it never runs a check: a port that was not checked yet is not down.
         """
-        if not self.local_machine_status or not self.machine_status or not self.server_status or not self.page_status:
-            self._is_down = True
-        else:
-            self._is_down = False
-        return self._is_down
+        return self.port_state.is_down
+
+    @property
+    def message_box(self):
+        """
+        The optional WindowsMessageBox plugin, imported the first time it is needed.
+        None if the current platform can not show message boxes.
+        """
+        if self._message_box is None:
+            try:
+                from WebServerStatusCheckerAJM.WindowsMessageBox import WindowsMessageBox
+            except (ModuleNotFoundError, ImportError):
+                from WindowsMessageBox import WindowsMessageBox
+            self._message_box = WindowsMessageBox() if WindowsMessageBox.is_supported() else False
+        return self._message_box or None
 
     def show_message_box(self, title: str, text: str, style: int):
         """
@@ -222,7 +406,14 @@ class WebServerStatusCheck(_InitWSSCProperties, ServerAddressPort,
          If the style is still invalid, a warning message is logged and the default Windows message box is displayed.
          Finally, an error sound is played using MessageBeep if the 'MB_ICONHAND' style is encountered.
          The function returns the result of the MessageBoxW call from the user32 library.
+        Raises an OSError if the platform can not show message boxes (see the message_box property).
         """
+        if self.message_box is None:
+            try:
+                raise OSError("message boxes are only supported on Windows")
+            except OSError as e:
+                self.LOGGER.error(e, exc_info=True)
+                raise e
         if style not in self.WINAPI_MSG_BOX_STYLES.values():
             try:
                 style = self.WINAPI_MSG_BOX_STYLES['Error_Above_All_OK']
@@ -239,79 +430,101 @@ class WebServerStatusCheck(_InitWSSCProperties, ServerAddressPort,
                       " Windows default message box will be displayed.")
                 self.LOGGER.warning(e)
         try:
-            winsound.MessageBeep(winsound.MB_ICONHAND)
+            self.message_box.beep()
         except Exception as e:
             self.LOGGER.error(e, exc_info=True)
-        # 0 == no parent window
-        return ctypes.windll.user32.MessageBoxW(0, text, title, style)
+        return self.message_box.show(title, text, style)
 
-    def log_status(self) -> None:
+    def log_status(self, snapshot: ProbeSnapshot = None) -> None:
         """
-        Logs the status based on the server status and page status. If the server status is true and
-        the page status is true, it logs the full status string at info level. If the server status is true but
-        the page status is false, it logs the full status string at warning level. If the server status is false,
-        it logs the full status string at critical level.
+        Logs the status based on the server status and page status of the given snapshot
+        (defaults to the latest snapshot of the active port). If the server status is true and
+        the page status is true, it logs the status string at info level. If the server status is true but
+        the page status is false, it logs the status string at warning level. If the server status is false,
+        it logs the status string at critical level.
+        The record carries the snapshot and target_name, and its status string is only rendered when a handler
+         writes it, so nothing is formatted for a level that is filtered out.
         """
-        if self.server_status:
-            if self.page_status:
-                self.LOGGER.info(self.full_status_string)
-            else:
-                self.LOGGER.warning(self.full_status_string)
+        if snapshot is None:
+            snapshot = self.snapshot
+        if snapshot.server_status:
+            level = logging.INFO if snapshot.page_status else logging.WARNING
         else:
-            self.LOGGER.critical(self.full_status_string)
+            level = logging.CRITICAL
+        if self.LOGGER.isEnabledFor(level):
+            self.LOGGER.log(level, StatusMessage(self.render_status_string, snapshot),
+                            extra={'snapshot': snapshot, 'target_name': self.target_name})
 
     @staticmethod
-    def get_status_string(status_bool: bool) -> str:
+    def get_status_string(status_bool: bool or ProbeState) -> str:
         """
-        Converts a boolean status into a string representation.
-        Returns "UP" if the status is True, and "DOWN" if the status is False.
+        Converts a boolean status or a ProbeState into a string representation.
+        Returns the name of a ProbeState (e.g. "TIMEOUT"), otherwise
+         returns "UP" if the status is True, and "DOWN" if the status is False.
         """
+        if isinstance(status_bool, ProbeState):
+            return status_bool.value
         if status_bool:
             return "UP"
         return "DOWN"
 
     def ping(self, **kwargs) -> bool:
         """
-        Ping the specified host to check for connectivity.
+        Ping the specified host (defaults to the server host) to check for connectivity.
         Returns True if the ping was successful, otherwise returns False.
         """
+        return isinstance(self.ping_rtt(**kwargs), float)
 
+    def ping_rtt(self, **kwargs) -> float or None:
+        """
+        Ping the specified host (defaults to the server host) in-process, using ICMP where the
+         platform allows unprivileged ICMP sockets and a TCP connection otherwise (see ReachabilityProbe).
+        The host name is resolved through the dns_cache.
+        Returns the round trip time in seconds, None if the host is unreachable,
+         or ProbeState.DNS_FAILURE if its name could not be resolved.
+        """
         host = kwargs.get('host', None)
-        # Option for the number of packets as a function of
-        param = '-n' if platform.system().lower() == 'windows' else '-c'
-
-        # Building the command. Ex: "ping -c 1 google.com"
         if not host:
-            command = ['ping', param, '1', self.server_web_address.split('/')[2]]
-        else:
-            command = ['ping', param, '1', host]
-
-        # this pings the target while also hiding the output
-        ping_result = subprocess.call(command, stdout=subprocess.DEVNULL) == 0
-        return ping_result
+            host = self.server_host
+        try:
+            address = self.dns_cache.resolve_ipv4(host)
+        except OSError:
+            return ProbeState.DNS_FAILURE
+        return self.reachability.rtt(address)
 
     def MainLoop(self, sleep_time: int = 120):
         """
         MainLoop method runs an infinite loop that periodically checks the status of server ports.
-        It first sets up necessary variables and prints messages if required. It then iterates through all server ports,
-         updating the active server port and printing the full status string. The method logs the status after each
-         iteration and sleeps for the specified time interval. If a KeyboardInterrupt is caught,
+        It first sets up necessary variables and prints messages if required. Every server port is then scheduled
+         on the scheduler, every check_interval (defaults to sleep_time) seconds on a fixed cadence, so the time the
+          checks take does not delay the next ones. Whenever ports are due, it updates the active server port,
+           takes one snapshot of it, prints and logs the status string for that snapshot and reports the result
+            back to the scheduler, which checks down ports more often. If a KeyboardInterrupt is caught,
          it prints a termination message and exits. Any other exceptions are logged as errors and re-raised.
         """
         sleep(1)
         try:
+            self.local_uplink.start()
+            if self.metrics_server is not None:
+                self.metrics_server.start()
+            if self.log_queue is not None:
+                self.log_queue.start(self.LOGGER)
+            for x in self.server_ports:
+                self.scheduler.add(x, self.check_interval or sleep_time)
             while True:
-                subprocess.call(['cls'], shell=True)
+                self.scheduler.sleep_until_next()
+                subprocess.call(['cls' if os_name == 'nt' else 'clear'], shell=True)
                 if self.just_started:
                     self.just_started = False
                     if not self.silent_run:
                         print("Checking for initial server availability.\n")
-                for x in self.server_ports:
+                for x in self.scheduler.due():
                     self.active_server_port = x
+                    snapshot = self.take_snapshot()
                     if not self.silent_run and self.print_status:
-                        print(self.full_status_string)
-                    self.log_status()
-                sleep(sleep_time)
+                        print(self.render_status_string(snapshot))
+                    self.log_status(snapshot)
+                    self.record_scheduled_result(x)
         except KeyboardInterrupt:
             print("CTRL-C detected, quitting...")
             sleep(1)
@@ -319,6 +532,15 @@ class WebServerStatusCheck(_InitWSSCProperties, ServerAddressPort,
         except Exception as e:
             self.LOGGER.error(e, exc_info=True)
             raise e
+        finally:
+            self.local_uplink.stop()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+            if self.log_queue is not None:
+                self.log_queue.stop()
+            self.alert_dispatcher.close()
+            if self.history_store is not None:
+                self.history_store.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,42 @@
+"""
+WindowsMessageBox.py
+
+Optional Windows desktop alert plugin. ctypes and winsound are only imported when a message box
+is actually shown, so this module can be imported (and the rest of the package used) on any platform.
+"""
+import sys
+
+
+class WindowsMessageBox:
+    """
+    Class WindowsMessageBox:
+    Shows a native Windows message box and plays the error sound.
+
+    Methods:
+    - is_supported: Returns True if the current platform can show Windows message boxes.
+    - beep: Plays the Windows error sound.
+    - show: Shows a message box and returns the MessageBoxW result.
+    """
+    @staticmethod
+    def is_supported() -> bool:
+        """
+        Returns True if running on Windows, the only platform with message box support.
+        """
+        return sys.platform == 'win32'
+
+    @staticmethod
+    def beep() -> None:
+        """
+        Plays the Windows error (MB_ICONHAND) sound.
+        """
+        import winsound
+        winsound.MessageBeep(winsound.MB_ICONHAND)
+
+    @staticmethod
+    def show(title: str, text: str, style: int) -> int:
+        """
+        Shows a message box with no parent window and returns the result of the MessageBoxW call.
+        """
+        import ctypes
+        # 0 == no parent window
+        return ctypes.windll.user32.MessageBoxW(0, text, title, style)
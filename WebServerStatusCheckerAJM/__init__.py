@@ -1,2 +1,51 @@
+"""
+WebServerStatusCheckerAJM
+
+Checks whether web servers, their machines and pages are up. Importing the package only loads the core
+WebServerStatusCheck; the fleet and asyncio checkers (and asyncio, multiprocessing, ... with them)
+are only imported the first time they are used.
+"""
+import sys
+from importlib import import_module
+from types import ModuleType
+
 from WebServerStatusCheckerAJM import _version
 from WebServerStatusCheckerAJM.WebServerStatusCheckerAJM import WebServerStatusCheck
+
+# exported name -> module it is loaded from on first use.
+_LAZY_EXPORTS = {
+    'AsyncWebServerStatusCheck': 'WebServerStatusCheckerAJM.AsyncWebServerStatusCheck',
+    'FleetMonitor': 'WebServerStatusCheckerAJM.FleetMonitor',
+    'ShardedFleetMonitor': 'WebServerStatusCheckerAJM.ShardedFleetMonitor',
+}
+
+__all__ = ['WebServerStatusCheck', *_LAZY_EXPORTS]
+
+
+def __getattr__(name: str):
+    """
+    Imports the lazily exported name from its module the first time it is used, and keeps it in the package.
+    """
+    if name not in _LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_LAZY_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *_LAZY_EXPORTS})
+
+
+class _Package(ModuleType):
+    """
+    The package module. Importing a submodule binds it on its package under its own name, which for the
+    lazy exports is also the name of their class, so those bindings are skipped and __getattr__ returns the class.
+    """
+    def __setattr__(self, name, value):
+        if name in _LAZY_EXPORTS and isinstance(value, ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package